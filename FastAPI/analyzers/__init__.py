@@ -0,0 +1 @@
+# Language analyzer package initialization
\ No newline at end of file
@@ -0,0 +1,63 @@
+from abc import ABC, abstractmethod
+from typing import Any, Callable, List, Optional, Tuple
+from services.completion_index import Vocabulary
+
+# (kind, text) where kind is name, number, op, string, open_string or comment.
+# An open_string is a quote that isn't closed on the line.
+Token = Tuple[str, str]
+
+
+class Analyzer(ABC):
+    """Tokenizer and context rules for one language.
+
+    Tokenizing is line by line and restartable: `tokenize` takes the state
+    the line starts in (such as being inside a multi-line string) and
+    returns the state the next line starts in. The document index stores
+    these states per line, so classifying a cursor only tokenizes its own
+    line plus whatever an edit invalidated.
+    """
+
+    name = "generic"
+
+    # State at the start of a document
+    initial_state: Any = None
+
+    # Keywords after which the word being typed names something new
+    declaration_keywords: Tuple[str, ...] = ()
+
+    # Text that can carry a state other than the initial one onto the next line
+    multiline_markers: Tuple[str, ...] = ()
+
+    def __init__(self, vocabulary: Vocabulary):
+        self.vocabulary = vocabulary
+
+    @abstractmethod
+    def tokenize(self, line: str, state: Any) -> Tuple[List[Token], Any]:
+        """Tokens of `line` starting in `state`, and the state the next line starts in."""
+
+    def end_state(self, line: str, state: Any) -> Any:
+        return self.tokenize(line, state)[1]
+
+    @abstractmethod
+    def suggest(self, tokens: List[Token], in_function_or_class: Callable[[], bool]) -> List[str]:
+        """Context suggestions for a cursor after `tokens` on its line."""
+
+    def in_literal(self, tokens: List[Token], state: Any) -> bool:
+        """Whether the cursor is inside a string or comment."""
+        return state != self.initial_state or bool(tokens) and tokens[-1][0] in ("open_string", "comment")
+
+    def word_prefix(self, tokens: List[Token], line: str) -> Optional[str]:
+        """The identifier being typed at the cursor, unless it is naming something new."""
+        if not tokens or tokens[-1][0] != "name" or not line.endswith(tokens[-1][1]):
+            return None
+        if len(tokens) > 1 and tokens[-2][0] == "name" and tokens[-2][1] in self.declaration_keywords:
+            return None
+        return tokens[-1][1]
+
+
+def significant(tokens: List[Token]) -> List[Token]:
+    return [token for token in tokens if token[0] != "comment"]
+
+
+def texts(tokens: List[Token]) -> List[str]:
+    return [text for _, text in tokens]
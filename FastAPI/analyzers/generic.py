@@ -0,0 +1,25 @@
+from typing import Callable, List
+from analyzers.base import Token, significant, texts
+from analyzers.javascript import JavaScriptAnalyzer
+from services.completion_index import Vocabulary
+
+
+class GenericAnalyzer(JavaScriptAnalyzer):
+    """Fallback for other languages, using C-style comments and strings."""
+
+    name = "generic"
+    declaration_keywords = ()
+
+    def __init__(self):
+        super().__init__(Vocabulary(["if", "for", "while", "function", "return"]))
+
+    def suggest(self, tokens: List[Token], in_function_or_class: Callable[[], bool]) -> List[str]:
+        tokens = significant(tokens)
+        words = texts(tokens)
+
+        # Basic programming constructs
+        if words[-1:] == ["."]:
+            return ["length", "size", "count"]
+        if words[:1] in (["if"], ["for"]) and "(" not in words:
+            return ["("]
+        return ["if", "for", "while", "function", "return"]
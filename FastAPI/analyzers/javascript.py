@@ -0,0 +1,134 @@
+import re
+from typing import Callable, List, Optional, Tuple
+from analyzers.base import Analyzer, Token, significant, texts
+from services.completion_index import Vocabulary
+
+_SPACE = re.compile(r"\s*")
+_TOKEN = re.compile(
+    r"(?P<comment>//.*)"
+    r"|(?P<block>/\*)"
+    r"|(?P<quote>['\"`])"
+    r"|(?P<name>[A-Za-z_$][\w$]*)"
+    r"|(?P<number>\d[\w.]*)"
+    r"|(?P<op>===|!==|=>|==|!=|<=|>=|&&|\|\||\?\?|\?\.|\+\+|--|\.\.\.|[-+*/%&|^]=|.)"
+)
+_CLOSE = {
+    "'": re.compile(r"(?:[^'\\]|\\.)*'"),
+    '"': re.compile(r'(?:[^"\\]|\\.)*"'),
+    "`": re.compile(r"(?:[^`\\]|\\.)*`"),
+}
+
+CONTROL_KEYWORDS = ("if", "for", "while", "switch")
+
+
+class JavaScriptAnalyzer(Analyzer):
+    """JavaScript/TypeScript context rules over a tokenizer that tracks block comments
+    and template literals across lines."""
+
+    name = "javascript"
+    declaration_keywords = ("function", "class", "const", "let", "var", "interface", "type", "enum")
+    multiline_markers = ("/*", "`")
+
+    def __init__(self, vocabulary: Optional[Vocabulary] = None):
+        self.js_keywords = [
+            "const", "let", "function", "return", "async", "await", "if", "else", "for",
+            "while", "switch", "case", "break", "continue", "try", "catch", "finally",
+            "class", "extends", "new", "import", "export", "default", "typeof", "instanceof"
+        ]
+
+        self.array_methods = ["map()", "filter()", "reduce()", "forEach()", "find()", "includes()"]
+
+        self.console_methods = ["log()", "error()", "warn()", "info()"]
+
+        self.common_modules = ["react", "lodash", "axios", "express", "fs"]
+
+        super().__init__(vocabulary or Vocabulary(
+            self.js_keywords + ["console.log()"] + self.array_methods
+            + ["push()", "slice()", "splice()", "join()", "split()", "then()"]
+        ))
+
+    def tokenize(self, line: str, state: Optional[str]) -> Tuple[List[Token], Optional[str]]:
+        tokens: List[Token] = []
+        position = 0
+        if state == "*/":
+            end = line.find("*/")
+            if end < 0:
+                return [("comment", line)], state
+            tokens.append(("comment", line[:end + 2]))
+            position = end + 2
+        elif state == "`":
+            closed = _CLOSE["`"].match(line)
+            if closed is None:
+                return [("open_string", line)], state
+            tokens.append(("string", line[:closed.end()]))
+            position = closed.end()
+
+        while True:
+            position = _SPACE.match(line, position).end()
+            if position >= len(line):
+                return tokens, None
+            match = _TOKEN.match(line, position)
+            kind = match.lastgroup
+            if kind == "block":
+                end = line.find("*/", match.end())
+                if end < 0:
+                    tokens.append(("comment", line[position:]))
+                    return tokens, "*/"
+                tokens.append(("comment", line[position:end + 2]))
+                position = end + 2
+            elif kind == "quote":
+                quote = match.group()
+                closed = _CLOSE[quote].match(line, match.end())
+                if closed is None:
+                    tokens.append(("open_string", line[position:]))
+                    # Only template literals span lines
+                    return tokens, quote if quote == "`" else None
+                tokens.append(("string", line[position:closed.end()]))
+                position = closed.end()
+            else:
+                tokens.append((kind, match.group()))
+                position = match.end()
+
+    def suggest(self, tokens: List[Token], in_function_or_class: Callable[[], bool]) -> List[str]:
+        tokens = significant(tokens)
+        words = texts(tokens)
+        first = words[0] if words else ""
+        if first in ("export", "async") and len(words) > 1:
+            first = words[1]
+
+        # Function definition completion
+        if "function" in words and "(" in words and "{" not in words:
+            return [") {"] if words.count("(") > words.count(")") else [" {"]
+
+        # Arrow function completion
+        if "=" in words and "=>" not in words and words[-1:] == [")"]:
+            return [" => {"]
+
+        # Control structure completion
+        if first in CONTROL_KEYWORDS and "{" not in words:
+            return [" {"]
+
+        # Method chaining
+        if words[-1:] in (["."], ["?."]):
+            if words[-2:-1] == ["console"]:
+                return list(self.console_methods)
+            return list(self.array_methods)
+
+        # Import/require statements
+        if first == "import" or "require" in words:
+            return list(self.common_modules)
+
+        # Default suggestions
+        return [
+            "console.log()",
+            "const ",
+            "let ",
+            "function ",
+            "if (",
+            "for (",
+            "return ",
+            "async ",
+            "await ",
+            "try {",
+            "catch (error) {"
+        ]
@@ -0,0 +1,155 @@
+import keyword
+import re
+from typing import Callable, List, Optional, Tuple
+from analyzers.base import Analyzer, Token, significant, texts
+from services.completion_index import Vocabulary
+
+_SPACE = re.compile(r"\s*")
+_TOKEN = re.compile(
+    r"(?P<comment>#.*)"
+    r"|(?P<quote>[rRbBuUfF]{0,2}(?:'''|\"\"\"|'|\"))"
+    r"|(?P<name>[A-Za-z_]\w*)"
+    r"|(?P<number>\d[\w.]*)"
+    r"|(?P<op>\*\*=?|//=?|->|:=|[=!<>]=|<<|>>|[-+*/%&|^@]=|.)"
+)
+_CLOSE = {
+    "'": re.compile(r"(?:[^'\\]|\\.)*'"),
+    '"': re.compile(r'(?:[^"\\]|\\.)*"'),
+}
+
+CONTROL_KEYWORDS = ("if", "elif", "else", "for", "while", "try", "except", "finally", "with")
+
+
+class PythonAnalyzer(Analyzer):
+    """Python context rules over a tokenizer that tracks triple-quoted strings across lines."""
+
+    name = "python"
+    declaration_keywords = ("def", "class", "as")
+    multiline_markers = ('"""', "'''")
+
+    def __init__(self):
+        self.python_keywords = [
+            "def", "class", "if", "elif", "else", "for", "while", "try", "except",
+            "finally", "with", "import", "from", "return", "yield", "lambda"
+        ]
+
+        self.common_methods = [
+            "append()", "extend()", "insert()", "remove()", "pop()", "clear()",
+            "index()", "count()", "sort()", "reverse()", "copy()",
+            "split()", "join()", "replace()", "strip()", "lower()", "upper()",
+            "startswith()", "endswith()", "find()", "format()"
+        ]
+
+        self.common_modules = [
+            "os", "sys", "json", "requests", "datetime", "time", "random",
+            "math", "re", "collections", "itertools", "functools"
+        ]
+
+        self.builtin_functions = [
+            "print()", "len()", "str()", "int()", "float()", "bool()", "list()",
+            "dict()", "tuple()", "set()", "range()", "enumerate()", "zip()",
+            "map()", "filter()", "sorted()", "reversed()", "sum()", "min()", "max()"
+        ]
+
+        super().__init__(Vocabulary(
+            self.python_keywords + self.builtin_functions + self.common_modules + self.common_methods
+            + keyword.kwlist
+        ))
+
+    def tokenize(self, line: str, state: Optional[str]) -> Tuple[List[Token], Optional[str]]:
+        tokens: List[Token] = []
+        position = 0
+        if state is not None:
+            # Inside a triple-quoted string carried over from an earlier line
+            end = line.find(state)
+            if end < 0:
+                return [("open_string", line)], state
+            tokens.append(("string", line[:end + 3]))
+            position = end + 3
+
+        while True:
+            position = _SPACE.match(line, position).end()
+            if position >= len(line):
+                return tokens, None
+            match = _TOKEN.match(line, position)
+            kind = match.lastgroup
+            if kind != "quote":
+                tokens.append((kind, match.group()))
+                position = match.end()
+                continue
+
+            quote = match.group().lstrip("rRbBuUfF")
+            if len(quote) == 3:
+                end = line.find(quote, match.end())
+                if end < 0:
+                    tokens.append(("open_string", line[position:]))
+                    return tokens, quote
+                tokens.append(("string", line[position:end + 3]))
+                position = end + 3
+            else:
+                closed = _CLOSE[quote].match(line, match.end())
+                if closed is None:
+                    tokens.append(("open_string", line[position:]))
+                    return tokens, None
+                tokens.append(("string", line[position:closed.end()]))
+                position = closed.end()
+
+    def suggest(self, tokens: List[Token], in_function_or_class: Callable[[], bool]) -> List[str]:
+        tokens = significant(tokens)
+        words = texts(tokens)
+        if words[:1] == ["async"]:
+            words = words[1:]
+        first = words[0] if words else ""
+        depth, top_colon = _structure(tokens)
+
+        # Function definition completion
+        if first == "def" and "(" in words and not top_colon:
+            return ["):"] if depth else [":"]
+
+        # Control structure and class definition completion
+        if first in CONTROL_KEYWORDS + ("class",) and not top_colon:
+            return [":"]
+
+        # Method chaining (object.method)
+        if words and words[-1] == "." and tokens[-1][0] == "op":
+            return list(self.common_methods)
+
+        # Import statement completion
+        if first in ("import", "from"):
+            return list(self.common_modules)
+
+        # Function call patterns
+        if words and words[-1] == "(":
+            if words[-2:-1] == ["print"]:
+                return ['"Hello, World!"', 'f"Value: {variable}"', 'variable']
+            if words[-2:-1] == ["len"]:
+                return ['list_name', 'string_name', 'dict_name']
+            return []
+
+        # Default suggestions for general context
+        suggestions = list(self.builtin_functions)
+        if in_function_or_class():
+            suggestions.extend(["return ", "yield ", "raise "])
+        suggestions.extend([
+            'if __name__ == "__main__":',
+            "try:",
+            "except Exception as e:",
+            "with open() as f:",
+        ])
+        return suggestions
+
+
+def _structure(tokens: List[Token]) -> Tuple[int, bool]:
+    """Open bracket depth at the end of the line, and whether a colon appears outside brackets."""
+    depth = 0
+    top_colon = False
+    for kind, text in tokens:
+        if kind != "op":
+            continue
+        if text in "([{":
+            depth += 1
+        elif text in ")]}":
+            depth = max(0, depth - 1)
+        elif text == ":" and depth == 0:
+            top_colon = True
+    return depth, top_colon
@@ -0,0 +1,25 @@
+from typing import Dict
+from analyzers.base import Analyzer
+from analyzers.generic import GenericAnalyzer
+from analyzers.javascript import JavaScriptAnalyzer
+from analyzers.python import PythonAnalyzer
+
+
+class AnalyzerRegistry:
+    """Analyzers keyed by the language names clients send, with a fallback."""
+
+    def __init__(self, default: Analyzer):
+        self.default = default
+        self.analyzers: Dict[str, Analyzer] = {}
+
+    def register(self, analyzer: Analyzer, *languages: str):
+        for language in languages:
+            self.analyzers[language.lower()] = analyzer
+
+    def get(self, language: str) -> Analyzer:
+        return self.analyzers.get(language.lower(), self.default)
+
+# Global analyzer registry instance
+analyzer_registry = AnalyzerRegistry(GenericAnalyzer())
+analyzer_registry.register(PythonAnalyzer(), "python", "py")
+analyzer_registry.register(JavaScriptAnalyzer(), "javascript", "typescript", "js", "ts", "jsx", "tsx")
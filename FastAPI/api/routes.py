@@ -1,16 +1,57 @@
-import json
+import asyncio
+import hmac
 import logging
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
-from models import AutocompleteRequest, AutocompleteResponse, RoomResponse, ErrorResponse
+import time
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Response, WebSocket, WebSocketDisconnect
+from config import settings
+from models import (
+    AutocompleteBatchRequest, AutocompleteBatchResponse, AutocompleteRequest, AutocompleteResponse, RoomResponse,
+    RoomSnapshot, ErrorResponse
+)
+from backends.room_backend import room_backend
+from services.autocomplete_cache import autocomplete_cache
+from services.autocomplete_dispatcher import autocomplete_dispatcher
+from services.autocomplete_pool import autocomplete_pool
+from services.autocomplete_service import AUTOCOMPLETE_SECONDS
+from services.loop_monitor import loop_monitor
+from services.merge_service import merge_service
+from services.metrics import CONTENT_TYPE, metrics
+from services.profiler import ProfilerBusy, profiler
+from services.room_lifecycle import room_lifecycle
+from services.room_migration import room_migration
 from services.room_service import room_service
-from services.autocomplete_service import autocomplete_service
-from websocket.connection_manager import connection_manager
+from services.room_store import room_store
+from websocket.admission import FRAME_TOO_LARGE_CLOSE_CODE, FrameTooLarge
+from websocket.codec import deflate_codec
+from websocket.connection_manager import MOVED_CLOSE_CODE, connection_manager
+from websocket.spectators import SPECTATOR_ROLE
+from websocket.sync_cache import sync_cache
 
 logger = logging.getLogger(__name__)
 
 # Create API router
 router = APIRouter()
 
+# Message types counted under their own label; anything else a client sends is counted as "unknown"
+MESSAGE_TYPES = frozenset({
+    "code_delta", "code_change", "cursor_position", "user_typing", "autocomplete_request", "pong"
+})
+
+MESSAGES_RECEIVED = metrics.counter("ws_messages_received_total", "Inbound WebSocket messages by type", ("type",))
+MESSAGE_SECONDS = metrics.histogram(
+    "ws_message_handling_seconds", "Time to handle one inbound WebSocket message, including fan-out", ("type",)
+)
+CONNECTIONS_REJECTED = metrics.counter(
+    "ws_connections_rejected_total", "WebSocket connections closed before joining their room", ("reason",)
+)
+SPECTATOR_MESSAGES_IGNORED = metrics.counter(
+    "ws_spectator_messages_ignored_total", "Messages other than heartbeat replies sent by read-only spectators"
+)
+JOIN_SYNCS = metrics.counter(
+    "ws_join_syncs_total", "Joining connections brought up to date, by full document or resumed changes", ("kind",)
+)
+
 
 @router.post("/rooms", response_model=RoomResponse, tags=["rooms"])
 async def create_room():
@@ -24,37 +65,161 @@ async def create_room():
 
 @router.get("/rooms/{room_id}", tags=["rooms"])
 async def get_room(room_id: str):
-    room = room_service.get_room(room_id)
+    # Handed to another worker: reloading it from the store here would bring back a stale copy
+    if connection_manager.is_draining(room_id):
+        raise HTTPException(status_code=503, detail="Room is moving to another worker", headers={"Retry-After": "1"})
+    room = await room_service.load_room(room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     
     return {
         "room_id": room_id,
-        "code": room.code,
-        "users": room.users,
-        "active_connections": connection_manager.get_room_connection_count(room_id)
+        "code": room_service.get_room_code(room_id),
+        "users": room_service.get_room_users(room_id),
+        "revision": room.revision,
+        "active_connections": connection_manager.get_room_connection_count(room_id),
+        "spectators": connection_manager.get_spectator_count(room_id),
+        "queue_depths": connection_manager.get_queue_depths(room_id)
+    }
+
+@router.get("/stats", tags=["monitoring"])
+async def get_stats():
+    return {
+        "rooms": room_lifecycle.get_stats(),
+        "store": room_store.get_stats(),
+        "autocomplete": autocomplete_dispatcher.get_stats(),
+        "autocomplete_cache": autocomplete_cache.get_stats(),
+        "autocomplete_pool": autocomplete_pool.get_stats(),
+        "broadcast": connection_manager.scheduler.get_stats(),
+        "heartbeat": connection_manager.heartbeat.get_stats(),
+        "admission": connection_manager.admission.get_stats(),
+        "spectators": connection_manager.spectators.get_stats(),
+        "migration": room_migration.get_stats(),
+        "compression": deflate_codec.get_stats(),
+        "sync_cache": sync_cache.get_stats(),
+        "event_loop": loop_monitor.get_stats(),
+        "profiler": profiler.get_stats()
     }
 
+@router.get("/metrics", tags=["monitoring"])
+async def get_metrics():
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
+
+def check_admin_token(token: Optional[str]):
+    # Stacks and profiles reveal the code, so debug endpoints only exist once a token is configured
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(token or "", settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@router.get("/debug/loop", tags=["monitoring"])
+async def get_loop_health(x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    return {**loop_monitor.get_stats(), "recent_stalls": loop_monitor.get_stalls()}
+
+@router.get("/debug/profile", tags=["monitoring"])
+async def get_profile(seconds: float = 5.0, interval_ms: float = 5.0, all_threads: bool = False,
+                      x_admin_token: Optional[str] = Header(None)):
+    """Sample the live process's stacks for a while; the result feeds flamegraph.pl or speedscope."""
+    check_admin_token(x_admin_token)
+    try:
+        stacks, samples = await profiler.profile(seconds, interval_ms / 1000, all_threads)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(content=stacks, media_type="text/plain", headers={"X-Profile-Samples": str(samples)})
+
+def check_supervisor_token(token: Optional[str]):
+    # Internal endpoints only exist for a worker started by the supervisor, which never proxies them
+    if not settings.SUPERVISOR_TOKEN or not hmac.compare_digest(token or "", settings.SUPERVISOR_TOKEN):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@router.post("/internal/rooms/{room_id}/drain", response_model=RoomSnapshot, include_in_schema=False)
+async def drain_room(room_id: str, x_supervisor_token: Optional[str] = Header(None)):
+    check_supervisor_token(x_supervisor_token)
+    snapshot = await room_migration.drain(room_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return snapshot
+
+@router.post("/internal/rooms/{room_id}/restore", include_in_schema=False)
+async def restore_room(room_id: str, snapshot: RoomSnapshot, x_supervisor_token: Optional[str] = Header(None)):
+    check_supervisor_token(x_supervisor_token)
+    if snapshot.room_id != room_id:
+        raise HTTPException(status_code=400, detail="Snapshot is for another room")
+    room_migration.restore(snapshot)
+    return {"room_id": room_id, "revision": snapshot.revision}
+
+@router.get("/internal/load", include_in_schema=False)
+async def get_load(x_supervisor_token: Optional[str] = Header(None)):
+    check_supervisor_token(x_supervisor_token)
+    return {"rooms": room_migration.get_load(), "connections": len(connection_manager.sessions)}
+
 @router.post("/autocomplete", response_model=AutocompleteResponse, tags=["autocomplete"])
 async def get_autocomplete(request: AutocompleteRequest):
     try:
-        response = autocomplete_service.get_suggestions(request)
+        started = time.perf_counter()
+        response = await autocomplete_pool.get_suggestions(request)
+        AUTOCOMPLETE_SECONDS.observe(time.perf_counter() - started, "http")
         return response
     except Exception as e:
         logger.error(f"Error generating autocomplete suggestions: {e}")
         raise HTTPException(status_code=500, detail="Failed to generate suggestions")
 
+@router.post("/autocomplete/batch", response_model=AutocompleteBatchResponse, tags=["autocomplete"])
+async def get_autocomplete_batch(request: AutocompleteBatchRequest):
+    if len(request.cursor_positions) * max(1, len(request.prefixes)) > settings.AUTOCOMPLETE_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {settings.AUTOCOMPLETE_MAX_BATCH} suggestions per batch")
+    
+    try:
+        started = time.perf_counter()
+        response = await autocomplete_pool.get_batch_suggestions(request)
+        AUTOCOMPLETE_SECONDS.observe(time.perf_counter() - started, "batch")
+        return response
+    except Exception as e:
+        logger.error(f"Error generating batch autocomplete suggestions: {e}")
+        raise HTTPException(status_code=500, detail="Failed to generate suggestions")
+
 @router.websocket("/ws/{room_id}/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, room_id: str, user_id: str):
+async def websocket_endpoint(websocket: WebSocket, room_id: str, user_id: str, compress: Optional[str] = None,
+                             revision: Optional[int] = None, epoch: Optional[str] = None, role: Optional[str] = None):
+    # A room handed to another worker; the client reconnects through the supervisor to its new owner
+    if connection_manager.is_draining(room_id):
+        CONNECTIONS_REJECTED.inc("room_moved")
+        await websocket.close(code=MOVED_CLOSE_CODE, reason="Room moved")
+        return
+    
     # Validate room exists or create it
-    if not room_service.room_exists(room_id):
+    if await room_service.load_room(room_id) is None:
         # Create room with the specific room_id
-        from models import Room
-        room_service.rooms[room_id] = Room()
+        room_service.add_room(room_id)
+    
+    spectator = role == SPECTATOR_ROLE
+    if spectator and not room_lifecycle.admit_spectator(room_id):
+        CONNECTIONS_REJECTED.inc("audience_full")
+        await websocket.close(code=1013, reason="Audience is full")
+        return
+    if not spectator and not room_lifecycle.admit(room_id):
+        CONNECTIONS_REJECTED.inc("room_full")
+        await websocket.close(code=1013, reason="Room is full")
+        return
+    
+    # Bring this worker's copy of the room up to date before syncing the user
+    try:
+        await room_backend.open_room(room_id)
+    except Exception as e:
+        logger.error(f"Error opening room {room_id}: {e}")
+        CONNECTIONS_REJECTED.inc("room_unavailable")
+        await websocket.close(code=1011, reason="Room unavailable")
+        return
+    
+    if spectator:
+        await spectate_room(websocket, room_id, user_id, compress)
+        return
     
     # Connect user to room
-    connected = await connection_manager.connect(websocket, room_id, user_id)
+    connected = await connection_manager.connect(websocket, room_id, user_id, compress)
     if not connected:
+        CONNECTIONS_REJECTED.inc("connect_failed")
         await websocket.close(code=1011, reason="Connection failed")
         return
     
@@ -62,20 +227,30 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, user_id: str):
     try:
         room = room_service.get_room(room_id)
         if room:
-            sync_message = {
-                "type": "sync",
-                "code": room.code,
-                "users": room.users
-            }
-            await websocket.send_text(json.dumps(sync_message))
+            # Built right after connect so nothing applied in between is sent twice. A client
+            # reconnecting with a revision still in the room's history only gets what it missed
+            ops = merge_service.changes_since(room_id, epoch, revision) if revision is not None else None
+            if ops is not None:
+                JOIN_SYNCS.inc("resume")
+                await connection_manager.send_direct(websocket, {
+                    "type": "resume",
+                    "ops": ops,
+                    "revision": room_service.get_room_revision(room_id),
+                    "epoch": epoch,
+                    "users": room_service.get_room_users(room_id)
+                })
+            else:
+                JOIN_SYNCS.inc("full")
+                await connection_manager.send_sync(websocket)
             
             # Notify other users about new user
-            await connection_manager.broadcast_to_room(
+            users = await room_backend.add_user(room_id, user_id)
+            await room_backend.publish(
                 room_id,
                 {
                     "type": "user_joined",
                     "user_id": user_id,
-                    "users": room.users
+                    "users": users
                 },
                 exclude_user=user_id
             )
@@ -83,55 +258,116 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, user_id: str):
     except Exception as e:
         logger.error(f"Error sending sync message: {e}")
     
+    async def deliver(message: dict):
+        # Messages held back by admission control are handled later through the same path,
+        # unless the room has started moving in the meantime
+        if not connection_manager.is_draining(room_id):
+            await handle_websocket_message(message, room_id, user_id)
+    
     try:
         while True:
             # Receive message from client
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            message = await connection_manager.receive_message(websocket)
             
-            await handle_websocket_message(message, room_id, user_id)
+            # Nothing is applied once the room starts moving; the client resends unacked edits to the new owner
+            if connection_manager.is_draining(room_id):
+                continue
+            
+            if connection_manager.admit(websocket, message, deliver):
+                await handle_websocket_message(message, room_id, user_id)
             
     except WebSocketDisconnect:
         logger.info(f"User {user_id} disconnected from room {room_id}")
+    except FrameTooLarge as e:
+        logger.warning(f"Closing connection of user {user_id} in room {room_id}: {e}")
+        await close_quietly(websocket, FRAME_TOO_LARGE_CLOSE_CODE, "Message too big")
+    except asyncio.CancelledError:
+        # The heartbeat cancels the receive loop of a connection that stopped answering pings
+        if not connection_manager.has_expired(websocket):
+            raise
+        asyncio.current_task().uncancel()
+        logger.info(f"User {user_id} timed out in room {room_id}")
     except Exception as e:
         logger.error(f"WebSocket error for user {user_id} in room {room_id}: {e}")
     finally:
-        # Clean up connection
-        connection_manager.disconnect(websocket, room_id, user_id)
-        
-        # Notify other users about user leaving
-        await connection_manager.broadcast_to_room(
-            room_id,
-            {
-                "type": "user_left",
-                "user_id": user_id,
-                "users": room_service.get_room_users(room_id)
-            }
-        )
+        # Clean up connection; a connection the same user has since replaced leaves presence alone
+        if connection_manager.disconnect(websocket, room_id, user_id):
+            autocomplete_dispatcher.cancel(room_id, user_id)
+            
+            # Notify other users about user leaving
+            try:
+                users = await room_backend.remove_user(room_id, user_id)
+                await room_backend.publish(
+                    room_id,
+                    {
+                        "type": "user_left",
+                        "user_id": user_id,
+                        "users": users
+                    }
+                )
+                
+                if not connection_manager.has_connections(room_id):
+                    await room_backend.close_room(room_id)
+            except Exception as e:
+                logger.error(f"Error announcing user {user_id} leaving room {room_id}: {e}")
+
+async def close_quietly(websocket: WebSocket, code: int, reason: str):
+    try:
+        await websocket.close(code=code, reason=reason)
+    except Exception as e:
+        logger.debug(f"Error closing WebSocket: {e}")
+
+async def spectate_room(websocket: WebSocket, room_id: str, user_id: str, compress: Optional[str]):
+    # Spectators get the room's sync and then its shared spectator stream; they never join presence
+    if not await connection_manager.connect_spectator(websocket, room_id, user_id, compress):
+        CONNECTIONS_REJECTED.inc("connect_failed")
+        await websocket.close(code=1011, reason="Connection failed")
+        return
+    
+    try:
+        while True:
+            # Read-only: only heartbeat replies are expected
+            message = await connection_manager.receive_message(websocket)
+            if not isinstance(message, dict) or message.get("type") != "pong":
+                SPECTATOR_MESSAGES_IGNORED.inc()
+    
+    except WebSocketDisconnect:
+        logger.info(f"Spectator {user_id} disconnected from room {room_id}")
+    except FrameTooLarge as e:
+        logger.warning(f"Closing connection of spectator {user_id} in room {room_id}: {e}")
+        await close_quietly(websocket, FRAME_TOO_LARGE_CLOSE_CODE, "Message too big")
+    except asyncio.CancelledError:
+        if not connection_manager.has_expired(websocket):
+            raise
+        asyncio.current_task().uncancel()
+        logger.info(f"Spectator {user_id} timed out in room {room_id}")
+    except Exception as e:
+        logger.error(f"WebSocket error for spectator {user_id} in room {room_id}: {e}")
+    finally:
+        connection_manager.disconnect_spectator(websocket)
+        try:
+            if not connection_manager.has_connections(room_id):
+                await room_backend.close_room(room_id)
+        except Exception as e:
+            logger.error(f"Error closing room {room_id}: {e}")
 
 async def handle_websocket_message(message: dict, room_id: str, user_id: str):
     message_type = message.get("type")
+    started = time.perf_counter()
     
     try:
-        if message_type == "code_change":
-            # Update room code
-            code = message.get("code", "")
-            room_service.update_room_code(room_id, code)
+        if message_type == "code_delta":
+            # Merge insert/delete ops made against the client's revision of the document;
+            # the backend acks the sender and broadcasts only the delta
+            await room_backend.submit_delta(room_id, user_id, message.get("revision"), message.get("ops", []))
             
-            # Broadcast to other users in room
-            await connection_manager.broadcast_to_room(
-                room_id,
-                {
-                    "type": "code_change",
-                    "code": code,
-                    "user_id": user_id
-                },
-                exclude_user=user_id
-            )
+        elif message_type == "code_change":
+            # Full document replace, kept as a fallback for clients without delta support
+            await room_backend.replace_code(room_id, user_id, message.get("code", ""))
             
         elif message_type == "cursor_position":
             # Broadcast cursor position to other users
-            await connection_manager.broadcast_to_room(
+            await room_backend.publish(
                 room_id,
                 {
                     "type": "cursor_position",
@@ -143,7 +379,7 @@ async def handle_websocket_message(message: dict, room_id: str, user_id: str):
             
         elif message_type == "user_typing":
             # Broadcast typing indicator
-            await connection_manager.broadcast_to_room(
+            await room_backend.publish(
                 room_id,
                 {
                     "type": "user_typing",
@@ -153,8 +389,20 @@ async def handle_websocket_message(message: dict, room_id: str, user_id: str):
                 exclude_user=user_id
             )
             
+        elif message_type == "autocomplete_request":
+            # Answered from the room's copy of the document; only the cursor and revision are sent
+            autocomplete_dispatcher.submit(room_id, user_id, message)
+            
+        elif message_type == "pong":
+            # Heartbeat reply; receiving it already marked the connection as alive
+            pass
+            
         else:
             logger.warning(f"Unknown message type: {message_type}")
             
     except Exception as e:
-        logger.error(f"Error handling message type {message_type}: {e}")
\ No newline at end of file
+        logger.error(f"Error handling message type {message_type}: {e}")
+    
+    label = message_type if isinstance(message_type, str) and message_type in MESSAGE_TYPES else "unknown"
+    MESSAGES_RECEIVED.inc(label)
+    MESSAGE_SECONDS.observe(time.perf_counter() - started, label)
\ No newline at end of file
@@ -0,0 +1 @@
+# Room backend package initialization
\ No newline at end of file
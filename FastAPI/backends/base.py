@@ -0,0 +1,116 @@
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from typing import List
+from services.merge_service import merge_service
+from services.room_service import room_service
+from websocket.connection_manager import connection_manager
+
+logger = logging.getLogger(__name__)
+
+
+class RoomBackend(ABC):
+    """Shared room state and fan-out for one worker process.
+
+    Every worker keeps a local replica of the rooms its users are in. Edits
+    are turned into log entries and applied to the replica in log order by
+    `apply_entry`, which also fans them out to the local connections. A
+    backend decides how entries are ordered and how they (and ephemeral
+    messages like cursors) reach other workers.
+    """
+
+    # Whether every entry, even a rejected one, consumes a revision so that
+    # revisions stay aligned with a shared log across workers
+    sequenced = False
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex[:8]
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def open_room(self, room_id: str):
+        """Bring the local replica up to date before a user joins."""
+
+    async def close_room(self, room_id: str):
+        """Called when the last local connection in a room has left."""
+
+    def forget_room(self, room_id: str):
+        """Drop per-room state once the local replica has been evicted."""
+
+    @abstractmethod
+    async def add_user(self, room_id: str, user_id: str) -> List[str]:
+        """Add a user to the room's presence and return everyone in it."""
+
+    @abstractmethod
+    async def remove_user(self, room_id: str, user_id: str) -> List[str]:
+        """Remove a user from the room's presence and return who is left."""
+
+    @abstractmethod
+    async def submit_delta(self, room_id: str, user_id: str, revision: int, ops: List[dict]):
+        """Order a delta made against `revision` and apply it on every worker."""
+
+    @abstractmethod
+    async def replace_code(self, room_id: str, user_id: str, code: str):
+        """Order a full replace of the document and apply it on every worker."""
+
+    @abstractmethod
+    async def publish(self, room_id: str, message: dict, exclude_user: str = None):
+        """Send an ephemeral message to the room's connections on every worker."""
+
+    def make_entry(self, kind: str, user_id: str, **fields) -> dict:
+        return {"kind": kind, "user_id": user_id, "worker": self.worker_id, **fields}
+
+    async def apply_entry(self, room_id: str, entry: dict):
+        user_id = entry["user_id"]
+        local_author = entry.get("worker") == self.worker_id
+
+        if entry["kind"] == "replace":
+            room_service.update_room_code(room_id, entry["code"])
+            merge_service.reset(room_id)
+            await connection_manager.broadcast_to_room(
+                room_id,
+                {
+                    "type": "code_change",
+                    "code": entry["code"],
+                    "revision": room_service.get_room_revision(room_id),
+                    "user_id": user_id
+                },
+                exclude_user=user_id
+            )
+            return
+
+        result = merge_service.submit(room_id, entry["revision"], entry["ops"])
+        if result is None:
+            if self.sequenced:
+                merge_service.skip(room_id)
+            if local_author:
+                # Client is too far behind or sent bad ops, resync it with the full document
+                await connection_manager.send_in_room(room_id, user_id, room_service.build_sync_message(room_id))
+            return
+
+        revision, ops = result
+        if local_author:
+            await connection_manager.send_in_room(
+                room_id,
+                user_id,
+                {
+                    "type": "code_delta_ack",
+                    "revision": revision
+                }
+            )
+
+        # Broadcast only the delta to other users in room
+        await connection_manager.broadcast_to_room(
+            room_id,
+            {
+                "type": "code_delta",
+                "ops": ops,
+                "revision": revision,
+                "user_id": user_id
+            },
+            exclude_user=user_id
+        )
@@ -0,0 +1,217 @@
+"""In-process stand-in for Redis, speaking enough RESP for the room backend.
+
+Lets the Redis backend run locally and in benchmarks without a Redis server:
+    python -m backends.fake_redis --port 6380
+    REDIS_URL=redis://localhost:6380/0 ROOM_BACKEND=redis python main.py
+"""
+import argparse
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from backends.resp import encode_command
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_reply(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, Exception):
+        return b"-ERR %s\r\n" % str(value).encode()
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    return b"*%d\r\n" % len(value) + b"".join(_encode_reply(item) for item in value)
+
+
+class FakeRedisServer:
+    """Strings, lists, hashes, pub/sub and MULTI/EXEC, all kept in one process."""
+
+    def __init__(self):
+        self.strings: Dict[bytes, bytes] = {}
+        # Key -> monotonic deadline, for strings set with PX
+        self.expiries: Dict[bytes, float] = {}
+        self.lists: Dict[bytes, List[bytes]] = {}
+        self.hashes: Dict[bytes, Dict[bytes, bytes]] = {}
+        self.channels: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+        self._server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self._server = await asyncio.start_server(self._serve, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Commands queued since MULTI on this connection
+        queued: Optional[List[List[bytes]]] = None
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                name = command[0].upper().decode()
+                if name == "MULTI":
+                    queued = []
+                    writer.write(_encode_reply("OK"))
+                elif name == "EXEC":
+                    # Nothing else runs in between, which is all the atomicity one process needs
+                    replies = [self._run(queued_command) for queued_command in queued or []]
+                    queued = None
+                    writer.write(_encode_reply(replies))
+                elif queued is not None:
+                    queued.append(command)
+                    writer.write(_encode_reply("QUEUED"))
+                elif name in ("SUBSCRIBE", "UNSUBSCRIBE"):
+                    for channel in command[1:]:
+                        subscribers = self.channels.setdefault(channel, set())
+                        if name == "SUBSCRIBE":
+                            subscribers.add(writer)
+                        else:
+                            subscribers.discard(writer)
+                        writer.write(_encode_reply([name.lower().encode(), channel, len(subscribers)]))
+                else:
+                    writer.write(_encode_reply(self._run(command)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for subscribers in self.channels.values():
+                subscribers.discard(writer)
+            writer.close()
+
+    def _run(self, command: List[bytes]) -> Any:
+        name = command[0].decode().lower()
+        handler = getattr(self, f"_cmd_{name}", None)
+        if handler is None:
+            return RuntimeError(f"unknown command '{name.upper()}'")
+        try:
+            return handler(*command[1:])
+        except Exception as e:
+            return e
+
+    def drop_subscribers(self) -> int:
+        """Close every subscribed connection, as a Redis restart or network blip would."""
+        writers = set().union(*self.channels.values()) if self.channels else set()
+        for writer in writers:
+            writer.close()
+        return len(writers)
+
+    async def _read_command(self, reader: asyncio.StreamReader):
+        line = await reader.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def _cmd_ping(self, *args):
+        return args[0] if args else "PONG"
+
+    def _cmd_select(self, database):
+        return "OK"
+
+    def _cmd_get(self, key):
+        self._expire(key)
+        return self.strings.get(key)
+
+    def _cmd_set(self, key, value, *options):
+        self._expire(key)
+        options = [option.upper() for option in options]
+        if b"NX" in options and key in self.strings:
+            return None
+        self.strings[key] = value
+        self.expiries.pop(key, None)
+        if b"PX" in options:
+            self.expiries[key] = time.monotonic() + int(options[options.index(b"PX") + 1]) / 1000
+        return "OK"
+
+    def _cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            for store in (self.strings, self.lists, self.hashes):
+                if store.pop(key, None) is not None:
+                    removed += 1
+            self.expiries.pop(key, None)
+        return removed
+
+    def _cmd_rpush(self, key, *values):
+        items = self.lists.setdefault(key, [])
+        items.extend(values)
+        return len(items)
+
+    def _cmd_ltrim(self, key, start, stop):
+        items = self.lists.get(key)
+        if items is not None:
+            start, stop = int(start), int(stop)
+            if stop < 0:
+                stop += len(items)
+            items[:] = items[max(start, 0):stop + 1]
+        return "OK"
+
+    def _cmd_llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def _cmd_lrange(self, key, start, stop):
+        items = self.lists.get(key, [])
+        start, stop = int(start), int(stop)
+        if stop < 0:
+            stop += len(items)
+        return items[start:stop + 1]
+
+    def _cmd_hset(self, key, *pairs):
+        fields = self.hashes.setdefault(key, {})
+        added = 0
+        for index in range(0, len(pairs), 2):
+            added += pairs[index] not in fields
+            fields[pairs[index]] = pairs[index + 1]
+        return added
+
+    def _cmd_hdel(self, key, *names):
+        fields = self.hashes.get(key, {})
+        return sum(fields.pop(name, None) is not None for name in names)
+
+    def _cmd_hgetall(self, key):
+        return [item for pair in self.hashes.get(key, {}).items() for item in pair]
+
+    def _expire(self, key):
+        deadline = self.expiries.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            del self.expiries[key]
+            self.strings.pop(key, None)
+
+    def _cmd_publish(self, channel, message):
+        subscribers = self.channels.get(channel, set())
+        frame = encode_command("message", channel, message)
+        for subscriber in subscribers:
+            subscriber.write(frame)
+        return len(subscribers)
+
+
+async def _serve_forever(host: str, port: int):
+    server = FakeRedisServer()
+    bound = await server.start(host, port)
+    logger.info(f"Fake Redis listening on {host}:{bound}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve_forever(args.host, args.port))
@@ -0,0 +1,25 @@
+from typing import List
+from backends.base import RoomBackend
+from services.room_service import room_service
+from websocket.connection_manager import connection_manager
+
+
+class MemoryRoomBackend(RoomBackend):
+    """Single-process backend: entries apply immediately and fan-out stays local."""
+
+    async def add_user(self, room_id: str, user_id: str) -> List[str]:
+        room_service.add_user_to_room(room_id, user_id)
+        return room_service.get_room_users(room_id)
+
+    async def remove_user(self, room_id: str, user_id: str) -> List[str]:
+        room_service.remove_user_from_room(room_id, user_id)
+        return room_service.get_room_users(room_id)
+
+    async def submit_delta(self, room_id: str, user_id: str, revision: int, ops: List[dict]):
+        await self.apply_entry(room_id, self.make_entry("delta", user_id, revision=revision, ops=ops))
+
+    async def replace_code(self, room_id: str, user_id: str, code: str):
+        await self.apply_entry(room_id, self.make_entry("replace", user_id, code=code))
+
+    async def publish(self, room_id: str, message: dict, exclude_user: str = None):
+        await connection_manager.broadcast_to_room(room_id, message, exclude_user=exclude_user)
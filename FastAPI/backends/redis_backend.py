@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Set
+from backends.base import RoomBackend
+from backends.resp import RedisClient, RedisSubscriber
+from services.autocomplete_cache import autocomplete_cache
+from services.merge_service import is_well_formed, merge_service
+from services.room_service import RoomState, room_service
+from services.room_store import room_store
+from websocket.codec import json_codec
+from websocket.connection_manager import connection_manager
+from websocket.sync_cache import sync_cache
+
+logger = logging.getLogger(__name__)
+
+# How long one worker may hold a room's compaction lock, in milliseconds
+COMPACT_LOCK_MS = 10000
+
+
+def _log_key(room_id: str) -> str:
+    return f"room:{room_id}:log"
+
+
+def _base_key(room_id: str) -> str:
+    return f"room:{room_id}:base"
+
+
+def _compact_key(room_id: str) -> str:
+    return f"room:{room_id}:compacting"
+
+
+def _users_key(room_id: str) -> str:
+    return f"room:{room_id}:users"
+
+
+def _channel(room_id: str) -> str:
+    return f"room:{room_id}"
+
+
+class RedisRoomBackend(RoomBackend):
+    """Multi-worker backend over any Redis-protocol server.
+
+    Edits are appended to a per-room Redis list, which gives every entry a
+    global position (the revision). Each worker replays the list in order
+    through the same deterministic transform, so all replicas converge
+    without a cross-worker lock. A pub/sub notification tells subscribed
+    workers to catch up; cursor, typing and presence messages ride the same
+    channel.
+
+    Every `compact_every` entries, a worker stores the room's state as a
+    base snapshot (document, revision and OT history, which is all a
+    replica needs to transform later entries the same way) and trims the
+    log up to the previous base. The base also records the offset, the
+    revision the log now starts after. A replica that has fallen behind
+    the offset, or is new, starts from the base instead of entry zero.
+    """
+
+    sequenced = True
+
+    def __init__(self, url: str, compact_every: int):
+        super().__init__()
+        self.compact_every = compact_every
+        self.client = RedisClient(url)
+        self.subscriber = RedisSubscriber(url, self._on_message, self._on_reconnect)
+        self.subscribed: Set[str] = set()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Last seen log offset of each room, so a catch-up usually takes one round trip
+        self._offsets: Dict[str, int] = {}
+
+    async def start(self):
+        await self.client.connect()
+        await self.subscriber.connect()
+        logger.info(f"Redis room backend started as worker {self.worker_id}")
+
+    async def stop(self):
+        await self.subscriber.close()
+        await self.client.close()
+
+    async def open_room(self, room_id: str):
+        if room_id not in self.subscribed:
+            self.subscribed.add(room_id)
+            await self.subscriber.subscribe(_channel(room_id))
+        await self._catch_up(room_id)
+        room_service.set_room_users(room_id, await self._load_users(room_id))
+
+    async def close_room(self, room_id: str):
+        # The replica stays in memory; the log lets it catch up on the next open
+        if room_id in self.subscribed:
+            self.subscribed.discard(room_id)
+            await self.subscriber.unsubscribe(_channel(room_id))
+
+    def forget_room(self, room_id: str):
+        # An evicted replica is rebuilt from the base and the log on the next open
+        self._locks.pop(room_id, None)
+        self._offsets.pop(room_id, None)
+
+    async def add_user(self, room_id: str, user_id: str) -> List[str]:
+        await self.client.execute("HSET", _users_key(room_id), user_id, repr(time.time()))
+        users = await self._load_users(room_id)
+        room_service.set_room_users(room_id, users)
+        return users
+
+    async def remove_user(self, room_id: str, user_id: str) -> List[str]:
+        await self.client.execute("HDEL", _users_key(room_id), user_id)
+        users = await self._load_users(room_id)
+        room_service.set_room_users(room_id, users)
+        return users
+
+    async def submit_delta(self, room_id: str, user_id: str, revision: int, ops: List[dict]):
+        if not isinstance(revision, int) or not is_well_formed(ops):
+            # Don't let malformed ops into the shared log
+            await connection_manager.send_in_room(room_id, user_id, room_service.build_sync_message(room_id))
+            return
+        await self._append(room_id, self.make_entry("delta", user_id, revision=revision, ops=ops))
+
+    async def replace_code(self, room_id: str, user_id: str, code: str):
+        await self._append(room_id, self.make_entry("replace", user_id, code=code))
+
+    async def publish(self, room_id: str, message: dict, exclude_user: str = None):
+        await connection_manager.broadcast_to_room(room_id, message, exclude_user=exclude_user)
+        await self.client.execute("PUBLISH", _channel(room_id), json_codec.encode({
+            "kind": "message",
+            "worker": self.worker_id,
+            "message": message,
+            "exclude_user": exclude_user
+        }))
+
+    async def _append(self, room_id: str, entry: dict):
+        await self.client.execute("RPUSH", _log_key(room_id), json_codec.encode(entry))
+        await self.client.execute("PUBLISH", _channel(room_id), json_codec.encode({"kind": "log"}))
+        await self._catch_up(room_id)
+
+    async def _catch_up(self, room_id: str):
+        lock = self._locks.get(room_id)
+        if lock is None:
+            lock = self._locks[room_id] = asyncio.Lock()
+
+        async with lock:
+            if await room_service.load_room(room_id) is None:
+                return
+            restored = False
+            while True:
+                # The local revision is exactly the number of log entries applied
+                revision = room_service.get_room_revision(room_id)
+                offset = self._offsets.get(room_id, 0)
+                # Read together, so a compaction can't shift the log between the two
+                raw_base, entries = await self.client.transaction(
+                    ("GET", _base_key(room_id)),
+                    ("LRANGE", _log_key(room_id), max(revision - offset, 0), -1)
+                )
+                base = json_codec.decode(raw_base) if raw_base is not None else None
+                actual = base["offset"] if base is not None else 0
+                if actual != offset:
+                    self._offsets[room_id] = actual
+                    continue
+                if revision < offset:
+                    # Entries this replica still needs have been trimmed
+                    self._restore(room_id, base)
+                    restored = True
+                    continue
+                break
+
+            for raw in entries:
+                await self.apply_entry(room_id, json_codec.decode(raw))
+            if restored and connection_manager.has_connections(room_id):
+                # Local clients never got the changes skipped over
+                logger.warning(f"Replica of room {room_id} restored from its base at revision {base['revision']}")
+                await connection_manager.broadcast_to_room(room_id, room_service.build_sync_message(room_id))
+
+            based = base["revision"] if base is not None else 0
+            if self.compact_every > 0 and room_service.get_room_revision(room_id) - based >= self.compact_every:
+                try:
+                    await self._compact(room_id)
+                except Exception as e:
+                    logger.error(f"Error compacting the log of room {room_id}: {e}")
+
+    def _restore(self, room_id: str, base: dict):
+        room = RoomState(base["code"], base["revision"])
+        previous = room_service.rooms.get(room_id)
+        if previous is not None:
+            room.users = previous.users
+        room_service.add_room(room_id, room)
+        merge_service.set_history(room_id, base["history"])
+        sync_cache.forget_room(room_id)
+        autocomplete_cache.forget_room(room_id)
+        room_store.snapshot(room_id, room.revision, room.code)
+
+    async def _compact(self, room_id: str):
+        """Store this replica's state as the room's base and trim the log up to the previous one."""
+        # One worker at a time, or two could trim the same entries off twice
+        if await self.client.execute("SET", _compact_key(room_id), self.worker_id, "NX", "PX", COMPACT_LOCK_MS) is None:
+            return
+        try:
+            raw_base = await self.client.execute("GET", _base_key(room_id))
+            previous: Optional[dict] = json_codec.decode(raw_base) if raw_base is not None else None
+            revision = room_service.get_room_revision(room_id)
+            old_offset = previous["offset"] if previous is not None else 0
+            # Keeping the entries since the previous base lets replicas a little behind catch up without a resync
+            offset = previous["revision"] if previous is not None else 0
+            if previous is not None and previous["revision"] >= revision:
+                return
+            base = {
+                "revision": revision,
+                "offset": offset,
+                "code": room_service.get_room_code(room_id),
+                "history": merge_service.get_history(room_id)
+            }
+            await self.client.transaction(
+                ("SET", _base_key(room_id), json_codec.encode(base)),
+                ("LTRIM", _log_key(room_id), offset - old_offset, -1)
+            )
+            self._offsets[room_id] = offset
+            logger.info(f"Compacted the log of room {room_id} to a base at revision {revision}, "
+                        f"keeping entries after {offset}")
+        finally:
+            await self.client.execute("DEL", _compact_key(room_id))
+
+    async def _on_reconnect(self):
+        # Notifications sent while the subscriber was away are lost; the log isn't
+        for room_id in list(self.subscribed):
+            try:
+                await self._catch_up(room_id)
+            except Exception as e:
+                logger.error(f"Error catching up room {room_id} after reconnecting: {e}")
+
+    async def _load_users(self, room_id: str) -> List[str]:
+        fields = await self.client.execute("HGETALL", _users_key(room_id))
+        joined = {fields[index].decode(): float(fields[index + 1]) for index in range(0, len(fields), 2)}
+        return sorted(joined, key=joined.get)
+
+    async def _on_message(self, channel: str, data: bytes):
+        room_id = channel.split(":", 1)[1]
+        if room_id not in self.subscribed:
+            return
+
+        notice = json_codec.decode(data)
+        if notice["kind"] == "log":
+            await self._catch_up(room_id)
+        elif notice["worker"] != self.worker_id:
+            message = notice["message"]
+            if "users" in message and message.get("type") in ("user_joined", "user_left"):
+                room_service.set_room_users(room_id, message["users"])
+            await connection_manager.broadcast_to_room(room_id, message, exclude_user=notice["exclude_user"])
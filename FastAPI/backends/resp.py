@@ -0,0 +1,204 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple, Union
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Backoff between attempts to get a lost subscriber connection back, in seconds
+RECONNECT_DELAY = 0.1
+MAX_RECONNECT_DELAY = 5.0
+
+# Minimal RESP (Redis serialization protocol) client, enough for the room
+# backend without pulling in a Redis library
+
+
+class RedisError(Exception):
+    pass
+
+
+def parse_url(url: str) -> Tuple[str, int, int]:
+    parsed = urlparse(url)
+    database = int(parsed.path.lstrip("/") or 0)
+    return parsed.hostname or "localhost", parsed.port or 6379, database
+
+
+def encode_command(*args: Union[str, bytes, int, float]) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Redis connection closed")
+
+    prefix, rest = line[:1], line[1:-2]
+    if prefix == b"+":
+        return rest.decode()
+    if prefix == b"-":
+        raise RedisError(rest.decode())
+    if prefix == b":":
+        return int(rest)
+    if prefix == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if prefix == b"*":
+        length = int(rest)
+        if length < 0:
+            return None
+        return [await _read_element(reader) for _ in range(length)]
+    raise RedisError(f"Unexpected reply: {line!r}")
+
+
+async def _read_element(reader: asyncio.StreamReader) -> Any:
+    # An error inside an array (a failed command in EXEC) is returned, so the rest is still read
+    try:
+        return await read_reply(reader)
+    except RedisError as e:
+        return e
+
+
+class RedisClient:
+    """Request/response connection; commands are serialized over one socket."""
+
+    def __init__(self, url: str):
+        self.host, self.port, self.database = parse_url(url)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.database:
+            await self.execute("SELECT", self.database)
+
+    async def execute(self, *args) -> Any:
+        async with self._lock:
+            self._writer.write(encode_command(*args))
+            await self._writer.drain()
+            return await read_reply(self._reader)
+
+    async def transaction(self, *commands: tuple) -> List[Any]:
+        """Run commands atomically with MULTI/EXEC and return their replies."""
+        async with self._lock:
+            self._writer.write(b"".join(encode_command(*args) for args in (("MULTI",), *commands, ("EXEC",))))
+            await self._writer.drain()
+            # MULTI and every queued command answer before EXEC; read them all to stay in step
+            errors = []
+            for _ in range(len(commands) + 1):
+                try:
+                    await read_reply(self._reader)
+                except RedisError as e:
+                    errors.append(e)
+            try:
+                replies = await read_reply(self._reader)
+            except RedisError as e:
+                errors.append(e)
+            if errors:
+                raise errors[0]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+MessageHandler = Callable[[str, bytes], Awaitable[None]]
+
+
+class RedisSubscriber:
+    """Dedicated pub/sub connection that hands channel messages to a handler.
+
+    A lost connection is reopened with backoff and every channel subscribed
+    again. Messages published in between are gone, so `on_reconnect` is
+    called once the subscriptions are back, for the caller to catch up.
+    """
+
+    def __init__(self, url: str, handler: MessageHandler, on_reconnect: Optional[Callable[[], Awaitable[None]]] = None):
+        self.host, self.port, _ = parse_url(url)
+        self._handler = handler
+        self._on_reconnect = on_reconnect
+        self.channels: Set[str] = set()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._listener = asyncio.create_task(self._listen(reader))
+
+    async def subscribe(self, *channels: str):
+        self.channels.update(channels)
+        await self._send("SUBSCRIBE", *channels)
+
+    async def unsubscribe(self, *channels: str):
+        self.channels.difference_update(channels)
+        await self._send("UNSUBSCRIBE", *channels)
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def _send(self, *args):
+        if self._writer is None:
+            return
+        try:
+            self._writer.write(encode_command(*args))
+            await self._writer.drain()
+        except ConnectionError:
+            # The listener reopens the connection with the channels as they are by then
+            pass
+
+    async def _reconnect(self) -> asyncio.StreamReader:
+        delay = RECONNECT_DELAY
+        while True:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+                if self.channels:
+                    writer.write(encode_command("SUBSCRIBE", *self.channels))
+                    await writer.drain()
+            except OSError as e:
+                logger.warning(f"Redis subscriber reconnect failed, retrying in {delay:g}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                continue
+            self._writer = writer
+            logger.info(f"Redis subscriber reconnected to {len(self.channels)} channels")
+            if self._on_reconnect is not None:
+                # Runs alongside the listener, so notifications arriving meanwhile aren't held up
+                asyncio.create_task(self._on_reconnect())
+            return reader
+
+    async def _listen(self, reader: asyncio.StreamReader):
+        while True:
+            try:
+                reply: List[Any] = await read_reply(reader)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Redis subscriber connection lost: {e}")
+                reader = await self._reconnect()
+                continue
+
+            if reply and reply[0] == b"message":
+                try:
+                    await self._handler(reply[1].decode(), reply[2])
+                except Exception as e:
+                    logger.error(f"Error handling Redis message on {reply[1]!r}: {e}")
@@ -0,0 +1,15 @@
+from config import settings
+from backends.base import RoomBackend
+from backends.memory import MemoryRoomBackend
+from backends.redis_backend import RedisRoomBackend
+
+
+def create_backend(name: str) -> RoomBackend:
+    if name == "memory":
+        return MemoryRoomBackend()
+    if name == "redis":
+        return RedisRoomBackend(settings.REDIS_URL, settings.REDIS_LOG_COMPACT_EVERY)
+    raise ValueError(f"Unknown room backend: {name}")
+
+# Global room backend instance
+room_backend = create_backend(settings.ROOM_BACKEND)
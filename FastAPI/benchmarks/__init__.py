@@ -0,0 +1 @@
+# Benchmarks package initialization
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""Inbound admission control: cost on normal traffic, effect under a flood.
+
+First times the per-message admission checks (frame size, byte rate and
+the per-type buckets) on a well-behaved typist's traffic, which never
+hits a limit. Then runs the real WebSocket endpoint over in-memory
+sockets: one client floods its room with large code_change frames while
+a client in another room types steadily, and the typist's edit latency
+(frame received to ack queued) is compared with admission control on
+and off.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_admission --flood-kb 512 --seconds 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from typing import Callable, List
+
+# Rooms kept in memory, and no log line per flooded message
+os.environ.setdefault("ROOM_STORE_PATH", "")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from api import routes
+from websocket.admission import AdmissionControl
+from websocket.connection_manager import connection_manager
+from websocket.session import Session
+
+
+class FakeWebSocket:
+
+    def __init__(self, on_send: Callable[[str], None] = None):
+        self.scope = {"subprotocols": []}
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.on_send = on_send
+
+    async def accept(self, subprotocol: str = None):
+        pass
+
+    async def close(self, code: int = 1000, reason: str = None):
+        pass
+
+    async def receive(self) -> dict:
+        return await self.inbox.get()
+
+    async def send_text(self, data: str):
+        if self.on_send is not None:
+            self.on_send(data)
+
+    async def send_bytes(self, data: bytes):
+        pass
+
+    def push(self, message: dict):
+        self.inbox.put_nowait({"type": "websocket.receive", "text": json.dumps(message)})
+
+    def hang_up(self):
+        self.inbox.put_nowait({"type": "websocket.disconnect", "code": 1000})
+
+
+def check_overhead(messages: int) -> float:
+    """ns per message for the admission checks on traffic under every limit."""
+    admission = AdmissionControl(True, 2 * 1024 * 1024, 4 * 1024 * 1024)
+    session = Session(None, "room", "user", None)
+    traffic = [
+        ({"type": "code_delta", "revision": 1, "ops": [{"op": "insert", "pos": 10, "text": "a"}]}, 70),
+        ({"type": "cursor_position", "position": 11}, 40),
+    ]
+
+    async def deliver(message: dict):
+        pass
+
+    now = 0.0
+    started = time.perf_counter()
+    for index in range(messages):
+        # A fast typist: a delta and a cursor move every 50 ms
+        now += 0.025
+        message, size = traffic[index % 2]
+        admission.check_frame(session, size, now)
+        admission.admit(session, message, now, deliver)
+    elapsed = time.perf_counter() - started
+    assert not admission.throttled and not admission.read_pauses
+    return elapsed / messages * 1e9
+
+
+async def flood(flood_kb: int, seconds: float, rate: float, enabled: bool) -> dict:
+    connection_manager.admission.enabled = enabled
+    latencies: List[float] = []
+    sent_at: List[float] = []
+    revision = [0]
+
+    def typist_received(data: str):
+        message = json.loads(data)
+        for entry in message.get("messages", [message]):
+            if entry["type"] == "code_delta_ack":
+                latencies.append(time.perf_counter() - sent_at[len(latencies)])
+                revision[0] = entry["revision"]
+
+    label = "on" if enabled else "off"
+    flooder = FakeWebSocket()
+    typist = FakeWebSocket(typist_received)
+    endpoints = [
+        asyncio.create_task(routes.websocket_endpoint(flooder, f"flood-{label}", "flooder")),
+        asyncio.create_task(routes.websocket_endpoint(typist, f"quiet-{label}", "typist")),
+    ]
+    await asyncio.sleep(0.1)
+
+    payload = "x" * (flood_kb * 1024)
+    handled_before = routes.MESSAGES_RECEIVED.get("code_change")
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    index = 0
+    while time.perf_counter() - started < seconds:
+        # The flooder keeps its socket buffer full; the typist sends at a steady rate
+        while flooder.inbox.qsize() < 8:
+            flooder.push({"type": "code_change", "code": f"{index}{payload}"})
+            index += 1
+        sent_at.append(time.perf_counter())
+        typist.push({"type": "code_delta", "revision": revision[0], "ops": [{"op": "insert", "pos": 0, "text": "a"}]})
+        await asyncio.sleep(1 / rate)
+    await asyncio.sleep(0.2)
+    cpu = time.process_time() - cpu_started
+
+    flooder.hang_up()
+    typist.hang_up()
+    await asyncio.gather(*endpoints)
+    connection_manager.admission.enabled = True
+    latencies.sort()
+    return {
+        "typist_edits": len(sent_at),
+        "typist_acked": len(latencies),
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else float("nan"),
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float("nan"),
+        "flood_handled": routes.MESSAGES_RECEIVED.get("code_change") - handled_before,
+        "flood_mb_per_s": (routes.MESSAGES_RECEIVED.get("code_change") - handled_before) * flood_kb / 1024 / seconds,
+        "cpu_s": cpu
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200000, help="messages for the overhead timing")
+    parser.add_argument("--flood-kb", type=int, default=512, help="size of each flooding code_change")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--rate", type=float, default=50.0, help="typist edits per second")
+    args = parser.parse_args()
+
+    print(f"admission checks on normal traffic: {check_overhead(args.messages):.0f} ns/message")
+    print()
+    print(f"{args.flood_kb} KB code_change flood in one room, typist at {args.rate:g} edits/s in another")
+    print(f"{'admission':<10} {'edits':>6} {'acked':>6} {'p50 ms':>8} {'p99 ms':>8} {'flood msgs':>11} "
+          f"{'flood MB/s':>11} {'CPU s':>6}")
+    for enabled in (False, True):
+        result = asyncio.run(flood(args.flood_kb, args.seconds, args.rate, enabled))
+        print(f"{'on' if enabled else 'off':<10} {result['typist_edits']:>6} {result['typist_acked']:>6} "
+              f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['flood_handled']:>11} "
+              f"{result['flood_mb_per_s']:>11.1f} {result['cpu_s']:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
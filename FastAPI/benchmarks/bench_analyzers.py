@@ -0,0 +1,115 @@
+"""Per-analyzer context classification latency against document size.
+
+Each document is indexed once; every request then makes a one-character
+edit at a random position and asks for suggestions at another, so the
+analyzer resumes tokenizing from the nearest still-valid line state. The
+cold column tokenizes every line before the cursor from scratch, which is
+what classification would cost without the stored states.
+
+Documents open a multi-line string or comment every few dozen lines so
+the stored states actually matter. The Python p99 is edits that land
+inside a triple quote, which really does change every line after it.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_analyzers --requests 2000
+"""
+import argparse
+import random
+import statistics
+import string
+import time
+from typing import Callable, Dict, List
+
+from analyzers.registry import analyzer_registry
+from benchmarks.bench_autocomplete import percentile
+from services.autocomplete_service import autocomplete_service
+from services.document_index import DocumentIndex
+
+SIZES_KB = (10, 100, 1024)
+
+
+def python_block(name: str, rng: random.Random) -> List[str]:
+    block = [f"def {name}(value):", f'    """Compute {name}."""']
+    block += [f"    total = value * {rng.randint(0, 99)}  # step {index}" for index in range(rng.randint(1, 6))]
+    if rng.random() < 0.2:
+        block += ['    text = """', "    if this were code it would not count", '    """']
+    return block + [f"    return '{name}' + str(total)", ""]
+
+
+def javascript_block(name: str, rng: random.Random) -> List[str]:
+    block = [f"function {name}(value) {{", f"  /* compute {name} */"]
+    block += [f"  const total{index} = value * {rng.randint(0, 99)}; // step {index}" for index in range(rng.randint(1, 6))]
+    if rng.random() < 0.2:
+        block += ["  const text = `", "  if (this) { were code }", "  `;"]
+    return block + [f"  return '{name}' + total0;", "}", ""]
+
+
+def generic_block(name: str, rng: random.Random) -> List[str]:
+    block = [f"fn {name}(value: i32) -> i32 {{", "    /*", f"     * compute {name}", "     */"]
+    block += [f"    let total = value * {rng.randint(0, 99)}; // step" for _ in range(rng.randint(1, 6))]
+    return block + ["    total", "}", ""]
+
+
+BLOCKS: Dict[str, Callable[[str, random.Random], List[str]]] = {
+    "python": python_block,
+    "javascript": javascript_block,
+    "rust": generic_block
+}
+
+
+def build_document(language: str, size_kb: int, rng: random.Random) -> str:
+    lines: List[str] = []
+    size = 0
+    while size < size_kb * 1024:
+        block = BLOCKS[language]("".join(rng.choices(string.ascii_lowercase, k=6)), rng)
+        lines.extend(block)
+        size += sum(len(line) + 1 for line in block)
+    return "\n".join(lines)
+
+
+def cold_state(language: str, code: str, position: int):
+    analyzer = analyzer_registry.get(language)
+    state = analyzer.initial_state
+    for line in code[:code.rfind("\n", 0, position) + 1].split("\n")[:-1]:
+        state = analyzer.end_state(line, state)
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per language and document size")
+    args = parser.parse_args()
+
+    print(f"{'analyzer':>10} {'size':>8} {'p50 us':>8} {'p99 us':>8} {'cold p50 us':>12}")
+    for language in BLOCKS:
+        analyzer = analyzer_registry.get(language)
+        for size_kb in SIZES_KB:
+            rng = random.Random(size_kb)
+            code = build_document(language, size_kb, rng)
+            index = DocumentIndex(code)
+            # Fill the line states once, as the first request in a room would
+            autocomplete_service.get_suggestions_at(index, len(index), language)
+
+            lookups = []
+            for _ in range(args.requests):
+                position = rng.randint(0, len(index))
+                index.apply([{"op": "insert", "pos": position, "text": rng.choice(string.ascii_lowercase)}])
+                position = rng.randint(0, len(index))
+                started = time.perf_counter()
+                autocomplete_service.get_suggestions_at(index, position, language)
+                lookups.append(time.perf_counter() - started)
+
+            colds = []
+            for _ in range(min(args.requests, 50)):
+                position = rng.randint(0, len(code))
+                started = time.perf_counter()
+                cold_state(language, code, position)
+                colds.append(time.perf_counter() - started)
+
+            label = f"{size_kb} KB" if size_kb < 1024 else f"{size_kb // 1024} MB"
+            print(f"{analyzer.name:>10} {label:>8} {statistics.median(lookups) * 1e6:>8.1f} "
+                  f"{percentile(lookups, 0.99) * 1e6:>8.1f} {statistics.median(colds) * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Autocomplete latency against document size, with and without the room index.
+
+For each size the document is indexed once, then every request makes a
+one-character edit at a random position (applied to the index, as the room
+would) and asks for suggestions at another. The rescan column is the old
+approach of splitting all text before the cursor on every request.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_autocomplete --requests 2000
+"""
+import argparse
+import random
+import statistics
+import string
+import time
+from typing import List
+
+from services.autocomplete_service import autocomplete_service
+from services.document_index import DocumentIndex
+
+SIZES_KB = (1, 10, 100, 1024)
+
+
+def build_document(size_kb: int, rng: random.Random) -> str:
+    lines: List[str] = []
+    size = 0
+    while size < size_kb * 1024:
+        name = "".join(rng.choices(string.ascii_lowercase, k=6))
+        block = [f"def {name}(value):", f"    {name}_result = value * 2"]
+        block += [f"    {'    ' * rng.randint(0, 2)}total = {name}_result + {rng.randint(0, 99)}"
+                  for _ in range(rng.randint(1, 8))]
+        block += [f"    return {name}_result", ""]
+        lines.extend(block)
+        size += sum(len(line) + 1 for line in block)
+    return "\n".join(lines)
+
+
+def rescan(code: str, position: int) -> bool:
+    # What every request used to do: copy and split everything before the cursor, twice
+    text_before_cursor = code[:position]
+    text_before_cursor.split("\n")[-1]
+    for line in reversed(text_before_cursor.split("\n")):
+        stripped = line.strip()
+        if stripped.startswith("def ") or stripped.startswith("class "):
+            return True
+        elif stripped and not line.startswith(" ") and not line.startswith("\t"):
+            break
+    return False
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per document size")
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'build ms':>9} {'edit us':>8} {'index p50 us':>13} {'index p99 us':>13} {'rescan p50 us':>14}")
+    for size_kb in SIZES_KB:
+        rng = random.Random(size_kb)
+        code = build_document(size_kb, rng)
+
+        started = time.perf_counter()
+        index = DocumentIndex(code)
+        build_time = time.perf_counter() - started
+
+        edits, lookups, rescans = [], [], []
+        for _ in range(args.requests):
+            position = rng.randint(0, len(index))
+            started = time.perf_counter()
+            index.apply([{"op": "insert", "pos": position, "text": rng.choice(string.ascii_lowercase)}])
+            edits.append(time.perf_counter() - started)
+
+            position = rng.randint(0, len(index))
+            started = time.perf_counter()
+            autocomplete_service.get_suggestions_at(index, position, "python")
+            lookups.append(time.perf_counter() - started)
+
+        for _ in range(min(args.requests, 200)):
+            position = rng.randint(0, len(code))
+            started = time.perf_counter()
+            rescan(code, position)
+            rescans.append(time.perf_counter() - started)
+
+        label = f"{size_kb} KB" if size_kb < 1024 else f"{size_kb // 1024} MB"
+        print(f"{label:>8} {build_time * 1000:>9.1f} {statistics.median(edits) * 1e6:>8.1f} "
+              f"{statistics.median(lookups) * 1e6:>13.1f} {percentile(lookups, 0.99) * 1e6:>13.1f} "
+              f"{statistics.median(rescans) * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
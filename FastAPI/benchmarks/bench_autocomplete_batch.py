@@ -0,0 +1,92 @@
+"""Per-position cost of POST /autocomplete/batch against one request per position.
+
+Starts a uvicorn worker with the result cache off, then for each batch
+size asks for suggestions at that many random positions in one document,
+once as a single batch and once as separate POST /autocomplete requests.
+The single requests upload the document and rescan it for every
+position; the batch uploads it once and scans it in one pass.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_autocomplete_batch --size-kb 100
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+from benchmarks.bench_analyzers import build_document
+from benchmarks.bench_backend import free_port, wait_for_port
+
+BATCH_SIZES = (1, 4, 16, 64, 256)
+
+
+def post(connection: http.client.HTTPConnection, path: str, body: dict):
+    connection.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    payload = response.read()
+    if response.status != 200:
+        raise RuntimeError(f"{path} returned {response.status}: {payload[:200]}")
+
+
+def time_batches(port: int, code: str, size: int, rounds: int, rng: random.Random):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    singles: List[float] = []
+    batches: List[float] = []
+    for _ in range(rounds):
+        positions = [rng.randint(0, len(code)) for _ in range(size)]
+
+        started = time.perf_counter()
+        for position in positions:
+            post(connection, "/autocomplete", {"code": code, "cursor_position": position, "language": "python"})
+        singles.append((time.perf_counter() - started) / size)
+
+        started = time.perf_counter()
+        post(connection, "/autocomplete/batch", {"code": code, "cursor_positions": positions, "language": "python"})
+        batches.append((time.perf_counter() - started) / size)
+    connection.close()
+    return statistics.median(singles), statistics.median(batches)
+
+
+async def main_async(args):
+    port = free_port()
+    env = {
+        **os.environ, "LOG_LEVEL": "WARNING", "ROOM_STORE_PATH": "", "AUTOCOMPLETE_CACHE_SIZE": "0",
+        "AUTOCOMPLETE_TIMEOUT": "30"
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], env=env
+    )
+    try:
+        await wait_for_port(port)
+        rng = random.Random(args.size_kb)
+        code = build_document("python", args.size_kb, rng)
+        print(f"{args.size_kb} KB document")
+        print(f"{'positions':>10} {'single ms/pos':>14} {'batch ms/pos':>13} {'speedup':>8}")
+        for size in BATCH_SIZES:
+            rounds = max(1, args.positions // size)
+            single, batch = await asyncio.get_running_loop().run_in_executor(
+                None, time_batches, port, code, size, rounds, rng
+            )
+            print(f"{size:>10} {single * 1000:>14.3f} {batch * 1000:>13.3f} {single / batch:>7.1f}x")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-kb", type=int, default=100, help="document size")
+    parser.add_argument("--positions", type=int, default=256, help="positions timed per batch size and mode")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
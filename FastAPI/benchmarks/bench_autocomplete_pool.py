@@ -0,0 +1,135 @@
+"""WebSocket broadcast latency while POST /autocomplete is saturated.
+
+For each pool setting a uvicorn worker is started with broadcast
+coalescing off. One client streams cursor positions to another every few
+milliseconds while several HTTP clients post expensive autocomplete
+requests (a large Python file whose docstrings force a full rescan)
+back to back. The table shows cursor latency before and during the
+flood, and what happened to the autocomplete requests.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_autocomplete_pool --size-kb 512 --clients 8
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List
+
+import websockets
+
+from benchmarks.bench_analyzers import build_document
+from benchmarks.bench_autocomplete import percentile
+from benchmarks.bench_backend import free_port, wait_for_port
+
+SETTINGS = (
+    ("inline", {"AUTOCOMPLETE_WORKERS": "0"}),
+    ("thread x2", {"AUTOCOMPLETE_POOL": "thread", "AUTOCOMPLETE_WORKERS": "2"}),
+    ("process x2", {"AUTOCOMPLETE_POOL": "process", "AUTOCOMPLETE_WORKERS": "2"}),
+)
+
+
+def flood(port: int, body: str, stop: threading.Event, latencies: List[float]):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    while not stop.is_set():
+        started = time.perf_counter()
+        connection.request("POST", "/autocomplete", body, {"Content-Type": "application/json"})
+        connection.getresponse().read()
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+
+
+async def cursor_latencies(port: int, room_id: str, duration: float, interval: float) -> List[float]:
+    async with websockets.connect(f"ws://127.0.0.1:{port}/ws/{room_id}/sender") as sender, \
+            websockets.connect(f"ws://127.0.0.1:{port}/ws/{room_id}/receiver") as receiver:
+        await sender.recv()
+        await receiver.recv()
+        sent: Dict[int, float] = {}
+        latencies: List[float] = []
+
+        async def receive():
+            async for raw in receiver:
+                frame = json.loads(raw)
+                if frame.get("type") == "cursor_position" and frame.get("position") in sent:
+                    latencies.append(time.perf_counter() - sent[frame["position"]])
+
+        task = asyncio.create_task(receive())
+        deadline = time.perf_counter() + duration
+        position = 0
+        while time.perf_counter() < deadline:
+            position += 1
+            sent[position] = time.perf_counter()
+            await sender.send(json.dumps({"type": "cursor_position", "position": position}))
+            await asyncio.sleep(interval)
+        await asyncio.sleep(0.5)
+        task.cancel()
+        return latencies
+
+
+def get_stats(port: int) -> dict:
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    connection.request("GET", "/stats")
+    stats = json.loads(connection.getresponse().read())
+    connection.close()
+    return stats
+
+
+async def run_setting(label: str, extra: Dict[str, str], body: str, args):
+    port = free_port()
+    env = {**os.environ, "LOG_LEVEL": "WARNING", "ROOM_STORE_PATH": "", "BROADCAST_TICK_MS": "0", **extra}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], env=env
+    )
+    try:
+        await wait_for_port(port)
+        idle = await cursor_latencies(port, "idle", args.duration / 2, args.interval)
+
+        stop = threading.Event()
+        request_latencies: List[float] = []
+        threads = [threading.Thread(target=flood, args=(port, body, stop, request_latencies))
+                   for _ in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        await asyncio.sleep(1.0)
+        loaded = await cursor_latencies(port, "loaded", args.duration, args.interval)
+        stop.set()
+        for thread in threads:
+            await asyncio.get_running_loop().run_in_executor(None, thread.join)
+
+        pool = (await asyncio.get_running_loop().run_in_executor(None, get_stats, port))["autocomplete_pool"]
+        print(f"{label:>11} {statistics.median(idle) * 1000:>9.2f} {percentile(idle, 0.99) * 1000:>9.2f} "
+              f"{statistics.median(loaded) * 1000:>11.2f} {percentile(loaded, 0.99) * 1000:>11.2f} "
+              f"{len(request_latencies):>9} {pool['completed']:>9} {pool['timed_out']:>9} {pool['shed']:>6}")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def main_async(args):
+    code = build_document("python", args.size_kb, random.Random(args.size_kb))
+    body = json.dumps({"code": code, "cursor_position": len(code), "language": "python"})
+    print(f"{'pool':>11} {'idle p50':>9} {'idle p99':>9} {'loaded p50':>11} {'loaded p99':>11} "
+          f"{'requests':>9} {'answered':>9} {'timed out':>9} {'shed':>6}   (cursor latency in ms)")
+    for label, extra in SETTINGS:
+        await run_setting(label, extra, body, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-kb", type=int, default=512, help="size of the document posted to /autocomplete")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent HTTP clients flooding /autocomplete")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of cursor traffic under load")
+    parser.add_argument("--interval", type=float, default=0.005, help="seconds between cursor messages")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
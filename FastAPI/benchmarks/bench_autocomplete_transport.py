@@ -0,0 +1,114 @@
+"""Autocomplete latency over the room WebSocket against POST /autocomplete.
+
+Starts a uvicorn worker, loads a document into a room, then times
+sequential requests both ways: the HTTP path uploads the whole document
+every time, the in-band path sends only the cursor and revision.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_autocomplete_transport --requests 200
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+import websockets
+
+from benchmarks.bench_autocomplete import build_document, percentile
+from benchmarks.bench_backend import free_port, wait_for_port
+
+SIZES_KB = (1, 10, 100, 1024)
+
+
+def room_revision(port: int, room_id: str) -> int:
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    connection.request("GET", f"/rooms/{room_id}")
+    revision = json.loads(connection.getresponse().read())["revision"]
+    connection.close()
+    return revision
+
+
+def time_http(port: int, code: str, positions: List[int]) -> List[float]:
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    latencies = []
+    for position in positions:
+        body = json.dumps({"code": code, "cursor_position": position, "language": "python"})
+        started = time.perf_counter()
+        connection.request("POST", "/autocomplete", body, {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+    return latencies
+
+
+async def time_websocket(port: int, room_id: str, code: str, positions: List[int]) -> List[float]:
+    async with websockets.connect(f"ws://127.0.0.1:{port}/ws/{room_id}/bench", max_size=None) as connection:
+        json.loads(await connection.recv())
+        await connection.send(json.dumps({"type": "code_change", "code": code}))
+        revision = 0
+        while not revision:
+            # The replace isn't echoed to its author, so wait for it to show up on the room
+            await asyncio.sleep(0.05)
+            revision = await asyncio.get_running_loop().run_in_executor(None, room_revision, port, room_id)
+
+        latencies = []
+        for request_id, position in enumerate(positions):
+            started = time.perf_counter()
+            await connection.send(json.dumps({
+                "type": "autocomplete_request",
+                "request_id": request_id,
+                "position": position,
+                "revision": revision,
+                "language": "python"
+            }))
+            while True:
+                frame = json.loads(await connection.recv())
+                if frame["type"] == "autocomplete_response" and frame["request_id"] == request_id:
+                    break
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+
+async def main_async(requests: int):
+    port = free_port()
+    env = {**os.environ, "LOG_LEVEL": "WARNING", "ROOM_STORE_PATH": ""}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], env=env
+    )
+    try:
+        await wait_for_port(port)
+        print(f"{'size':>8} {'http p50 ms':>12} {'http p99 ms':>12} {'ws p50 ms':>10} {'ws p99 ms':>10}")
+        for size_kb in SIZES_KB:
+            rng = random.Random(size_kb)
+            code = build_document(size_kb, rng)
+            positions = [rng.randint(0, len(code)) for _ in range(requests)]
+
+            http_latencies = await asyncio.get_running_loop().run_in_executor(None, time_http, port, code, positions)
+            ws_latencies = await time_websocket(port, f"bench{size_kb}", code, positions)
+
+            label = f"{size_kb} KB" if size_kb < 1024 else f"{size_kb // 1024} MB"
+            print(f"{label:>8} {statistics.median(http_latencies) * 1000:>12.2f} "
+                  f"{percentile(http_latencies, 0.99) * 1000:>12.2f} "
+                  f"{statistics.median(ws_latencies) * 1000:>10.2f} {percentile(ws_latencies, 0.99) * 1000:>10.2f}")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per document size and transport")
+    args = parser.parse_args()
+    asyncio.run(main_async(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Cross-worker edit propagation through the Redis backend.
+
+Starts the in-process fake Redis, runs N uvicorn workers against it with
+ROOM_BACKEND=redis, and connects one client per worker to the same room.
+Every client types concurrently; the run checks that all workers converge
+on the same document and reports how long edits take to reach a client on
+another worker.
+
+The room log is compacted every few entries, and halfway through every
+pub/sub connection is dropped, so the workers have to reconnect and catch
+up on what they missed. At the end a late client joins through a worker
+started after the log was trimmed, so its replica has to be rebuilt from
+the room's snapshot, and its sync has to match the document everyone else
+ended up with.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_backend --workers 2 --edits 200 --compact-every 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import websockets
+
+from backends.fake_redis import FakeRedisServer
+from benchmarks.ot_client import OTClient
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_port(port: int, timeout: float = 15.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise TimeoutError(f"Worker on port {port} did not start")
+
+
+async def run_client(port: int, room_id: str, user_id: str, edits: int, latencies: List[float],
+                     documents: Dict[str, str], start: asyncio.Event, finished: asyncio.Event):
+    async with websockets.connect(f"ws://127.0.0.1:{port}/ws/{room_id}/{user_id}") as connection:
+        sync = json.loads(await connection.recv())
+        client = OTClient(sync["code"], sync["revision"])
+        await start.wait()
+
+        async def send(pending):
+            if pending:
+                revision, ops = pending
+                await connection.send(json.dumps({"type": "code_delta", "revision": revision, "ops": ops}))
+
+        async def receive():
+            async for raw in connection:
+                frame = json.loads(raw)
+                for message in frame.get("messages", [frame]):
+                    if message["type"] == "code_delta":
+                        client.remote(message["revision"], message["ops"])
+                        for op in message["ops"]:
+                            stamp = op.get("text", "").split("@")
+                            if len(stamp) == 2:
+                                latencies.append(time.time() - float(stamp[1].rstrip("|")))
+                    elif message["type"] == "code_delta_ack":
+                        await send(client.ack(message["revision"]))
+                    elif message["type"] == "sync":
+                        client.sync(message["code"], message["revision"])
+
+        receiver = asyncio.create_task(receive())
+        for _ in range(edits):
+            # Everyone types at the start of the document, the worst case for conflicts
+            await send(client.local([{"op": "insert", "pos": 0, "text": f"|{user_id}@{time.time()!r}|"}]))
+            await asyncio.sleep(0.005)
+
+        await finished.wait()
+        while client.outstanding:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.5)
+        receiver.cancel()
+        documents[user_id] = str(client.document)
+
+
+async def main_async(workers: int, edits: int, compact_every: int):
+    redis = FakeRedisServer()
+    redis_port = await redis.start()
+    # Replicas come from Redis alone, not from a room store shared between workers
+    env = {**os.environ, "ROOM_BACKEND": "redis", "REDIS_URL": f"redis://127.0.0.1:{redis_port}/0",
+           "LOG_LEVEL": "WARNING", "REDIS_LOG_COMPACT_EVERY": str(compact_every), "ROOM_STORE_PATH": ""}
+
+    def start_worker(port: int) -> subprocess.Popen:
+        return subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], env=env
+        )
+
+    ports = [free_port() for _ in range(workers)]
+    processes = [start_worker(port) for port in ports]
+    try:
+        for port in ports:
+            await wait_for_port(port)
+
+        latencies: List[float] = []
+        documents: Dict[str, str] = {}
+        start, finished = asyncio.Event(), asyncio.Event()
+        clients = [
+            asyncio.create_task(run_client(port, "bench", f"user{index}", edits, latencies, documents, start, finished))
+            for index, port in enumerate(ports)
+        ]
+        await asyncio.sleep(0.5)
+        started = time.perf_counter()
+        start.set()
+        await asyncio.sleep(edits * 0.005 / 2)
+        dropped = redis.drop_subscribers()
+        await asyncio.sleep(edits * 0.005 / 2 + 1.0)
+        finished.set()
+        await asyncio.gather(*clients)
+        elapsed = time.perf_counter() - started
+
+        late_port = free_port()
+        processes.append(start_worker(late_port))
+        await wait_for_port(late_port)
+        async with websockets.connect(f"ws://127.0.0.1:{late_port}/ws/bench/late") as connection:
+            late = json.loads(await connection.recv())
+        converged = len(set(documents.values())) == 1 and late["code"] in documents.values()
+        log = redis.lists.get(b"room:bench:log", [])
+        print(f"{workers} workers, {edits} edits per client in {elapsed:.1f}s, converged: {converged} "
+              f"(late joiner included, {dropped} subscriber connections dropped halfway)")
+        print(f"room log: {len(log)} entries kept of {late['revision']}, compacting every {compact_every}")
+        if latencies:
+            ordered = sorted(latencies)
+            print(f"cross-client latency ms: p50 {statistics.median(ordered) * 1000:.2f} "
+                  f"p99 {ordered[int(len(ordered) * 0.99) - 1] * 1000:.2f} ({len(ordered)} samples)")
+        if not converged:
+            sys.exit(1)
+    finally:
+        # Keep the loop (and the fake Redis) running while the workers shut down
+        for process in processes:
+            process.terminate()
+            await asyncio.get_running_loop().run_in_executor(None, process.wait)
+        await redis.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--edits", type=int, default=200, help="edits per client")
+    parser.add_argument("--compact-every", type=int, default=50, help="log entries between room snapshots")
+    args = parser.parse_args()
+    asyncio.run(main_async(args.workers, args.edits, args.compact_every))
+
+
+if __name__ == "__main__":
+    main()
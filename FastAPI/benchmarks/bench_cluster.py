@@ -0,0 +1,228 @@
+"""Room-sharded cluster: hash ring balance, proxy cost and live room migration.
+
+First checks how evenly the consistent hash ring spreads rooms over the
+workers and how many rooms change owner when a worker is added. Then
+starts a real supervisor with worker processes and has clients type into
+rooms through it with the delta protocol. Halfway through, the busiest
+room is moved to another worker while its clients keep typing. Every
+client types its own letter, so at the end the room document must hold
+exactly as many of each letter as that client typed: no edit dropped and
+none applied twice. Reports edit ack latency through the supervisor, the
+same straight to the worker's socket, the migration time and the worst
+latency of an edit caught by the move.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_cluster --workers 2 --clients 4 --rate 10 --seconds 6
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import tempfile
+import time
+from collections import Counter
+from typing import List, Optional
+
+# Workers inherit the environment: a shared room store, no autocomplete pool, quiet logs
+os.environ.setdefault("ROOM_STORE_PATH", os.path.join(tempfile.mkdtemp(prefix="bench-cluster-"), "rooms.db"))
+os.environ.setdefault("AUTOCOMPLETE_WORKERS", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("REBALANCE_INTERVAL", "0")
+
+import websockets
+
+from benchmarks.ot_client import OTClient
+from cluster.ring import HashRing
+from cluster.supervisor import Supervisor
+from websocket.connection_manager import MOVED_CLOSE_CODE
+
+
+def check_ring(workers: int, vnodes: int, rooms: int):
+    room_ids = [f"room-{index}" for index in range(rooms)]
+    ring = HashRing(workers, vnodes)
+    owners = [ring.home(room_id) for room_id in room_ids]
+    counts = Counter(owners)
+    mean = rooms / workers
+    grown = HashRing(workers + 1, vnodes)
+    moved = sum(1 for room_id, owner in zip(room_ids, owners) if grown.home(room_id) != owner)
+
+    started = time.perf_counter()
+    for room_id in room_ids:
+        ring.owner(room_id)
+    lookup_ns = (time.perf_counter() - started) / rooms * 1e9
+    print(f"{rooms} rooms on {workers} workers, {vnodes} points each: "
+          f"busiest {max(counts.values()) / mean:.2f}x the mean, quietest {min(counts.values()) / mean:.2f}x, "
+          f"{lookup_ns:.0f} ns per lookup")
+    print(f"adding a worker moves {moved / rooms:.1%} of rooms (ideal {1 / (workers + 1):.1%})")
+
+
+class Typist:
+    """One client typing its own letter into a room, following it across moves."""
+
+    def __init__(self, name: str, letter: str, rng: random.Random):
+        self.name = name
+        self.letter = letter
+        self.rng = rng
+        self.client = OTClient()
+        self.epoch: Optional[str] = None
+        self.typed = 0
+        self.latencies: List[float] = []
+        self.sent_at: Optional[float] = None
+        self.moves = 0
+        self.throttled = 0
+        self.syncs = 0
+
+    def url(self, base: str, room_id: str) -> str:
+        url = f"{base}/ws/{room_id}/{self.name}"
+        if self.epoch is not None:
+            url += f"?revision={self.client.revision}&epoch={self.epoch}"
+        return url
+
+    async def run(self, base: str, room_id: str, edits: int, rate: float, unix_path: str = None):
+        while True:
+            if unix_path is not None:
+                connection = websockets.unix_connect(unix_path, self.url("ws://worker", room_id))
+            else:
+                connection = websockets.connect(self.url(base, room_id))
+            async with connection as ws:
+                typing = asyncio.create_task(self._type(ws, edits, rate))
+                try:
+                    async for frame in ws:
+                        message = json.loads(frame)
+                        for entry in message.get("messages", [message]):
+                            await self._handle(ws, entry)
+                        if self.typed >= edits and self._settled():
+                            await ws.close()
+                except websockets.ConnectionClosed:
+                    pass
+                finally:
+                    typing.cancel()
+            if ws.close_code == MOVED_CLOSE_CODE:
+                self.moves += 1
+                continue
+            if self.typed >= edits and self._settled():
+                return
+            raise RuntimeError(f"{self.name} disconnected with {ws.close_code} ({ws.close_reason})")
+
+    def _settled(self) -> bool:
+        return self.client.outstanding is None and not self.client.buffer
+
+    async def _send(self, ws, pending):
+        if pending is not None:
+            revision, ops = pending
+            if self.sent_at is None:
+                self.sent_at = time.perf_counter()
+            await ws.send(json.dumps({"type": "code_delta", "revision": revision, "ops": ops}))
+
+    async def _type(self, ws, edits: int, rate: float):
+        while self.typed < edits:
+            await asyncio.sleep(1 / rate)
+            position = self.rng.randint(0, len(self.client.document))
+            self.typed += 1
+            await self._send(ws, self.client.local([{"op": "insert", "pos": position, "text": self.letter}]))
+
+    async def _handle(self, ws, message: dict):
+        kind = message.get("type")
+        if kind == "sync":
+            self.syncs += 1
+            self.client.sync(message["code"], message["revision"])
+            self.epoch = message["epoch"]
+            if self.syncs > 1:
+                raise RuntimeError(f"{self.name} fell back to a full sync and lost its local edits")
+        elif kind == "resume":
+            await self._send(ws, self.client.resume(message["revision"], message["ops"]))
+        elif kind == "code_delta":
+            self.client.remote(message["revision"], message["ops"])
+        elif kind == "code_delta_ack":
+            self.latencies.append(time.perf_counter() - self.sent_at)
+            self.sent_at = None
+            await self._send(ws, self.client.ack(message["revision"]))
+        elif kind == "room_moved":
+            self.client.moved(message["revision"])
+            self.epoch = message["epoch"]
+        elif kind == "throttled":
+            self.throttled += 1
+        elif kind == "ping":
+            await ws.send(json.dumps({"type": "pong"}))
+
+
+async def fetch_room(port: int, room_id: str) -> dict:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET /rooms/{room_id} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.partition(b"\r\n\r\n")[2])
+
+
+def summarize(typists: List[Typist]) -> str:
+    latencies = sorted(latency for typist in typists for latency in typist.latencies)
+    return (f"p50 {statistics.median(latencies) * 1000:.2f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms, "
+            f"max {latencies[-1] * 1000:.1f} ms over {len(latencies)} acks")
+
+
+async def run_cluster(args):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    supervisor = Supervisor(args.workers, "127.0.0.1", port, "bench-token", args.vnodes, 0, 1.5)
+    await supervisor.start()
+    base = f"ws://127.0.0.1:{port}"
+    edits = int(args.rate * args.seconds)
+    try:
+        # Straight to the owner's socket, then the same through the supervisor
+        for label, unix in (("direct to worker", True), ("through supervisor", False)):
+            room_id = f"latency-{label[0]}"
+            path = supervisor.workers[supervisor.ring.owner(room_id)].socket_path if unix else None
+            typists = [Typist(f"u{index}", chr(ord("a") + index), random.Random(index)) for index in range(args.clients)]
+            await asyncio.gather(*(typist.run(base, room_id, edits // 2, args.rate, path) for typist in typists))
+            print(f"{label:<20} {summarize(typists)}")
+
+        # A hot room and a few quiet ones, the hot one moved while everyone types
+        hot = "hot-room"
+        typists = [Typist(f"u{index}", chr(ord("A") + index), random.Random(index)) for index in range(args.clients)]
+        quiet = [Typist(f"q{index}", "q", random.Random(100 + index)) for index in range(args.workers)]
+        tasks = [asyncio.create_task(typist.run(base, hot, edits, args.rate)) for typist in typists]
+        tasks += [asyncio.create_task(typist.run(base, f"quiet-{index}", edits, args.rate / 2))
+                  for index, typist in enumerate(quiet)]
+        await asyncio.sleep(args.seconds / 2)
+        source = supervisor.ring.owner(hot)
+        result = await supervisor.migrate(hot)
+        await asyncio.gather(*tasks)
+
+        room = await fetch_room(port, hot)
+        counts = Counter(room["code"])
+        missing = {typist.letter: typist.typed - counts[typist.letter]
+                   for typist in typists if counts[typist.letter] != typist.typed}
+        print(f"moved {hot} from worker {source} to worker {result['to']} at revision {result['revision']} "
+              f"in {result['ms']:.1f} ms; {sum(typist.moves for typist in typists)} reconnects")
+        print(f"{'hot room':<20} {summarize(typists)}")
+        print(f"{'quiet rooms':<20} {summarize(quiet)}")
+        print(f"document: {len(room['code'])} chars at revision {room['revision']}, "
+              f"{sum(typist.typed for typist in typists)} typed, "
+              f"{'every edit applied once' if not missing else f'MISMATCH {missing}'}; "
+              f"{sum(typist.throttled for typist in typists)} throttled")
+        print(f"supervisor: {json.dumps(supervisor.get_status()['workers'])}")
+    finally:
+        await supervisor.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--vnodes", type=int, default=64, help="hash ring points per worker")
+    parser.add_argument("--clients", type=int, default=4, help="typists in the room that is moved")
+    parser.add_argument("--rate", type=float, default=10.0, help="edits per second per typist")
+    parser.add_argument("--seconds", type=float, default=6.0)
+    args = parser.parse_args()
+
+    for workers in (args.workers, 4, 8):
+        check_ring(workers, args.vnodes, 100000)
+    print()
+    asyncio.run(run_cluster(args))
+
+
+if __name__ == "__main__":
+    main()
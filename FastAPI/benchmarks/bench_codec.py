@@ -0,0 +1,90 @@
+"""Encode/decode cost of the available codecs on realistic room traffic.
+
+The traffic mix is mostly small deltas, cursor updates and batch frames,
+plus the occasional full sync of a large document, which dominates CPU.
+Codecs whose library isn't installed are skipped.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_codec --doc-kb 200 --iterations 2000
+"""
+import argparse
+import json
+import random
+import string
+import time
+from typing import Callable, Dict, List, Tuple
+
+from websocket import codec as codecs
+
+
+def build_traffic(doc_kb: int, count: int) -> List[dict]:
+    rng = random.Random(0)
+    lines = []
+    while sum(len(line) + 1 for line in lines) < doc_kb * 1024:
+        indent = "    " * rng.randint(0, 3)
+        lines.append(indent + " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+                                       for _ in range(rng.randint(2, 8))))
+    document = "\n".join(lines)
+    users = [f"user{i}" for i in range(6)]
+
+    delta = lambda revision: {
+        "type": "code_delta",
+        "ops": [{"op": "insert", "pos": rng.randint(0, len(document)), "text": rng.choice(string.ascii_letters)}],
+        "revision": revision,
+        "user_id": rng.choice(users)
+    }
+    cursor = lambda: {"type": "cursor_position", "position": rng.randint(0, len(document)), "user_id": rng.choice(users)}
+
+    traffic = []
+    for index in range(count):
+        roll = rng.random()
+        if index % 200 == 0:
+            traffic.append({"type": "sync", "code": document, "users": users, "revision": index})
+        elif roll < 0.5:
+            traffic.append(delta(index))
+        elif roll < 0.8:
+            traffic.append(cursor())
+        else:
+            traffic.append({"type": "batch", "messages": [delta(index), cursor(), cursor()]})
+    return traffic
+
+
+def available_codecs() -> Dict[str, Tuple[Callable, Callable]]:
+    found = {"json/stdlib": (json.dumps, json.loads)}
+    if codecs.orjson is not None:
+        found["json/orjson"] = (lambda message: codecs.orjson.dumps(message).decode(), codecs.orjson.loads)
+    if codecs.msgspec is not None:
+        encoder = codecs.msgspec.json.Encoder()
+        found["json/msgspec"] = (lambda message: encoder.encode(message).decode(), codecs.msgspec.json.decode)
+    if codecs.msgpack is not None:
+        found["msgpack"] = (codecs.msgpack.packb, codecs.msgpack.unpackb)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doc-kb", type=int, default=100, help="size of the document in sync frames")
+    parser.add_argument("--iterations", type=int, default=2000, help="messages in the traffic mix")
+    args = parser.parse_args()
+
+    traffic = build_traffic(args.doc_kb, args.iterations)
+    print(f"{len(traffic)} messages, {args.doc_kb} KB document, active codec: {codecs.json_codec.name}")
+    print(f"{'codec':<14} {'encode us/msg':>14} {'decode us/msg':>14} {'bytes/msg':>10}")
+
+    for name, (encode, decode) in available_codecs().items():
+        started = time.perf_counter()
+        payloads = [encode(message) for message in traffic]
+        encode_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for payload in payloads:
+            decode(payload)
+        decode_time = time.perf_counter() - started
+
+        size = sum(len(payload.encode() if isinstance(payload, str) else payload) for payload in payloads)
+        print(f"{name:<14} {encode_time / len(traffic) * 1e6:>14.2f} "
+              f"{decode_time / len(traffic) * 1e6:>14.2f} {size / len(traffic):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Fan-out latency to healthy peers while one peer is throttled.
+
+Compares the old serial broadcast (await each send in turn) with the
+per-connection outbound queues in ConnectionManager. With queues, latency to
+healthy peers should stay flat no matter how slow the throttled peer is.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_fanout --peers 50 --messages 200 --throttle-ms 20
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List
+
+from websocket.connection_manager import ConnectionManager
+
+
+class FakeWebSocket:
+
+    def __init__(self, latencies: List[float], delay: float = 0.0):
+        self.latencies = latencies
+        self.delay = delay
+        self.scope = {}
+
+    async def accept(self, subprotocol: str = None):
+        pass
+
+    async def close(self, code: int = 1000, reason: str = None):
+        pass
+
+    async def send_text(self, data: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        else:
+            # Real sends yield to the event loop too
+            await asyncio.sleep(0)
+        self.latencies.append(time.perf_counter() - json.loads(data)["sent_at"])
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def serial_broadcast(connections: List[FakeWebSocket], message: dict):
+    # The pre-queue ConnectionManager.broadcast_to_room loop
+    message_str = json.dumps(message)
+    for connection in connections:
+        await connection.send_text(message_str)
+
+
+async def run(mode: str, peers: int, messages: int, throttle: float, interval: float) -> List[float]:
+    healthy: List[float] = []
+    slow: List[float] = []
+    connections = [FakeWebSocket(healthy) for _ in range(peers - 1)]
+    if throttle:
+        # Put the slow peer first so a serial loop always waits on it
+        connections.insert(0, FakeWebSocket(slow, throttle))
+
+    manager = ConnectionManager()
+    manager.scheduler.tick = 0
+    room_id = "bench"
+    if mode == "queued":
+        for index, connection in enumerate(connections):
+            await manager.connect(connection, room_id, f"user{index}")
+
+    pending = []
+    for _ in range(messages):
+        message = {"type": "code_delta", "ops": [], "revision": 0, "sent_at": time.perf_counter()}
+        if mode == "queued":
+            await manager.broadcast_to_room(room_id, message)
+        else:
+            # Incoming messages are handled one after another, so broadcasts can't overlap
+            await serial_broadcast(connections, message)
+        pending.append(message)
+        await asyncio.sleep(interval)
+
+    # Let healthy writers drain
+    deadline = time.perf_counter() + 5
+    while len(healthy) < len(pending) * (peers - (1 if throttle else 0)) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+
+    for session in list(manager.sessions.values()):
+        manager.disconnect(session.websocket, room_id, session.user_id)
+    return healthy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peers", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--throttle-ms", type=float, default=20.0, help="per-send delay of the slow peer")
+    parser.add_argument("--interval-ms", type=float, default=2.0, help="gap between broadcasts")
+    args = parser.parse_args()
+
+    print(f"{args.peers} peers, {args.messages} broadcasts, slow peer {args.throttle_ms} ms/send")
+    print(f"{'mode':<8} {'slow peer':<10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for mode in ("serial", "queued"):
+        for throttle in (0.0, args.throttle_ms / 1000):
+            latencies = asyncio.run(run(mode, args.peers, args.messages, throttle, args.interval_ms / 1000))
+            print(f"{mode:<8} {'yes' if throttle else 'no':<10} "
+                  f"{statistics.median(latencies) * 1000:>8.2f} "
+                  f"{percentile(latencies, 0.99) * 1000:>8.2f} "
+                  f"{max(latencies) * 1000:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Per-tick cost of the heartbeat timer wheel against scanning every connection.
+
+Drives HeartbeatWheel on a simulated clock with tens of thousands of
+sessions, some of which keep sending frames. Each tick only visits the
+sessions due then, so its cost follows connections / interval instead of
+the total count. The scan is what a per-tick loop over every session
+would cost.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_heartbeat --connections 10000,50000 --active 0.5
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import List
+
+from websocket.heartbeat import HEARTBEAT_TICK, HeartbeatWheel
+from websocket.session import Session
+
+
+def run(connections: int, active: float, interval: float, timeout: float, seconds: int):
+    pinged: List[Session] = []
+    expired: List[Session] = []
+    wheel = HeartbeatWheel(interval, timeout, HEARTBEAT_TICK, pinged.append, expired.append)
+    wheel.started_at = 0.0
+
+    sessions = [Session(None, f"room{index // 4}", f"user{index}", None) for index in range(connections)]
+    rng = random.Random(1)
+    for session in sessions:
+        # Spread the initial stamps so connections don't all come due in the same tick
+        session.last_seen = -rng.uniform(0, interval)
+        # Clients that answer JSON pings, so the idle ones are reaped
+        session.answers_pings = True
+        wheel.add(session)
+    talkers = sessions[:int(connections * active)]
+
+    tick_times, scan_times = [], []
+    for second in range(1, seconds + 1):
+        now = float(second)
+        for session in talkers:
+            session.last_seen = now - rng.random()
+
+        started = time.perf_counter()
+        wheel.advance(now)
+        tick_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        overdue = 0
+        for session in sessions:
+            if now - session.last_seen >= interval:
+                overdue += 1
+        scan_times.append(time.perf_counter() - started)
+
+        # Dead connections answer with a disconnect, like the receive loop would
+        for session in expired:
+            wheel.remove(session)
+        expired.clear()
+
+    return tick_times, scan_times, len(pinged), wheel.expired
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", default="10000,50000,100000", help="comma-separated connection counts")
+    parser.add_argument("--active", type=float, default=0.5, help="share of connections sending frames every tick")
+    parser.add_argument("--interval", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seconds", type=int, default=120, help="simulated seconds")
+    args = parser.parse_args()
+
+    print(f"{args.active:.0%} active, ping after {args.interval:g}s idle, reap after {args.timeout:g}s")
+    print(f"{'connections':>11} {'wheel mean ms':>14} {'wheel max ms':>13} {'scan mean ms':>13} "
+          f"{'pings':>8} {'reaped':>8}")
+    for connections in (int(value) for value in args.connections.split(",")):
+        ticks, scans, pings, reaped = run(connections, args.active, args.interval, args.timeout, args.seconds)
+        print(f"{connections:>11} {statistics.fmean(ticks) * 1000:>14.3f} {max(ticks) * 1000:>13.3f} "
+              f"{statistics.fmean(scans) * 1000:>13.3f} {pings:>8} {reaped:>8}")
+
+
+if __name__ == "__main__":
+    main()
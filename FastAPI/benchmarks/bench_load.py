@@ -0,0 +1,590 @@
+"""Load test of the WebSocket editing and in-band autocomplete paths.
+
+Serves the app from create_app() in this process on a free port and
+drives simulated clients from separate client processes, so the server's
+CPU and memory can be measured on their own. Each room is seeded with a
+document of the given size. Typists insert (and now and then delete) one
+character at a time through the code_delta protocol, and every client
+asks for autocomplete at its own rate.
+
+Edit propagation latency is measured from the moment a code_delta is
+sent until a peer receives the broadcast for it. Rooms are never split
+across client processes, so both ends of an edit are timed with the
+same clock. Runs sweep every combination of the comma-separated room
+sizes, typing rates and document sizes. Results go to a JSON file, and
+--baseline prints the change against an earlier one.
+
+Room sizes above MAX_ROOM_SIZE need that raised in the environment.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_load --clients 2000 --room-size 2,8 --typing-rate 4 --doc-size 2000,50000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+# Keep the server quiet and its rooms in memory unless told otherwise
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("ROOM_STORE_PATH", "")
+
+import websockets
+
+from benchmarks.ot_client import OTClient
+
+# Handshakes in progress at once in each client process
+CONNECT_CONCURRENCY = 64
+
+# Share of keystrokes that delete a character instead of typing one
+DELETE_FRACTION = 0.1
+
+# Client processes above this CPU share were probably the bottleneck, not the server
+SATURATED_PERCENT = 90
+
+LINE = "    result = compute_value(items, index) + offset  # keep going\n"
+
+# (room id, user ids, how many of them type)
+RoomPlan = Tuple[str, List[str], int]
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """Summary of latencies in seconds, in milliseconds."""
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "max": None, "mean": None, "samples": 0}
+    ordered = sorted(values)
+
+    def at(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 3)
+
+    return {
+        "p50": at(0.5),
+        "p90": at(0.9),
+        "p99": at(0.99),
+        "max": round(ordered[-1] * 1000, 3),
+        "mean": round(statistics.fmean(ordered) * 1000, 3),
+        "samples": len(ordered)
+    }
+
+
+def make_document(size: int) -> str:
+    return (LINE * (size // len(LINE) + 1))[:size]
+
+
+def cpu_seconds(pid: int) -> Optional[float]:
+    """User plus system CPU time of a process, where /proc is available."""
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            # utime and stime are the 14th and 15th fields, counted from after the command name
+            fields = stat.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def own_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak rather than current size, but better than nothing off Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def raise_file_limit():
+    # Every simulated client holds one socket in a client process and one in the server
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+class ClientProcess:
+    """The simulated clients of one client process.
+
+    Clients connect, wait for the measurement window, then type and ask
+    for autocomplete until it ends. Senders record when the edit that
+    became each revision was sent and receivers record when it arrived;
+    the two are joined once everything has stopped.
+    """
+
+    def __init__(self, uri: str, rooms: List[RoomPlan], typing_rate: float, autocomplete_rate: float):
+        self.uri = uri
+        self.rooms = rooms
+        self.typing_rate = typing_rate
+        self.autocomplete_rate = autocomplete_rate
+        self.window = (0.0, 0.0)
+        self.expected = sum(len(users) for _, users, _ in rooms)
+        self.connected = 0
+        self.failed = 0
+        self.ready = asyncio.Event()
+        self.go = asyncio.Event()
+        self.limiter = asyncio.Semaphore(CONNECT_CONCURRENCY)
+        # (room, revision) -> when the edit that became that revision was sent
+        self.sent_at: Dict[Tuple[str, int], float] = {}
+        # (room, revision, when a peer received it)
+        self.received: List[Tuple[str, int, float]] = []
+        self.autocomplete: List[float] = []
+        self.edits_sent = 0
+        self.autocomplete_sent = 0
+        self.frames_received = 0
+        self.resyncs = 0
+        self.errors: List[str] = []
+
+    async def run(self, control) -> dict:
+        clients = [
+            asyncio.create_task(self.run_client(room_id, user_id, index < typists))
+            for room_id, users, typists in self.rooms
+            for index, user_id in enumerate(users)
+        ]
+        if self.expected:
+            await self.ready.wait()
+        control.report({"connected": self.connected, "failed": self.failed})
+
+        self.window = await asyncio.get_running_loop().run_in_executor(None, control.wait)
+        cpu_started, wall_started = own_cpu_seconds(), time.monotonic()
+        self.go.set()
+        await asyncio.gather(*clients, return_exceptions=True)
+        return self.summary(own_cpu_seconds() - cpu_started, time.monotonic() - wall_started)
+
+    async def run_client(self, room_id: str, user_id: str, typist: bool):
+        try:
+            async with self.limiter:
+                connection = await websockets.connect(
+                    f"{self.uri}/ws/{room_id}/{user_id}", ping_interval=None, max_size=None, compression=None
+                )
+                sync = json.loads(await connection.recv())
+        except Exception as e:
+            self.errors.append(f"connect {room_id}/{user_id}: {e!r}")
+            self._settle(False)
+            return
+        self._settle(True)
+
+        client = OTClient(sync["code"], sync["revision"])
+        rng = random.Random(f"{room_id}/{user_id}")
+        in_flight: List[Optional[float]] = [None]
+        requests: Dict[int, float] = {}
+
+        async def send(pending):
+            if pending:
+                revision, ops = pending
+                in_flight[0] = time.monotonic()
+                await connection.send(json.dumps({"type": "code_delta", "revision": revision, "ops": ops}))
+                self.edits_sent += 1
+
+        async def receive():
+            async for raw in connection:
+                now = time.monotonic()
+                self.frames_received += 1
+                frame = json.loads(raw)
+                for message in frame.get("messages", [frame]):
+                    kind = message["type"]
+                    if kind == "code_delta":
+                        client.remote(message["revision"], message["ops"])
+                        self.received.append((room_id, message["revision"], now))
+                    elif kind == "code_delta_ack":
+                        sent = in_flight[0]
+                        if sent is not None and self.window[0] <= sent < self.window[1]:
+                            self.sent_at[(room_id, message["revision"])] = sent
+                        in_flight[0] = None
+                        await send(client.ack(message["revision"]))
+                    elif kind == "autocomplete_response":
+                        started = requests.pop(message.get("request_id"), None)
+                        if started is not None and started >= self.window[0]:
+                            self.autocomplete.append(now - started)
+                    elif kind == "sync":
+                        self.resyncs += 1
+                        client.sync(message["code"], message["revision"])
+                    elif kind == "code_change":
+                        client.sync(message["code"], message["revision"])
+
+        async def type_keys():
+            while time.monotonic() < self.window[1]:
+                # Poisson arrivals, so typists in a room don't fall into lockstep
+                await asyncio.sleep(rng.expovariate(self.typing_rate))
+                length = len(client.document)
+                position = rng.randint(0, length)
+                if length and rng.random() < DELETE_FRACTION:
+                    ops = [{"op": "delete", "pos": min(position, length - 1), "length": 1}]
+                else:
+                    ops = [{"op": "insert", "pos": position, "text": rng.choice("abcdefghij_ ()\n")}]
+                await send(client.local(ops))
+
+        async def request_autocomplete():
+            request_id = 0
+            while time.monotonic() < self.window[1]:
+                await asyncio.sleep(rng.expovariate(self.autocomplete_rate))
+                request_id += 1
+                requests[request_id] = time.monotonic()
+                await connection.send(json.dumps({
+                    "type": "autocomplete_request",
+                    "request_id": request_id,
+                    "position": rng.randint(0, len(client.document)),
+                    "revision": client.revision,
+                    "language": "python"
+                }))
+                self.autocomplete_sent += 1
+
+        receiver = asyncio.create_task(receive())
+        try:
+            await self.go.wait()
+            actors = []
+            if typist and self.typing_rate > 0:
+                actors.append(type_keys())
+            if self.autocomplete_rate > 0:
+                actors.append(request_autocomplete())
+            await asyncio.gather(*actors)
+            # Give the last edits time to reach every peer
+            await asyncio.sleep(1.0)
+        except websockets.ConnectionClosed as e:
+            self.errors.append(f"closed {room_id}/{user_id}: {e!r}")
+        finally:
+            receiver.cancel()
+            await connection.close()
+
+    def summary(self, cpu: float, wall: float) -> dict:
+        latencies = []
+        for room_id, revision, received_at in self.received:
+            sent_at = self.sent_at.get((room_id, revision))
+            if sent_at is not None:
+                latencies.append(received_at - sent_at)
+        peers = {room_id: len(users) - 1 for room_id, users, _ in self.rooms}
+        return {
+            "latencies": latencies,
+            "autocomplete": self.autocomplete,
+            "edits_sent": self.edits_sent,
+            "edits_measured": len(self.sent_at),
+            "deliveries": len(latencies),
+            "expected_deliveries": sum(peers[room_id] for room_id, _ in self.sent_at),
+            "autocomplete_sent": self.autocomplete_sent,
+            "frames_received": self.frames_received,
+            "resyncs": self.resyncs,
+            "errors": self.errors[:10],
+            "error_count": len(self.errors),
+            "cpu_percent": round(cpu / wall * 100, 1) if wall else 0.0
+        }
+
+    def _settle(self, ok: bool):
+        if ok:
+            self.connected += 1
+        else:
+            self.failed += 1
+        if self.connected + self.failed == self.expected:
+            self.ready.set()
+
+
+class Control:
+    """Client process end of the link to the harness."""
+
+    def __init__(self, commands, results):
+        self.commands = commands
+        self.results = results
+
+    def report(self, counts: dict):
+        self.results.put(("connected", counts))
+
+    def wait(self) -> Tuple[float, float]:
+        return self.commands.get()
+
+
+def client_process(uri: str, rooms: List[RoomPlan], typing_rate: float, autocomplete_rate: float,
+                   commands, results):
+    raise_file_limit()
+    clients = ClientProcess(uri, rooms, typing_rate, autocomplete_rate)
+    summary = asyncio.run(clients.run(Control(commands, results)))
+    results.put(("done", summary))
+
+
+async def collect(results, kind: str, count: int) -> List[dict]:
+    loop = asyncio.get_running_loop()
+    collected = []
+    while len(collected) < count:
+        received, payload = await loop.run_in_executor(None, results.get)
+        if received != kind:
+            raise RuntimeError(f"Expected {kind} from a client process, got {received}")
+        collected.append(payload)
+    return collected
+
+
+def autocomplete_worker_cpu() -> Optional[float]:
+    from services.autocomplete_pool import autocomplete_pool
+    processes = getattr(autocomplete_pool.executor, "_processes", None)
+    if not processes:
+        return None
+    times = [cpu_seconds(pid) for pid in processes]
+    return sum(value for value in times if value is not None)
+
+
+def evict_rooms():
+    # Drop the finished scenario's rooms so the next one starts from the same memory footprint
+    from services.room_lifecycle import room_lifecycle
+    idle_ttl, room_lifecycle.idle_ttl = room_lifecycle.idle_ttl, -1
+    try:
+        room_lifecycle.sweep()
+    finally:
+        room_lifecycle.idle_ttl = idle_ttl
+
+
+async def run_scenario(uri: str, number: int, room_size: int, typing_rate: float, doc_size: int,
+                       args: argparse.Namespace) -> dict:
+    from services.room_service import RoomState, room_service
+
+    document = make_document(doc_size)
+    typists = max(1, min(room_size, round(room_size * args.typists)))
+    rooms: List[RoomPlan] = []
+    for index in range(max(1, args.clients // room_size)):
+        room_id = f"load{number}-{index}"
+        room_service.add_room(room_id, RoomState(document))
+        rooms.append((room_id, [f"user{user}" for user in range(room_size)], typists))
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    commands = [context.Queue() for _ in range(args.client_processes)]
+    processes = [
+        context.Process(
+            target=client_process,
+            args=(uri, rooms[index::args.client_processes], typing_rate, args.autocomplete_rate,
+                  commands[index], results),
+            daemon=True
+        )
+        for index in range(args.client_processes)
+    ]
+
+    rss_idle = rss_bytes()
+    connect_started = time.perf_counter()
+    for process in processes:
+        process.start()
+    connected = await collect(results, "connected", len(processes))
+    connect_seconds = time.perf_counter() - connect_started
+    rss_connected = rss_bytes()
+
+    measure_from = time.monotonic() + args.warmup
+    measure_until = measure_from + args.duration
+    for queue in commands:
+        queue.put((measure_from, measure_until))
+
+    await asyncio.sleep(max(0.0, measure_from - time.monotonic()))
+    cpu_started, pool_started = own_cpu_seconds(), autocomplete_worker_cpu()
+    peak_rss = rss_connected
+    while time.monotonic() < measure_until:
+        await asyncio.sleep(min(0.25, max(0.0, measure_until - time.monotonic())))
+        peak_rss = max(peak_rss, rss_bytes())
+    cpu, pool = own_cpu_seconds() - cpu_started, autocomplete_worker_cpu()
+
+    summaries = await collect(results, "done", len(processes))
+    for process in processes:
+        await asyncio.get_running_loop().run_in_executor(None, process.join)
+    evict_rooms()
+
+    clients = sum(counts["connected"] for counts in connected)
+    edits = sum(summary["edits_measured"] for summary in summaries)
+    deliveries = sum(summary["deliveries"] for summary in summaries)
+    expected = sum(summary["expected_deliveries"] for summary in summaries)
+    client_cpu = [summary["cpu_percent"] for summary in summaries]
+    return {
+        "room_size": room_size,
+        "typing_rate": typing_rate,
+        "doc_size": doc_size,
+        "rooms": len(rooms),
+        "clients": clients,
+        "typists": typists * len(rooms),
+        "connect": {
+            "seconds": round(connect_seconds, 3),
+            "failed": sum(counts["failed"] for counts in connected)
+        },
+        "edit_latency_ms": percentiles([value for summary in summaries for value in summary["latencies"]]),
+        "autocomplete_latency_ms": percentiles([value for summary in summaries for value in summary["autocomplete"]]),
+        "throughput": {
+            "edits_per_second": round(edits / args.duration, 1),
+            "deliveries_per_second": round(deliveries / args.duration, 1),
+            "frames_received_per_second": round(
+                sum(summary["frames_received"] for summary in summaries) / (args.warmup + args.duration + 1), 1
+            ),
+            "autocomplete_per_second": round(
+                sum(len(summary["autocomplete"]) for summary in summaries) / args.duration, 1
+            )
+        },
+        "delivery_ratio": round(deliveries / expected, 4) if expected else None,
+        "server": {
+            "cpu_percent": round(cpu / args.duration * 100, 1),
+            "autocomplete_workers_cpu_percent": (
+                round((pool - pool_started) / args.duration * 100, 1) if pool is not None and pool_started is not None
+                else None
+            ),
+            "rss_mb": round(rss_connected / 2 ** 20, 1),
+            "peak_rss_mb": round(peak_rss / 2 ** 20, 1),
+            "rss_per_client_kb": round((rss_connected - rss_idle) / clients / 1024, 2) if clients else None
+        },
+        "client_processes": {
+            "cpu_percent": client_cpu,
+            "saturated": any(percent >= SATURATED_PERCENT for percent in client_cpu)
+        },
+        "resyncs": sum(summary["resyncs"] for summary in summaries),
+        "errors": {
+            "count": sum(summary["error_count"] for summary in summaries),
+            "examples": [error for summary in summaries for error in summary["errors"]][:10]
+        }
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_scenario(result: dict):
+    latency, server = result["edit_latency_ms"], result["server"]
+    print(f"rooms of {result['room_size']:>3}, {result['typing_rate']:g} keys/s, {result['doc_size']:>7} B: "
+          f"{result['clients']} clients, edit p50 {latency['p50']} ms p99 {latency['p99']} ms, "
+          f"{result['throughput']['edits_per_second']} edits/s, "
+          f"{result['throughput']['deliveries_per_second']} deliveries/s, "
+          f"autocomplete p99 {result['autocomplete_latency_ms']['p99']} ms, "
+          f"server CPU {server['cpu_percent']}%, RSS {server['rss_mb']} MB")
+    if result["client_processes"]["saturated"]:
+        print("  warning: a client process was CPU bound; add --client-processes for a fair measurement")
+    if result["errors"]["count"] or result["connect"]["failed"]:
+        print(f"  {result['connect']['failed']} failed connections, {result['errors']['count']} errors, "
+              f"e.g. {result['errors']['examples'][:2]}")
+
+
+def compare(results: dict, baseline_path: str):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    earlier = {
+        (scenario["room_size"], scenario["typing_rate"], scenario["doc_size"]): scenario
+        for scenario in baseline.get("scenarios", [])
+    }
+    fields = (
+        ("edit p50 ms", lambda scenario: scenario["edit_latency_ms"]["p50"]),
+        ("edit p99 ms", lambda scenario: scenario["edit_latency_ms"]["p99"]),
+        ("edits/s", lambda scenario: scenario["throughput"]["edits_per_second"]),
+        ("autocomplete p99 ms", lambda scenario: scenario["autocomplete_latency_ms"]["p99"]),
+        ("server CPU %", lambda scenario: scenario["server"]["cpu_percent"]),
+        ("RSS MB", lambda scenario: scenario["server"]["rss_mb"]),
+    )
+    print(f"\nagainst {baseline_path} ({baseline.get('git_revision')})")
+    for scenario in results["scenarios"]:
+        key = (scenario["room_size"], scenario["typing_rate"], scenario["doc_size"])
+        previous = earlier.get(key)
+        if previous is None:
+            print(f"  {key}: not in baseline")
+            continue
+        changes = []
+        for name, value in fields:
+            now, before = value(scenario), value(previous)
+            if now is None or before is None:
+                continue
+            change = f"{(now - before) / before * 100:+.1f}%" if before else "n/a"
+            changes.append(f"{name} {before} -> {now} ({change})")
+        print(f"  rooms of {key[0]}, {key[1]:g} keys/s, {key[2]} B: " + ", ".join(changes))
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    import uvicorn
+    from config import settings
+    from main import create_app
+
+    raise_file_limit()
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(create_app(), log_level="warning", backlog=4096))
+    serving = asyncio.create_task(server.serve(sockets=[listener]))
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.05)
+
+    results = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "broadcast_tick_ms": settings.BROADCAST_TICK_MS,
+            "ws_send_queue_size": settings.WS_SEND_QUEUE_SIZE,
+            "ws_slow_consumer_policy": settings.WS_SLOW_CONSUMER_POLICY,
+            "room_backend": settings.ROOM_BACKEND,
+            "autocomplete_pool": settings.AUTOCOMPLETE_POOL,
+            "autocomplete_workers": settings.AUTOCOMPLETE_WORKERS
+        },
+        "options": {
+            "clients": args.clients,
+            "typists": args.typists,
+            "autocomplete_rate": args.autocomplete_rate,
+            "client_processes": args.client_processes,
+            "warmup": args.warmup,
+            "duration": args.duration
+        },
+        "scenarios": []
+    }
+    try:
+        scenarios = itertools.product(args.room_size, args.typing_rate, args.doc_size)
+        for number, (room_size, typing_rate, doc_size) in enumerate(scenarios):
+            result = await run_scenario(f"ws://127.0.0.1:{port}", number, room_size, typing_rate, doc_size, args)
+            results["scenarios"].append(result)
+            print_scenario(result)
+    finally:
+        server.should_exit = True
+        await serving
+    return results
+
+
+def number_list(kind):
+    return lambda value: [kind(part) for part in value.split(",") if part]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=1000, help="simulated clients per scenario")
+    parser.add_argument("--room-size", type=number_list(int), default=[2, 8], help="clients per room, comma-separated")
+    parser.add_argument("--typing-rate", type=number_list(float), default=[4.0],
+                        help="keystrokes per second per typist, comma-separated")
+    parser.add_argument("--doc-size", type=number_list(int), default=[2000, 50000],
+                        help="seeded document size in characters, comma-separated")
+    parser.add_argument("--typists", type=float, default=0.5, help="share of each room's clients that type")
+    parser.add_argument("--autocomplete-rate", type=float, default=0.2, help="requests per second per client, 0 disables")
+    parser.add_argument("--client-processes", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of load before measuring")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured per scenario")
+    parser.add_argument("--output", help="JSON results file (default benchmarks/results/load-<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"load-{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"results written to {output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
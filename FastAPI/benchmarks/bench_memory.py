@@ -0,0 +1,103 @@
+"""Memory held per idle room and per connection.
+
+Creates idle rooms through RoomService and connects fake sockets through
+ConnectionManager, measuring the allocations with tracemalloc. The
+pydantic row builds the same rooms the old way, as a `Room` model plus
+separate last-activity entries, for comparison.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_memory --rooms 100000 --connections 10000
+"""
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+from typing import Dict, List
+
+from pydantic import BaseModel
+
+from benchmarks.bench_fanout import FakeWebSocket
+from services.room_service import RoomService
+from websocket.connection_manager import ConnectionManager
+
+USERS_PER_ROOM = 10
+
+
+class PydanticRoom(BaseModel):
+    # The room model rooms used to be stored as
+    code: str = ""
+    users: List[str] = []
+    revision: int = 0
+
+
+def measure(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return used
+
+
+async def measure_connections(count: int) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    manager = await connect_all(count)
+    # Let every writer task start and park on its empty queue
+    await asyncio.sleep(0)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    for session in list(manager.sessions.values()):
+        manager.disconnect(session.websocket, session.room_id, session.user_id)
+    await asyncio.sleep(0)
+    return used
+
+
+def slotted_rooms(count: int):
+    service = RoomService()
+    for index in range(count):
+        service.add_room(f"room{index:06d}")
+    return service
+
+
+def pydantic_rooms(count: int):
+    rooms: Dict[str, PydanticRoom] = {}
+    last_active: Dict[str, float] = {}
+    for index in range(count):
+        room_id = f"room{index:06d}"
+        rooms[room_id] = PydanticRoom()
+        last_active[room_id] = time.monotonic()
+    return rooms, last_active
+
+
+async def connect_all(count: int):
+    manager = ConnectionManager()
+    latencies: List[float] = []
+    for index in range(count):
+        await manager.connect(FakeWebSocket(latencies), f"room{index // USERS_PER_ROOM:06d}", f"user{index}")
+    return manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=100000, help="idle rooms to create")
+    parser.add_argument("--connections", type=int, default=10000, help=f"connections, {USERS_PER_ROOM} per room")
+    args = parser.parse_args()
+
+    print(f"{'structure':<22} {'count':>8} {'total MB':>9} {'bytes each':>11}")
+    for label, build in (("idle rooms (slotted)", slotted_rooms), ("idle rooms (pydantic)", pydantic_rooms)):
+        used = measure(lambda: build(args.rooms))
+        print(f"{label:<22} {args.rooms:>8} {used / 2 ** 20:>9.1f} {used / args.rooms:>11.0f}")
+
+    used = asyncio.run(measure_connections(args.connections))
+    print(f"{'connections':<22} {args.connections:>8} {used / 2 ** 20:>9.1f} {used / args.connections:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
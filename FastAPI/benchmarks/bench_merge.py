@@ -0,0 +1,140 @@
+"""Randomized convergence check and throughput benchmark for the merge service.
+
+Simulates OT clients (one op in flight, later edits buffered) over FIFO
+channels delivered in random order. After every run all client documents must match the server.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_merge --runs 200
+    python -m benchmarks.bench_merge --runs 1 --clients 8 --steps 20000 --doc-kb 200
+"""
+import argparse
+import random
+import string
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+from benchmarks.ot_client import OTClient
+from services.merge_service import merge_service
+from services.room_service import room_service
+
+
+def random_ops(rng: random.Random, length: int) -> List[dict]:
+    ops = []
+    for _ in range(rng.randint(1, 3)):
+        if length and rng.random() < 0.4:
+            position = rng.randrange(length)
+            count = rng.randint(1, min(8, length - position))
+            ops.append({"op": "delete", "pos": position, "length": count})
+            length -= count
+        else:
+            text = "".join(rng.choice(string.ascii_letters + "\n ") for _ in range(rng.randint(1, 6)))
+            ops.append({"op": "insert", "pos": rng.randint(0, length), "text": text})
+            length += len(text)
+    return ops
+
+
+class SimulatedClient(OTClient):
+
+    def __init__(self, user_id: str, code: str, revision: int):
+        super().__init__(code, revision)
+        self.user_id = user_id
+        self.inbox: Deque[Tuple[str, int, List[dict]]] = deque()
+
+    def edit(self, rng: random.Random) -> Optional[Tuple[int, List[dict]]]:
+        return self.local(random_ops(rng, len(self.document)))
+
+    def receive(self) -> Optional[Tuple[int, List[dict]]]:
+        kind, revision, ops = self.inbox.popleft()
+        if kind == "ack":
+            return self.ack(revision)
+        self.remote(revision, ops)
+        return None
+
+
+def run(seed: int, clients: int, steps: int, doc_kb: int) -> Tuple[int, float]:
+    rng = random.Random(seed)
+    room_id = room_service.create_room()
+    room_service.update_room_code(room_id, "x" * (doc_kb * 1024))
+    merge_service.reset(room_id)
+
+    code = room_service.get_room_code(room_id)
+    revision = room_service.get_room_revision(room_id)
+    peers = [SimulatedClient(f"user{i}", code, revision) for i in range(clients)]
+    to_server: Deque[Tuple[SimulatedClient, int, List[dict]]] = deque()
+
+    merged = 0
+    server_time = 0.0
+
+    def deliver_to_server():
+        nonlocal merged, server_time
+        sender, base, ops = to_server.popleft()
+        started = time.perf_counter()
+        result = merge_service.submit(room_id, base, ops)
+        server_time += time.perf_counter() - started
+        assert result is not None, "server rejected an op inside the history window"
+        new_revision, transformed = result
+        merged += 1
+        for peer in peers:
+            if peer is sender:
+                peer.inbox.append(("ack", new_revision, []))
+            else:
+                peer.inbox.append(("op", new_revision, transformed))
+
+    for _ in range(steps):
+        peer = rng.choice(peers)
+        action = rng.random()
+        if action < 0.25:
+            sent = peer.edit(rng)
+            if sent:
+                to_server.append((peer, *sent))
+        elif action < 0.6 and to_server:
+            deliver_to_server()
+        elif peer.inbox:
+            sent = peer.receive()
+            if sent:
+                to_server.append((peer, *sent))
+
+    # Drain every channel until the system is quiescent
+    while to_server or any(peer.inbox for peer in peers):
+        while to_server:
+            deliver_to_server()
+        for peer in peers:
+            while peer.inbox:
+                sent = peer.receive()
+                if sent:
+                    to_server.append((peer, *sent))
+
+    expected = room_service.get_room_code(room_id)
+    for peer in peers:
+        assert str(peer.document) == expected, f"seed {seed}: {peer.user_id} diverged from the server"
+
+    room_service.delete_room(room_id)
+    merge_service.reset(room_id)
+    return merged, server_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=100, help="randomized runs (one seed each)")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--doc-kb", type=int, default=0, help="initial document size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    total_ops = 0
+    total_time = 0.0
+    for run_index in range(args.runs):
+        merged, server_time = run(args.seed + run_index, args.clients, args.steps, args.doc_kb)
+        total_ops += merged
+        total_time += server_time
+
+    print(f"converged: {args.runs} runs, {args.clients} clients, {total_ops} merged ops")
+    if total_time:
+        print(f"throughput: {total_ops / total_time:,.0f} ops/sec per room "
+              f"({total_time / total_ops * 1e6:.1f} us/op, doc {args.doc_kb} KB)")
+
+
+if __name__ == "__main__":
+    main()
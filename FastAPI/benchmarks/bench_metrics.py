@@ -0,0 +1,194 @@
+"""Hot-path cost of the metrics recorded for every WebSocket message.
+
+Times the recording primitives on their own, then the exact sequence a
+message adds (its type counter and handling histogram, plus the fan-out
+histogram and frame counter of its broadcast), and finally a full
+handle_websocket_message round trip with the real metrics against no-op
+stand-ins. Exits non-zero if the per-message sequence is over budget.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_metrics --peers 10 --messages 20000 --budget-us 3
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import Callable
+
+from api import routes
+from services.metrics import Counter, Histogram, MetricsRegistry
+from services.room_service import room_service
+from websocket import connection_manager as connection_manager_module
+from websocket.connection_manager import connection_manager
+
+
+class FakeWebSocket:
+
+    def __init__(self):
+        self.scope = {}
+
+    async def accept(self, subprotocol: str = None):
+        pass
+
+    async def close(self, code: int = 1000, reason: str = None):
+        pass
+
+    async def send_text(self, data: str):
+        pass
+
+
+class NoOpMetric:
+
+    def inc(self, *labels, amount=1):
+        pass
+
+    def observe(self, value, *labels):
+        pass
+
+
+def per_call_ns(function: Callable[[int], None], iterations: int, repeats: int = 5) -> float:
+    """Best of `repeats` timings of function(iterations), net of an empty loop."""
+    def empty(count: int):
+        for _ in range(count):
+            pass
+
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        empty(iterations)
+        baseline = time.perf_counter() - started
+        started = time.perf_counter()
+        function(iterations)
+        best = min(best, time.perf_counter() - started - baseline)
+    return max(best, 0.0) / iterations * 1e9
+
+
+def primitives(iterations: int):
+    counter = Counter("bench_total", "", ("type",))
+    histogram = Histogram("bench_seconds", "", ("type",))
+    clock = time.perf_counter
+
+    def increments(count: int):
+        for _ in range(count):
+            counter.inc("cursor_position")
+
+    def observations(count: int):
+        for _ in range(count):
+            histogram.observe(0.00003, "cursor_position")
+
+    def clock_reads(count: int):
+        for _ in range(count):
+            clock()
+
+    print(f"{'operation':<28} {'ns/call':>8}")
+    for name, function in (("Counter.inc", increments), ("Histogram.observe", observations),
+                           ("time.perf_counter", clock_reads)):
+        print(f"{name:<28} {per_call_ns(function, iterations):>8.0f}")
+
+
+def message_sequence(iterations: int) -> float:
+    """What the instrumentation adds to one message that is broadcast once, in µs."""
+    received = Counter("bench_received_total", "", ("type",))
+    handling = Histogram("bench_handling_seconds", "", ("type",))
+    fanout = Histogram("bench_fanout_seconds", "", ("path",))
+    frames = Counter("bench_frames_total", "")
+    message_types = routes.MESSAGE_TYPES
+    clock = time.perf_counter
+
+    def instrumented(count: int):
+        for _ in range(count):
+            # handle_websocket_message
+            message_type = "cursor_position"
+            started = clock()
+            # ConnectionManager.broadcast_to_room
+            fanout_started = clock()
+            frames.inc(amount=9)
+            fanout.observe(clock() - fanout_started, "immediate")
+            label = message_type if isinstance(message_type, str) and message_type in message_types else "unknown"
+            received.inc(label)
+            handling.observe(clock() - started, label)
+
+    return per_call_ns(instrumented, iterations) / 1000
+
+
+async def round_trip(peers: int, messages: int) -> float:
+    """Mean µs per cursor_position message through handle_websocket_message."""
+    message = {"type": "cursor_position", "position": 42}
+    # Start from empty queues
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    for index in range(messages):
+        await routes.handle_websocket_message(message, "bench", "user0")
+        if index % 8 == 0:
+            # Let the writers drain so queues don't fill up and start dropping
+            await asyncio.sleep(0)
+    return (time.perf_counter() - started) / messages * 1e6
+
+
+async def end_to_end(peers: int, messages: int, rounds: int):
+    connection_manager.scheduler.tick = 0
+    room_service.add_room("bench")
+    for index in range(peers):
+        await connection_manager.connect(FakeWebSocket(), "bench", f"user{index}")
+
+    real = {
+        (routes, "MESSAGES_RECEIVED"): routes.MESSAGES_RECEIVED,
+        (routes, "MESSAGE_SECONDS"): routes.MESSAGE_SECONDS,
+        (connection_manager_module, "FANOUT_SECONDS"): connection_manager_module.FANOUT_SECONDS,
+        (connection_manager_module, "FRAMES_QUEUED"): connection_manager_module.FRAMES_QUEUED,
+    }
+    timings = {"metrics": [], "no-op": []}
+    await round_trip(peers, messages // 10)
+    for _ in range(rounds):
+        # Alternate the two so drift affects both equally
+        for label in ("no-op", "metrics"):
+            for (module, name), metric in real.items():
+                setattr(module, name, metric if label == "metrics" else NoOpMetric())
+            timings[label].append(await round_trip(peers, messages))
+    for (module, name), metric in real.items():
+        setattr(module, name, metric)
+
+    for session in list(connection_manager.sessions.values()):
+        connection_manager.disconnect(session.websocket, session.room_id, session.user_id)
+
+    with_metrics, without = min(timings["metrics"]), min(timings["no-op"])
+    print(f"handle_websocket_message, {peers} peers: {without:.2f} µs without metrics, "
+          f"{with_metrics:.2f} µs with ({with_metrics - without:+.2f} µs)")
+
+
+def render(series: int):
+    registry = MetricsRegistry()
+    histogram = registry.histogram("bench_seconds", "", ("room",))
+    counter = registry.counter("bench_total", "", ("room",))
+    for index in range(series):
+        histogram.observe(0.001, f"room{index}")
+        counter.inc(f"room{index}")
+    started = time.perf_counter()
+    text = registry.render()
+    elapsed = time.perf_counter() - started
+    print(f"render {series} histogram and counter series: {elapsed * 1000:.2f} ms, {len(text) / 1024:.0f} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peers", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--budget-us", type=float, default=3.0, help="allowed metrics cost per message")
+    args = parser.parse_args()
+
+    primitives(args.messages * 10)
+    print()
+    overhead = message_sequence(args.messages * 10)
+    asyncio.run(end_to_end(args.peers, args.messages, args.rounds))
+    render(1000)
+    print()
+
+    verdict = "ok" if overhead <= args.budget_us else "OVER BUDGET"
+    print(f"per-message instrumentation: {overhead:.2f} µs (budget {args.budget_us:.2f} µs) {verdict}")
+    if overhead > args.budget_us:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
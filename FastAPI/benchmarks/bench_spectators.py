@@ -0,0 +1,145 @@
+"""Cost of an edit in a room watched by a large audience.
+
+A few editors type into a room with 1,000 viewers. The viewers either
+join as spectators, fed from the shared rate-limited stream, or as
+ordinary members the way they had to before spectators existed (with
+MAX_ROOM_SIZE raised to fit them). Reports the time spent handling each
+edit, total CPU per edit including the flushes and socket writers, and
+the frames and bytes each viewer received.
+
+Edits are fed through handle_websocket_message at a fixed rate over fake
+sockets, so no network or client cost is included.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_spectators --viewers 1000 --editors 4 --rate 40 --seconds 3
+"""
+import argparse
+import asyncio
+import os
+import random
+import string
+import time
+from typing import List
+
+# Room sizes well past the default, and rooms kept in memory
+os.environ.setdefault("MAX_ROOM_SIZE", "100000")
+os.environ.setdefault("MAX_SPECTATORS", "100000")
+os.environ.setdefault("ROOM_STORE_PATH", "")
+
+from api import routes
+from services.room_service import room_service
+from websocket.connection_manager import connection_manager
+from websocket.sync_cache import sync_cache
+
+
+class FakeWebSocket:
+
+    def __init__(self):
+        self.scope = {}
+        self.frames = 0
+        self.bytes = 0
+
+    async def accept(self, subprotocol: str = None):
+        pass
+
+    async def close(self, code: int = 1000, reason: str = None):
+        pass
+
+    async def send_text(self, data: str):
+        self.frames += 1
+        self.bytes += len(data)
+
+    async def send_bytes(self, data: bytes):
+        self.frames += 1
+        self.bytes += len(data)
+
+
+async def run(mode: str, viewers: int, editors: int, rate: float, seconds: float) -> dict:
+    room_id = f"bench-{mode}"
+    room_service.add_room(room_id)
+    room_service.update_room_code(room_id, "".join(random.Random(0).choices(string.ascii_lowercase + " \n", k=20000)))
+
+    for index in range(editors):
+        await connection_manager.connect(FakeWebSocket(), room_id, f"editor{index}")
+    audience: List[FakeWebSocket] = [FakeWebSocket() for _ in range(viewers)]
+    misses = sync_cache.misses
+    joined = time.perf_counter()
+    for index, websocket in enumerate(audience):
+        if mode == "spectators":
+            await connection_manager.connect_spectator(websocket, room_id, f"viewer{index}")
+        else:
+            await connection_manager.connect(websocket, room_id, f"viewer{index}")
+            await connection_manager.send_sync(websocket)
+    join_ms = (time.perf_counter() - joined) * 1000
+    # Let the initial syncs drain before measuring
+    await asyncio.sleep(0.3)
+    for websocket in audience:
+        websocket.frames = websocket.bytes = 0
+
+    rng = random.Random(1)
+    handling = []
+    edits = int(rate * seconds)
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    for index in range(edits):
+        user_id = f"editor{index % editors}"
+        message = {
+            "type": "code_delta",
+            "revision": room_service.get_room_revision(room_id),
+            "ops": [{"op": "insert", "pos": rng.randint(0, room_service.get_room_size(room_id)), "text": "x"}]
+        }
+        handle_started = time.perf_counter()
+        await routes.handle_websocket_message(message, room_id, user_id)
+        await routes.handle_websocket_message({"type": "cursor_position", "position": index}, room_id, user_id)
+        handling.append(time.perf_counter() - handle_started)
+        await asyncio.sleep(max(0.0, started + (index + 1) / rate - time.perf_counter()))
+    # Wait out the last spectator interval and let the writers drain
+    await asyncio.sleep(connection_manager.spectators.interval + 0.2)
+    cpu = time.process_time() - cpu_started
+
+    for session in list(connection_manager.sessions.values()):
+        if session.room_id != room_id:
+            continue
+        if connection_manager.rooms.get(room_id, {}).get(session.user_id) is session:
+            connection_manager.disconnect(session.websocket, room_id, session.user_id)
+        else:
+            connection_manager.disconnect_spectator(session.websocket)
+
+    handling.sort()
+    return {
+        "join_ms": join_ms,
+        "sync_encodes": sync_cache.misses - misses,
+        "handle_us": sum(handling) / len(handling) * 1e6,
+        "handle_p99_us": handling[int(len(handling) * 0.99)] * 1e6,
+        "cpu_per_edit_ms": cpu / edits * 1000,
+        "frames_per_viewer": sum(websocket.frames for websocket in audience) / max(1, viewers),
+        "kb_per_viewer": sum(websocket.bytes for websocket in audience) / max(1, viewers) / 1024,
+        "edits": edits
+    }
+
+
+async def main_async(args):
+    print(f"{args.editors} editors typing {args.rate:g} edits/s (plus a cursor move each) for {args.seconds:g}s, "
+          f"spectator interval {connection_manager.spectators.interval * 1000:g} ms")
+    print(f"{'viewers as':<12} {'viewers':>8} {'join ms':>8} {'sync enc':>9} {'handle µs':>10} {'p99 µs':>8} "
+          f"{'CPU ms/edit':>12} {'frames/viewer':>14} {'KB/viewer':>10}")
+    for viewers in (int(value) for value in args.viewers.split(",")):
+        for mode in ("spectators", "members"):
+            result = await run(mode, viewers, args.editors, args.rate, args.seconds)
+            print(f"{mode:<12} {viewers:>8} {result['join_ms']:>8.1f} {result['sync_encodes']:>9} "
+                  f"{result['handle_us']:>10.1f} {result['handle_p99_us']:>8.1f} {result['cpu_per_edit_ms']:>12.3f} "
+                  f"{result['frames_per_viewer']:>14.1f} {result['kb_per_viewer']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--viewers", default="0,1000", help="comma-separated audience sizes")
+    parser.add_argument("--editors", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=40.0, help="edits per second across all editors")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
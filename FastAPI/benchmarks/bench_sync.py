@@ -0,0 +1,151 @@
+"""Bytes and CPU spent bringing reconnecting users up to date.
+
+A room holding a document of each size takes a few edits, then every
+user in it reconnects at once. Compares what the server sends and the
+CPU it spends per wave of reconnects:
+
+    plain               full sync encoded for each user
+    permessage-deflate  the same, compressed again for each connection
+    sync cache          encoded once per revision
+    sync cache+deflate  encoded and compressed once per revision
+    resume              only the ops missed since the client's revision
+
+The permessage-deflate row runs raw deflate on each payload the way the
+transport extension would, without its context takeover across frames.
+Every payload is decoded and checked against the room document.
+
+Run from the FastAPI directory:
+    python -m benchmarks.bench_sync --doc-kb 20,200,1000 --users 50 --edits 20
+"""
+import argparse
+import json
+import os
+import random
+import string
+import time
+import zlib
+from typing import Callable, Tuple
+
+# Keep the rooms in memory unless told otherwise
+os.environ.setdefault("ROOM_STORE_PATH", "")
+
+from benchmarks.ot_client import OTClient
+from services.merge_service import merge_service
+from services.room_service import RoomState, room_service
+from websocket.codec import DeflateCodec, Payload, json_codec
+from websocket.sync_cache import SyncCache
+
+
+def make_document(rng: random.Random, size: int) -> str:
+    lines = []
+    length = 0
+    while length < size:
+        indent = "    " * rng.randint(0, 3)
+        line = indent + " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+                                 for _ in range(rng.randint(2, 8)))
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines)
+
+
+def decode(payload: Payload) -> dict:
+    if isinstance(payload, bytes):
+        payload = zlib.decompress(payload)
+    return json.loads(payload)
+
+
+def permessage_deflate(level: int) -> Callable[[str], Payload]:
+    def encode(room_id: str) -> bytes:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        data = json_codec.encode(room_service.build_sync_message(room_id)).encode()
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return encode
+
+
+def run(room_id: str, users: int, encode: Callable[[str], Payload], check: Callable[[Payload], bool]) -> Tuple[float, int]:
+    """CPU ms for one sync per user and the mean payload size in bytes."""
+    payloads = []
+    started = time.perf_counter()
+    for _ in range(users):
+        payloads.append(encode(room_id))
+    elapsed = time.perf_counter() - started
+    if not all(check(payload) for payload in payloads):
+        raise AssertionError("payload doesn't match the room document")
+    return elapsed * 1000, sum(len(payload) for payload in payloads) // users
+
+
+def scenario(doc_kb: int, users: int, edits: int, level: int):
+    rng = random.Random(doc_kb)
+    room_id = f"sync{doc_kb}"
+    room_service.add_room(room_id, RoomState(make_document(rng, doc_kb * 1024)))
+    for index in range(users):
+        room_service.add_user_to_room(room_id, f"user{index}")
+
+    # Clients last saw the room before these edits
+    start_revision = room_service.get_room_revision(room_id)
+    epoch = room_service.get_room_epoch(room_id)
+    client_code = room_service.get_room_code(room_id)
+    for _ in range(edits):
+        revision = room_service.get_room_revision(room_id)
+        position = rng.randint(0, room_service.get_room_size(room_id))
+        merge_service.submit(room_id, revision, [{"op": "insert", "pos": position, "text": rng.choice(string.ascii_letters)}])
+    code = room_service.get_room_code(room_id)
+
+    def is_sync(payload: Payload) -> bool:
+        return decode(payload)["code"] == code
+
+    def inflates(payload: bytes) -> bool:
+        message = json.loads(zlib.decompressobj(-zlib.MAX_WBITS).decompress(payload))
+        return message["code"] == code
+
+    def resumes(payload: Payload) -> bool:
+        message = decode(payload)
+        client = OTClient(client_code, start_revision)
+        client.resume(message["revision"], message["ops"])
+        return str(client.document) == code
+
+    def resume(room_id: str) -> Payload:
+        return json_codec.encode({
+            "type": "resume",
+            "ops": merge_service.changes_since(room_id, epoch, start_revision),
+            "revision": room_service.get_room_revision(room_id),
+            "epoch": epoch,
+            "users": room_service.get_room_users(room_id)
+        })
+
+    deflate = DeflateCodec(json_codec, 1, level)
+    cases = (
+        ("plain", lambda room: json_codec.encode(room_service.build_sync_message(room)), is_sync),
+        ("permessage-deflate", permessage_deflate(level), inflates),
+        ("sync cache", lambda room, cache=SyncCache(1): cache.encode(room, json_codec), is_sync),
+        ("sync cache+deflate", lambda room, cache=SyncCache(1): cache.encode(room, deflate), is_sync),
+        ("resume", resume, resumes),
+    )
+
+    print(f"{doc_kb} KB document, {users} users, {edits} edits missed")
+    print(f"{'':<20} {'CPU ms':>9} {'bytes/user':>11} {'saved':>7}")
+    plain_bytes = None
+    for name, encode, check in cases:
+        elapsed, size = run(room_id, users, encode, check)
+        plain_bytes = plain_bytes or size
+        print(f"{name:<20} {elapsed:>9.2f} {size:>11} {1 - size / plain_bytes:>7.1%}")
+    print()
+
+    room_service.delete_room(room_id)
+    merge_service.reset(room_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doc-kb", default="20,200,1000", help="comma-separated document sizes")
+    parser.add_argument("--users", type=int, default=50, help="users reconnecting to the room")
+    parser.add_argument("--edits", type=int, default=20, help="edits made while they were away")
+    parser.add_argument("--level", type=int, default=6, help="zlib compression level")
+    args = parser.parse_args()
+
+    for doc_kb in (int(value) for value in args.doc_kb.split(",")):
+        scenario(doc_kb, args.users, args.edits, args.level)
+
+
+if __name__ == "__main__":
+    main()
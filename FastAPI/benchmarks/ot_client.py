@@ -0,0 +1,86 @@
+from typing import List, Optional, Tuple
+
+from services.merge_service import transform_ops
+from services.text_buffer import Rope
+
+
+def apply_ops(buffer: Rope, ops: List[dict]):
+    for op in ops:
+        if op["op"] == "insert":
+            buffer.insert(op["pos"], op["text"])
+        else:
+            buffer.delete(op["pos"], op["length"])
+
+
+class OTClient:
+    """Client half of the code_delta protocol.
+
+    Keeps at most one op list in flight and buffers later local edits until
+    it is acked, transforming both over incoming server ops. Methods return
+    a (revision, ops) pair when something has to be sent.
+    """
+
+    def __init__(self, code: str = "", revision: int = 0):
+        self.document = Rope(code)
+        self.revision = revision
+        self.outstanding: Optional[List[dict]] = None
+        self.buffer: List[dict] = []
+
+    def sync(self, code: str, revision: int):
+        self.document = Rope(code)
+        self.revision = revision
+        self.outstanding = None
+        self.buffer = []
+
+    def local(self, ops: List[dict]) -> Optional[Tuple[int, List[dict]]]:
+        apply_ops(self.document, ops)
+        if self.outstanding is None:
+            self.outstanding = ops
+            return self.revision, ops
+        # Sequential op lists compose by concatenation
+        self.buffer.extend(ops)
+        return None
+
+    def ack(self, revision: int) -> Optional[Tuple[int, List[dict]]]:
+        self.revision = revision
+        self.outstanding = self.buffer or None
+        self.buffer = []
+        return (revision, self.outstanding) if self.outstanding else None
+
+    def resume(self, revision: int, ops: List[dict]) -> Optional[Tuple[int, List[dict]]]:
+        """Catch up on the ops missed while disconnected, then send buffered edits.
+
+        Only valid with nothing in flight: an op list sent before the
+        connection dropped may or may not have been applied, so a client in
+        that state reconnects without a revision and takes a full sync.
+        """
+        if self.buffer:
+            self.buffer, ops = transform_ops(self.buffer, ops, a_first=False)
+        apply_ops(self.document, ops)
+        self.revision = revision
+        self.outstanding = self.buffer or None
+        self.buffer = []
+        return (revision, self.outstanding) if self.outstanding else None
+
+    def moved(self, revision: int):
+        """The room moved to another worker at `revision`, which this client has seen.
+
+        Everything applied before the move was acked, so the op list in
+        flight wasn't: it goes back in front of the buffer to be sent again
+        once the client has resumed on the new owner.
+        """
+        self.revision = revision
+        if self.outstanding:
+            self.buffer = self.outstanding + self.buffer
+        self.outstanding = None
+
+    def remote(self, revision: int, ops: List[dict]):
+        if revision <= self.revision:
+            # Already covered by the last sync
+            return
+        if self.outstanding:
+            self.outstanding, ops = transform_ops(self.outstanding, ops, a_first=False)
+        if self.buffer:
+            self.buffer, ops = transform_ops(self.buffer, ops, a_first=False)
+        apply_ops(self.document, ops)
+        self.revision = revision
@@ -0,0 +1 @@
+# Cluster package initialization
\ No newline at end of file
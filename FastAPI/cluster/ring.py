@@ -0,0 +1,42 @@
+import bisect
+import hashlib
+from typing import Dict, List
+
+
+def hash_key(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of room ids onto workers.
+
+    Each worker owns `vnodes` points on a 64-bit ring and a room belongs to
+    the first point at or after its hash, so rooms spread evenly and only
+    about 1/N of them change owner when a worker is added or removed.
+    Rooms moved by hand (or by rebalancing) are pinned to their new owner
+    and take precedence over the ring.
+    """
+
+    def __init__(self, workers: int, vnodes: int):
+        points = sorted((hash_key(f"worker-{worker}-{vnode}"), worker)
+                        for worker in range(workers) for vnode in range(vnodes))
+        self.workers = workers
+        self._hashes: List[int] = [point for point, _ in points]
+        self._owners: List[int] = [worker for _, worker in points]
+        self.pinned: Dict[str, int] = {}
+
+    def home(self, room_id: str) -> int:
+        """The worker the ring alone assigns a room to."""
+        index = bisect.bisect_left(self._hashes, hash_key(room_id))
+        return self._owners[index % len(self._owners)]
+
+    def owner(self, room_id: str) -> int:
+        worker = self.pinned.get(room_id)
+        return worker if worker is not None else self.home(room_id)
+
+    def pin(self, room_id: str, worker: int):
+        if worker == self.home(room_id):
+            # Back on its ring position, nothing to remember
+            self.pinned.pop(room_id, None)
+        else:
+            self.pinned[room_id] = worker
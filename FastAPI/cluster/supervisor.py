@@ -0,0 +1,491 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from http import HTTPStatus
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from config import settings
+from cluster.ring import HashRing
+
+logger = logging.getLogger(__name__)
+
+# Directory main.py is in, which the workers are started from
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Largest request head read from a client before it is routed, and how long to wait for it
+MAX_HEAD_BYTES = 16384
+HEAD_TIMEOUT = 10.0
+
+# Connections to a room that is moving wait this long for it to land
+MIGRATION_WAIT = 30.0
+
+PIPE_CHUNK = 65536
+WORKER_START_TIMEOUT = 30.0
+WATCH_INTERVAL = 1.0
+
+# Headers never passed on to a worker: connection handling is the proxy's, and
+# the supervisor token only ever comes from the supervisor itself
+HOP_HEADERS = frozenset({b"connection", b"keep-alive", b"x-supervisor-token"})
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Worker:
+    """One worker process, serving the rooms it owns on a unix socket."""
+
+    __slots__ = ("index", "socket_path", "process", "connections", "restarts", "load", "revisions")
+
+    def __init__(self, index: int, socket_path: str):
+        self.index = index
+        self.socket_path = socket_path
+        self.process: Optional[subprocess.Popen] = None
+        self.connections = 0
+        self.restarts = 0
+        # Last rebalancing score, and each room's (revision, time) at the last load check
+        self.load = 0.0
+        self.revisions: Dict[str, Tuple[int, float]] = {}
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+
+def room_of(path: str) -> Optional[str]:
+    """The room a request is about: /ws/{room_id}/{user_id} and /rooms/{room_id}."""
+    parts = path.split("/")
+    if len(parts) >= 3 and parts[1] in ("ws", "rooms") and parts[2]:
+        return parts[2]
+    return None
+
+
+def header_value(head: bytes, name: bytes) -> Optional[bytes]:
+    """Value of the first `name` header in a request head, matched case-insensitively."""
+    for line in head[:-4].split(b"\r\n")[1:]:
+        field, _, value = line.partition(b":")
+        if field.strip().lower() == name:
+            return value.strip()
+    return None
+
+
+def prepare_head(head: bytes) -> bytes:
+    """Rewrite a request head for a worker.
+
+    Plain HTTP requests get `Connection: close`, so each request on a
+    keep-alive connection is routed on its own; upgrades are passed as they are.
+    """
+    lines = head[:-4].split(b"\r\n")
+    names = [line.split(b":", 1)[0].strip().lower() for line in lines[1:]]
+    upgrade = b"upgrade" in names
+    kept = [line for name, line in zip(names, lines[1:]) if name not in HOP_HEADERS or (upgrade and name == b"connection")]
+    if not upgrade:
+        kept.append(b"Connection: close")
+    return b"\r\n".join([lines[0], *kept]) + b"\r\n\r\n"
+
+
+async def respond(writer: asyncio.StreamWriter, status: int, body: dict):
+    data = json.dumps(body).encode()
+    writer.write(
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data
+    )
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+    writer.close()
+
+
+async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    # Closing the far side when this one ends makes the other direction end too
+    try:
+        while True:
+            data = await reader.read(PIPE_CHUNK)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        writer.close()
+
+
+class Supervisor:
+    """Runs worker processes that each own a share of the rooms, and routes to them.
+
+    Every room lives in exactly one worker, picked by consistent hashing
+    on its id, so all of a room's connections share one process and its
+    edits never cross a process boundary. The supervisor reads each
+    request's head, sends `/ws/{room_id}/...` and `/rooms/{room_id}` to the
+    room's owner and anything else to any worker, then just copies bytes
+    both ways. Workers use the memory backend and listen on unix sockets
+    that only the supervisor connects to.
+
+    A room can be moved to another worker while in use: connections to it
+    wait at the supervisor while its current owner drains it (see
+    RoomMigration) and the new owner restores it, then go to the new
+    owner. The room stays pinned there. Every `rebalance_interval` seconds
+    the workers' load is compared and, if the busiest is over
+    `rebalance_ratio` times the mean, one of its hot rooms is moved to the
+    least loaded worker.
+    """
+
+    def __init__(self, workers: int, host: str, port: int, token: str, vnodes: int,
+                 rebalance_interval: float, rebalance_ratio: float):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.rebalance_interval = rebalance_interval
+        self.rebalance_ratio = rebalance_ratio
+        self.ring = HashRing(workers, vnodes)
+        self.socket_dir = ""
+        self.workers: List[Worker] = []
+        self.worker_count = workers
+        # Rooms being moved, set once they can be routed again
+        self.moving: Dict[str, asyncio.Event] = {}
+        self.migrations = 0
+        self.failed_migrations = 0
+        self.held = 0
+        self._next = 0
+        self._stopping = False
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        self.socket_dir = tempfile.mkdtemp(prefix="meetmock-")
+        self.workers = [Worker(index, os.path.join(self.socket_dir, f"worker-{index}.sock"))
+                        for index in range(self.worker_count)]
+        for worker in self.workers:
+            self._spawn(worker)
+        await asyncio.gather(*(self._wait_ready(worker) for worker in self.workers))
+
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_HEAD_BYTES)
+        self._tasks.append(asyncio.create_task(self._watch()))
+        if self.rebalance_interval > 0:
+            self._tasks.append(asyncio.create_task(self._rebalance_periodically()))
+        logger.info(f"Supervisor routing rooms on {self.host}:{self.port} to {len(self.workers)} workers")
+
+    async def stop(self):
+        self._stopping = True
+        if self._server is not None:
+            self._server.close()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Workers shut down through their lifespan hook, which flushes the room store
+        for worker in self.workers:
+            if worker.alive:
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            try:
+                await asyncio.to_thread(worker.process.wait, 10)
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Worker {worker.index} didn't stop, killing it")
+                worker.process.kill()
+        shutil.rmtree(self.socket_dir, ignore_errors=True)
+
+    async def run(self):
+        """Serve until SIGINT or SIGTERM."""
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self._request_stop, stopped)
+        await self.start()
+        try:
+            await stopped.wait()
+        finally:
+            logger.info("Stopping supervisor")
+            await self.stop()
+
+    async def migrate(self, room_id: str, target: Optional[int] = None) -> dict:
+        """Move a room, with its connections, to another worker (the least busy one by default)."""
+        source = self.ring.owner(room_id)
+        if target is None:
+            others = [worker for worker in self.workers if worker.index != source]
+            target = min(others, key=lambda worker: (worker.load, worker.connections)).index
+        if not 0 <= target < len(self.workers) or target == source:
+            raise MigrationError(f"Can't move room {room_id} from worker {source} to worker {target}")
+        if room_id in self.moving:
+            raise MigrationError(f"Room {room_id} is already moving")
+
+        started = time.perf_counter()
+        moving = self.moving[room_id] = asyncio.Event()
+        path = f"/internal/rooms/{quote(room_id, safe='')}"
+        revision = None
+        try:
+            status, snapshot = await self._call(self.workers[source], "POST", f"{path}/drain")
+            if status == 200:
+                revision = snapshot["revision"]
+                status, _ = await self._call(self.workers[target], "POST", f"{path}/restore", snapshot)
+                if status != 200:
+                    # Give it back rather than lose it
+                    await self._call(self.workers[source], "POST", f"{path}/restore", snapshot)
+                    raise MigrationError(f"Worker {target} refused room {room_id} ({status})")
+            elif status != 404:
+                raise MigrationError(f"Worker {source} couldn't drain room {room_id} ({status})")
+            # A room the source didn't have in memory just starts on its new owner
+            self.ring.pin(room_id, target)
+            self.migrations += 1
+        except Exception:
+            self.failed_migrations += 1
+            raise
+        finally:
+            moving.set()
+            del self.moving[room_id]
+
+        elapsed = (time.perf_counter() - started) * 1000
+        logger.info(f"Moved room {room_id} from worker {source} to worker {target} in {elapsed:.1f} ms")
+        return {"room_id": room_id, "from": source, "to": target, "revision": revision, "ms": round(elapsed, 3)}
+
+    async def rebalance(self) -> Optional[dict]:
+        """Move one room off the busiest worker if the load is uneven enough."""
+        now = time.monotonic()
+        scores: Dict[int, Dict[str, float]] = {}
+        for worker in self.workers:
+            try:
+                status, body = await self._call(worker, "GET", "/internal/load")
+            except (ConnectionError, OSError, asyncio.TimeoutError):
+                status, body = 0, None
+            rooms = body["rooms"] if status == 200 else {}
+
+            worker_scores = scores[worker.index] = {}
+            for room_id, room in rooms.items():
+                previous = worker.revisions.get(room_id)
+                rate = 0.0
+                if previous is not None and room["revision"] >= previous[0] and now > previous[1]:
+                    rate = (room["revision"] - previous[0]) / (now - previous[1])
+                # Fan-out work: every edit goes to everyone in the room
+                worker_scores[room_id] = (rate + 1) * (room["connections"] + room["spectators"])
+            worker.revisions = {room_id: (room["revision"], now) for room_id, room in rooms.items()}
+            worker.load = sum(worker_scores.values())
+
+        mean = sum(worker.load for worker in self.workers) / len(self.workers)
+        busiest = max(self.workers, key=lambda worker: worker.load)
+        idlest = min(self.workers, key=lambda worker: worker.load)
+        if mean <= 0 or busiest.load < self.rebalance_ratio * mean:
+            return None
+
+        # The hottest room that narrows the gap instead of just moving the hot spot
+        gap = busiest.load - idlest.load
+        candidates = [(score, room_id) for room_id, score in scores[busiest.index].items()
+                      if score <= gap / 2 and room_id not in self.moving]
+        if not candidates:
+            return None
+        score, room_id = max(candidates)
+        logger.info(f"Rebalancing: worker {busiest.index} load {busiest.load:.1f}, "
+                    f"worker {idlest.index} load {idlest.load:.1f}, moving room {room_id} ({score:.1f})")
+        return await self.migrate(room_id, idlest.index)
+
+    def get_status(self) -> dict:
+        return {
+            "workers": [
+                {
+                    "index": worker.index,
+                    "pid": worker.process.pid if worker.process is not None else None,
+                    "alive": worker.alive,
+                    "connections": worker.connections,
+                    "load": round(worker.load, 3),
+                    "restarts": worker.restarts
+                }
+                for worker in self.workers
+            ],
+            "pinned": dict(self.ring.pinned),
+            "moving": list(self.moving),
+            "migrations": self.migrations,
+            "failed_migrations": self.failed_migrations,
+            "held_connections": self.held
+        }
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HEAD_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+
+        try:
+            method, target, _ = head.split(b"\r\n", 1)[0].decode("latin-1").split(" ", 2)
+        except ValueError:
+            await respond(writer, 400, {"detail": "Bad request"})
+            return
+        # Workers route on the decoded path, so the checks here have to as well
+        path = unquote(urlsplit(target).path)
+
+        if path == "/cluster" or path.startswith("/cluster/"):
+            await self._admin(method, target, path, head, writer)
+            return
+        if path.startswith("/internal/"):
+            await respond(writer, 404, {"detail": "Not Found"})
+            return
+
+        room_id = room_of(path)
+        if room_id is not None:
+            worker = await self._route(room_id)
+        else:
+            worker = self._pick_worker(head)
+        if worker is None:
+            await respond(writer, 503, {"detail": "Room unavailable"})
+            return
+
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_unix_connection(worker.socket_path)
+        except (ConnectionError, OSError) as e:
+            logger.warning(f"Can't reach worker {worker.index}: {e}")
+            await respond(writer, 502, {"detail": "Worker unavailable"})
+            return
+
+        head = prepare_head(head)
+        worker.connections += 1
+        try:
+            upstream_writer.write(head)
+            await asyncio.gather(pipe(reader, upstream_writer), pipe(upstream_reader, writer))
+        finally:
+            worker.connections -= 1
+
+    async def _route(self, room_id: str) -> Optional[Worker]:
+        moving = self.moving.get(room_id)
+        if moving is not None:
+            # Held until the room has landed on its new owner
+            self.held += 1
+            try:
+                await asyncio.wait_for(moving.wait(), MIGRATION_WAIT)
+            except asyncio.TimeoutError:
+                return None
+        return self.workers[self.ring.owner(room_id)]
+
+    def _pick_worker(self, head: bytes) -> Optional[Worker]:
+        # An X-Worker header sends /stats, /metrics or /debug/profile to one worker in particular
+        for line in head.split(b"\r\n")[1:]:
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"x-worker":
+                index = int(value) if value.strip().isdigit() else -1
+                return self.workers[index] if 0 <= index < len(self.workers) else None
+        for _ in range(len(self.workers)):
+            worker = self.workers[self._next % len(self.workers)]
+            self._next += 1
+            if worker.alive:
+                return worker
+        return None
+
+    async def _admin(self, method: str, target: str, path: str, head: bytes, writer: asyncio.StreamWriter):
+        # Always the token: behind a reverse proxy on this host every client would look local
+        token = header_value(head, b"x-supervisor-token") or b""
+        if not hmac.compare_digest(token, self.token.encode()):
+            await respond(writer, 403, {"detail": "Forbidden"})
+            return
+
+        parts = path.strip("/").split("/")
+        if method == "GET" and parts == ["cluster"]:
+            await respond(writer, 200, self.get_status())
+        elif method == "POST" and len(parts) == 4 and parts[1] == "rooms" and parts[3] == "migrate":
+            query = parse_qs(urlsplit(target).query)
+            try:
+                to = int(query["to"][0]) if "to" in query else None
+                result = await self.migrate(parts[2], to)
+            except (ValueError, MigrationError) as e:
+                await respond(writer, 409, {"detail": str(e)})
+                return
+            except Exception as e:
+                logger.error(f"Error moving room {parts[2]}: {e}")
+                await respond(writer, 500, {"detail": "Migration failed"})
+                return
+            await respond(writer, 200, result)
+        elif method == "POST" and parts == ["cluster", "rebalance"]:
+            await respond(writer, 200, {"moved": await self.rebalance()})
+        else:
+            await respond(writer, 404, {"detail": "Not Found"})
+
+    async def _call(self, worker: Worker, method: str, path: str, payload: dict = None) -> Tuple[int, Optional[dict]]:
+        """One request to a worker's internal API."""
+        body = json.dumps(payload).encode() if payload is not None else b""
+        reader, writer = await asyncio.open_unix_connection(worker.socket_path)
+        try:
+            writer.write(
+                f"{method} {path} HTTP/1.1\r\nHost: worker\r\nX-Supervisor-Token: {self.token}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            # Draining waits for the room's connections to flush
+            response = await asyncio.wait_for(reader.read(), settings.MIGRATION_DRAIN_TIMEOUT + 10)
+        finally:
+            writer.close()
+        head, _, content = response.partition(b"\r\n\r\n")
+        status = int(head.split(b" ", 2)[1])
+        return status, json.loads(content) if content else None
+
+    def _spawn(self, worker: Worker):
+        if os.path.exists(worker.socket_path):
+            os.unlink(worker.socket_path)
+        env = {
+            **os.environ,
+            # Rooms don't span workers, so nothing needs sharing beyond the room store
+            "ROOM_BACKEND": "memory",
+            "SUPERVISOR_WORKERS": "0",
+            "SUPERVISOR_TOKEN": self.token
+        }
+        worker.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "main:app",
+                "--uds", worker.socket_path,
+                "--ws-per-message-deflate", str(settings.WS_PER_MESSAGE_DEFLATE).lower(),
+                "--ws-max-size", str(settings.WS_MAX_FRAME_BYTES),
+                "--ws-ping-interval", str(settings.WS_PROTOCOL_PING_INTERVAL),
+                "--ws-ping-timeout", str(settings.WS_PROTOCOL_PING_INTERVAL),
+                "--log-level", settings.LOG_LEVEL.lower()
+            ],
+            cwd=APP_DIR,
+            env=env
+        )
+        worker.revisions = {}
+
+    async def _wait_ready(self, worker: Worker):
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        while True:
+            if not worker.alive:
+                raise RuntimeError(f"Worker {worker.index} exited while starting")
+            try:
+                status, _ = await self._call(worker, "GET", "/internal/load")
+                if status == 200:
+                    return
+            except (ConnectionError, OSError, IndexError, ValueError):
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Worker {worker.index} didn't start within {WORKER_START_TIMEOUT:g}s")
+            await asyncio.sleep(0.1)
+
+    async def _watch(self):
+        # Restart workers that die; their rooms come back from the room store
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            for worker in self.workers:
+                if self._stopping or worker.alive:
+                    continue
+                logger.warning(f"Worker {worker.index} exited with code {worker.process.returncode}, restarting")
+                worker.restarts += 1
+                self._spawn(worker)
+
+    async def _rebalance_periodically(self):
+        while True:
+            await asyncio.sleep(self.rebalance_interval)
+            try:
+                await self.rebalance()
+            except Exception as e:
+                logger.error(f"Error rebalancing rooms: {e}")
+
+    def _request_stop(self, stopped: asyncio.Event):
+        # Workers in the same process group get the signal too; don't restart them
+        self._stopping = True
+        stopped.set()
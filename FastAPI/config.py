@@ -25,16 +25,67 @@ class Settings:
         ALLOWED_ORIGINS.append(os.getenv("FRONTEND_URL"))
     
     # WebSocket settings
-    WS_HEARTBEAT_INTERVAL: int = 30  # seconds
-    WS_TIMEOUT: int = 60  # seconds
+    WS_HEARTBEAT_INTERVAL: int = int(os.getenv("WS_HEARTBEAT_INTERVAL", "30"))  # seconds idle before a ping, 0 disables
+    WS_TIMEOUT: int = int(os.getenv("WS_TIMEOUT", "60"))  # seconds idle before a connection that answers pings is reaped
+    WS_PROTOCOL_PING_INTERVAL: float = float(os.getenv("WS_PROTOCOL_PING_INTERVAL", "20"))  # seconds between protocol-level pings, and to wait for their pong
+    BROADCAST_TICK_MS: int = int(os.getenv("BROADCAST_TICK_MS", "25"))  # outbound coalescing window, 0 disables
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))  # frames buffered per connection
+    WS_SLOW_CONSUMER_POLICY: str = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_stale")  # drop_stale, resync or disconnect
+    WS_MAX_FRAME_BYTES: int = int(os.getenv("WS_MAX_FRAME_BYTES", "2097152"))  # largest inbound frame, refused before decoding
+    WS_MAX_BYTES_PER_SECOND: int = int(os.getenv("WS_MAX_BYTES_PER_SECOND", "4194304"))  # inbound per connection before reads pause, 0 disables
+    WS_ADMISSION_CONTROL: bool = os.getenv("WS_ADMISSION_CONTROL", "True").lower() == "true"  # per-type inbound rate limits
+    WS_PER_MESSAGE_DEFLATE: bool = os.getenv("WS_PER_MESSAGE_DEFLATE", "True").lower() == "true"  # offer permessage-deflate
+    WS_COMPRESS_MIN_BYTES: int = int(os.getenv("WS_COMPRESS_MIN_BYTES", "4096"))  # smallest frame deflated for ?compress=deflate without permessage-deflate, 0 disables
+    WS_COMPRESS_LEVEL: int = int(os.getenv("WS_COMPRESS_LEVEL", "6"))  # zlib level, 1 (fast) to 9 (small)
+    SYNC_CACHE_ROOMS: int = int(os.getenv("SYNC_CACHE_ROOMS", "64"))  # rooms whose encoded sync is kept, 0 disables
     
     # Room settings
     MAX_ROOM_SIZE: int = int(os.getenv("MAX_ROOM_SIZE", "10"))
-    ROOM_CLEANUP_INTERVAL: int = 300  # 5 minutes
+    MAX_SPECTATORS: int = int(os.getenv("MAX_SPECTATORS", "1000"))  # read-only viewers per room, on top of MAX_ROOM_SIZE
+    SPECTATOR_INTERVAL_MS: int = int(os.getenv("SPECTATOR_INTERVAL_MS", "250"))  # at most one frame per interval to spectators
+    ROOM_CLEANUP_INTERVAL: int = int(os.getenv("ROOM_CLEANUP_INTERVAL", "300"))  # 5 minutes
+    ROOM_IDLE_TTL: int = int(os.getenv("ROOM_IDLE_TTL", "3600"))  # seconds an empty room is kept
+    ROOM_MEMORY_BUDGET_MB: int = int(os.getenv("ROOM_MEMORY_BUDGET_MB", "512"))  # total document size across rooms
+    
+    # Collaborative editing settings
+    OT_HISTORY_LIMIT: int = int(os.getenv("OT_HISTORY_LIMIT", "1000"))  # revisions kept for transforming late ops
+    
+    # Room backend settings
+    ROOM_BACKEND: str = os.getenv("ROOM_BACKEND", "memory")  # memory or redis
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    REDIS_LOG_COMPACT_EVERY: int = int(os.getenv("REDIS_LOG_COMPACT_EVERY", "1000"))  # log entries between room snapshots, 0 never trims
+    WORKERS: int = int(os.getenv("WORKERS", "1"))  # more than one needs a shared backend
+    
+    # Room-sharded cluster settings
+    SUPERVISOR_WORKERS: int = int(os.getenv("SUPERVISOR_WORKERS", "0"))  # worker processes each owning a share of the rooms, 0 disables
+    SUPERVISOR_TOKEN: str = os.getenv("SUPERVISOR_TOKEN", "")  # shared secret for the internal and /cluster endpoints; generated when unset, leaving /cluster closed
+    SUPERVISOR_VNODES: int = int(os.getenv("SUPERVISOR_VNODES", "64"))  # hash ring points per worker
+    REBALANCE_INTERVAL: int = int(os.getenv("REBALANCE_INTERVAL", "30"))  # seconds between load checks, 0 disables
+    REBALANCE_RATIO: float = float(os.getenv("REBALANCE_RATIO", "1.5"))  # busiest worker's load over the mean before a room moves
+    MIGRATION_DRAIN_TIMEOUT: float = float(os.getenv("MIGRATION_DRAIN_TIMEOUT", "5"))  # seconds to flush a moving room's connections
+    
+    # Persistence settings
+    ROOM_STORE_PATH: str = os.getenv("ROOM_STORE_PATH", "rooms.db")  # empty to keep rooms in memory only
+    ROOM_STORE_FLUSH_INTERVAL: float = float(os.getenv("ROOM_STORE_FLUSH_INTERVAL", "0.5"))  # seconds
+    ROOM_SNAPSHOT_EVERY: int = int(os.getenv("ROOM_SNAPSHOT_EVERY", "500"))  # ops between snapshots
     
     # Autocomplete settings
     MAX_SUGGESTIONS: int = 5
-    AUTOCOMPLETE_TIMEOUT: float = 1.0  # seconds
+    AUTOCOMPLETE_TIMEOUT: float = float(os.getenv("AUTOCOMPLETE_TIMEOUT", "1.0"))  # seconds
+    AUTOCOMPLETE_POOL: str = os.getenv("AUTOCOMPLETE_POOL", "process")  # process, or thread (holds the GIL against the event loop)
+    AUTOCOMPLETE_WORKERS: int = int(os.getenv("AUTOCOMPLETE_WORKERS", "2"))  # 0 runs requests on the event loop
+    AUTOCOMPLETE_MAX_PENDING: int = int(os.getenv("AUTOCOMPLETE_MAX_PENDING", "32"))  # requests in flight before shedding
+    AUTOCOMPLETE_MAX_BATCH: int = int(os.getenv("AUTOCOMPLETE_MAX_BATCH", "256"))  # positions x prefixes per batch request
+    AUTOCOMPLETE_CACHE_SIZE: int = int(os.getenv("AUTOCOMPLETE_CACHE_SIZE", "4096"))  # cached results, 0 disables
+    AUTOCOMPLETE_CACHE_TTL: float = float(os.getenv("AUTOCOMPLETE_CACHE_TTL", "60"))  # seconds
+    
+    # Diagnostics settings
+    LOOP_MONITOR_INTERVAL_MS: int = int(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100"))  # event loop lag probe period, 0 disables
+    LOOP_STALL_THRESHOLD_MS: int = int(os.getenv("LOOP_STALL_THRESHOLD_MS", "100"))  # loop blocked this long has its stack captured
+    LOOP_STALLS_KEPT: int = int(os.getenv("LOOP_STALLS_KEPT", "20"))  # recent stalls kept for /debug/loop
+    PROFILE_MAX_SECONDS: float = float(os.getenv("PROFILE_MAX_SECONDS", "30"))  # longest /debug/profile run
+    PROFILE_SIGNALS: bool = os.getenv("PROFILE_SIGNALS", "False").lower() == "true"  # sample with SIGALRM rather than a thread
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")  # required as X-Admin-Token; the /debug endpoints don't exist without it
     
     # Logging
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
@@ -1,4 +1,6 @@
+import asyncio
 import logging
+import secrets
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,6 +8,13 @@ from contextlib import asynccontextmanager
 
 from config import settings
 from api.routes import router
+from backends.room_backend import room_backend
+from cluster.supervisor import Supervisor
+from services.autocomplete_pool import autocomplete_pool
+from services.loop_monitor import loop_monitor
+from services.room_lifecycle import room_lifecycle
+from services.room_store import room_store
+from websocket.connection_manager import connection_manager
 
 # Configure logging
 logging.basicConfig(
@@ -19,9 +28,21 @@ async def lifespan(app: FastAPI):
     """Application lifespan events."""
     # Startup
     logger.info(f"Starting {settings.PROJECT_NAME} v{settings.VERSION}")
+    loop_monitor.start()
+    await room_store.start()
+    await room_backend.start()
+    room_lifecycle.start()
+    connection_manager.heartbeat.start()
+    await autocomplete_pool.start()
     yield
     # Shutdown
     logger.info("Shutting down application")
+    autocomplete_pool.stop()
+    await connection_manager.heartbeat.stop()
+    await room_lifecycle.stop()
+    await room_backend.stop()
+    await room_store.stop()
+    await loop_monitor.stop()
 
 def create_app() -> FastAPI:
     """Create and configure FastAPI application."""
@@ -59,6 +80,37 @@ def main():
             host=settings.HOST,
             port=settings.PORT,
             reload=True,
+            ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE,
+            ws_max_size=settings.WS_MAX_FRAME_BYTES,
+            ws_ping_interval=settings.WS_PROTOCOL_PING_INTERVAL,
+            ws_ping_timeout=settings.WS_PROTOCOL_PING_INTERVAL,
+            log_level=settings.LOG_LEVEL.lower()
+        )
+    elif settings.SUPERVISOR_WORKERS > 0:
+        # Each room lives in one worker process; the supervisor routes its connections there
+        supervisor = Supervisor(
+            settings.SUPERVISOR_WORKERS,
+            settings.HOST,
+            settings.PORT,
+            settings.SUPERVISOR_TOKEN or secrets.token_hex(16),
+            settings.SUPERVISOR_VNODES,
+            settings.REBALANCE_INTERVAL,
+            settings.REBALANCE_RATIO
+        )
+        asyncio.run(supervisor.run())
+    elif settings.WORKERS > 1:
+        # Workers share rooms through the backend, so an in-memory one would split them
+        if settings.ROOM_BACKEND == "memory":
+            logger.warning("Running several workers with the memory backend; rooms won't be shared")
+        uvicorn.run(
+            "main:app",
+            host=settings.HOST,
+            port=settings.PORT,
+            workers=settings.WORKERS,
+            ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE,
+            ws_max_size=settings.WS_MAX_FRAME_BYTES,
+            ws_ping_interval=settings.WS_PROTOCOL_PING_INTERVAL,
+            ws_ping_timeout=settings.WS_PROTOCOL_PING_INTERVAL,
             log_level=settings.LOG_LEVEL.lower()
         )
     else:
@@ -67,6 +119,10 @@ def main():
             app,
             host=settings.HOST,
             port=settings.PORT,
+            ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE,
+            ws_max_size=settings.WS_MAX_FRAME_BYTES,
+            ws_ping_interval=settings.WS_PROTOCOL_PING_INTERVAL,
+            ws_ping_timeout=settings.WS_PROTOCOL_PING_INTERVAL,
             log_level=settings.LOG_LEVEL.lower()
         )
 
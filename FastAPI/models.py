@@ -1,9 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
-
-class Room(BaseModel):
-    code: str = ""
-    users: List[str] = []
+from typing import Any, Dict, List, Optional
 
 class AutocompleteRequest(BaseModel):
     code: str
@@ -12,6 +8,22 @@ class AutocompleteRequest(BaseModel):
 
 class AutocompleteResponse(BaseModel):
     suggestions: List[str]
+    prefix: str = ""  # typed text the suggestions replace
+
+class AutocompleteBatchRequest(BaseModel):
+    code: str
+    cursor_positions: List[int]
+    prefixes: List[str] = []  # text that may be typed next at each cursor, for prefetching
+    language: str = "python"
+
+class AutocompleteBatchResult(BaseModel):
+    cursor_position: int
+    typed: str = ""  # the candidate from `prefixes` these suggestions assume
+    suggestions: List[str]
+    prefix: str = ""
+
+class AutocompleteBatchResponse(BaseModel):
+    results: List[AutocompleteBatchResult]
 
 class WebSocketMessage(BaseModel):
     type: str
@@ -19,10 +31,23 @@ class WebSocketMessage(BaseModel):
     position: Optional[int] = None
     user_id: Optional[str] = None
     users: Optional[List[str]] = None
+    revision: Optional[int] = None
+    ops: Optional[List[Dict[str, Any]]] = None
+    request_id: Optional[Any] = None
+    language: Optional[str] = None
+    suggestions: Optional[List[str]] = None
 
 class RoomResponse(BaseModel):
     room_id: str
 
+class RoomSnapshot(BaseModel):
+    """A room's state as handed from one worker to another."""
+    room_id: str
+    code: str
+    revision: int
+    epoch: str
+    history: List[List[Dict[str, Any]]] = []  # ops per revision, oldest first, so clients can still resume
+
 class ErrorResponse(BaseModel):
     error: str
     detail: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Set, Tuple
+from config import settings
+from services.metrics import metrics
+
+# Lines longer than this aren't cached; they rarely repeat and make keys expensive
+MAX_CONTEXT_LENGTH = 256
+
+# (suggestions, prefix)
+Entry = Tuple[Tuple[str, ...], str]
+
+
+class AutocompleteCache:
+    """LRU cache of autocomplete results with a time-to-live.
+
+    Keys describe everything a result depends on: the analyzer, the line up
+    to the cursor, the tokenizer state the line starts in and whether the
+    cursor is inside a def or class. Results that also rank words from a
+    room's document add the room and its revision. Only the latest revision
+    of a room is kept, so an edit invalidates the room's entries the first
+    time a newer revision is seen.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Key -> (expiry, entry, room the entry belongs to)
+        self.entries: "OrderedDict[Hashable, Tuple[float, Entry, Optional[str]]]" = OrderedDict()
+        # Room -> (revision its entries were computed at, their keys)
+        self.rooms: Dict[str, Tuple[int, Set[Hashable]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # Pool threads look results up alongside the event loop
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable, document: Optional[Tuple[str, int]] = None) -> Optional[Entry]:
+        with self.lock:
+            if document is not None:
+                room_id, revision = document
+                tracked = self.rooms.get(room_id)
+                if tracked is None or tracked[0] != revision:
+                    self.misses += 1
+                    return None
+
+            item = self.entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires, entry, _ = item
+            if expires < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, entry: Entry, document: Optional[Tuple[str, int]] = None):
+        with self.lock:
+            if self.max_entries <= 0:
+                return
+            room_id = None
+            if document is not None:
+                room_id, revision = document
+                tracked = self.rooms.get(room_id)
+                if tracked is not None and tracked[0] > revision:
+                    # Computed against a revision that has already been superseded
+                    return
+                if tracked is None or tracked[0] != revision:
+                    self._forget_room(room_id)
+                    tracked = self.rooms[room_id] = (revision, set())
+                tracked[1].add(key)
+
+            self.entries[key] = (time.monotonic() + self.ttl, entry, room_id)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def forget_room(self, room_id: str):
+        with self.lock:
+            self._forget_room(room_id)
+
+    def get_stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
+
+    def _forget_room(self, room_id: str):
+        tracked = self.rooms.pop(room_id, None)
+        if tracked is None:
+            return
+        for key in tracked[1]:
+            if self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def _remove(self, key: Hashable):
+        _, _, room_id = self.entries.pop(key)
+        tracked = self.rooms.get(room_id) if room_id is not None else None
+        if tracked is not None:
+            tracked[1].discard(key)
+            if not tracked[1]:
+                del self.rooms[room_id]
+
+# Global autocomplete cache instance
+autocomplete_cache = AutocompleteCache(settings.AUTOCOMPLETE_CACHE_SIZE, settings.AUTOCOMPLETE_CACHE_TTL)
+
+metrics.gauge("autocomplete_cache_entries", "Autocomplete results held in the cache", lambda: len(autocomplete_cache.entries))
+metrics.sampled_counter("autocomplete_cache_hits_total", "Autocomplete cache hits", lambda: autocomplete_cache.hits)
+metrics.sampled_counter("autocomplete_cache_misses_total", "Autocomplete cache misses", lambda: autocomplete_cache.misses)
+metrics.sampled_counter(
+    "autocomplete_cache_evictions_total", "Autocomplete cache entries dropped, by reason",
+    lambda: {
+        ("lru",): autocomplete_cache.evictions,
+        ("expired",): autocomplete_cache.expirations,
+        ("invalidated",): autocomplete_cache.invalidations
+    },
+    ("reason",)
+)
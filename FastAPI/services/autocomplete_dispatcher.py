@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Tuple
+from services.autocomplete_service import AUTOCOMPLETE_SECONDS, autocomplete_service
+from services.merge_service import merge_service
+from services.metrics import metrics
+from services.room_service import room_service
+from websocket.connection_manager import connection_manager
+
+logger = logging.getLogger(__name__)
+
+
+class AutocompleteDispatcher:
+    """Answers in-band autocomplete_request messages from the room's own document.
+
+    Requests carry only a cursor position and the revision it was taken at;
+    the position is rebased over edits the client hasn't seen yet and
+    looked up in the room's document index. Each user has at most one
+    request in flight, and a newer one cancels it.
+    """
+
+    def __init__(self):
+        self.tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.served = 0
+        self.cancelled = 0
+        self.stale = 0
+
+    def submit(self, room_id: str, user_id: str, message: dict):
+        key = (room_id, user_id)
+        previous = self.tasks.get(key)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.cancelled += 1
+        self.tasks[key] = asyncio.create_task(self._answer(room_id, user_id, message))
+
+    def cancel(self, room_id: str, user_id: str):
+        task = self.tasks.pop((room_id, user_id), None)
+        if task is not None and not task.done():
+            task.cancel()
+
+    def build_response(self, room_id: str, message: dict) -> dict:
+        revision = room_service.get_room_revision(room_id)
+        response = {
+            "type": "autocomplete_response",
+            "request_id": message.get("request_id"),
+            "suggestions": [],
+            "prefix": "",
+            "revision": revision
+        }
+
+        position = message.get("position")
+        base = message.get("revision", revision)
+        index = room_service.get_room_index(room_id)
+        if index is None or not isinstance(position, int) or not isinstance(base, int):
+            return response
+
+        position = merge_service.rebase_position(room_id, base, position)
+        if position is None:
+            # The client is too far behind to place its cursor; it will resync
+            self.stale += 1
+            return response
+
+        language = message.get("language") or "python"
+        suggestions = autocomplete_service.get_suggestions_at(index, position, language, (room_id, revision))
+        response["suggestions"] = suggestions.suggestions
+        response["prefix"] = suggestions.prefix
+        return response
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": sum(not task.done() for task in self.tasks.values()),
+            "served": self.served,
+            "cancelled": self.cancelled,
+            "stale": self.stale
+        }
+
+    async def _answer(self, room_id: str, user_id: str, message: dict):
+        key = (room_id, user_id)
+        started = time.perf_counter()
+        try:
+            # Yield once so a request already superseded by the next frame is dropped unanswered
+            await asyncio.sleep(0)
+            response = self.build_response(room_id, message)
+            await connection_manager.send_now(room_id, user_id, response)
+            self.served += 1
+            AUTOCOMPLETE_SECONDS.observe(time.perf_counter() - started, "inband")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error answering autocomplete for user {user_id} in room {room_id}: {e}")
+        finally:
+            if self.tasks.get(key) is asyncio.current_task():
+                del self.tasks[key]
+
+# Global autocomplete dispatcher instance
+autocomplete_dispatcher = AutocompleteDispatcher()
+
+metrics.sampled_counter(
+    "autocomplete_inband_cancelled_total", "In-band autocomplete requests superseded before they were answered",
+    lambda: autocomplete_dispatcher.cancelled
+)
+metrics.sampled_counter(
+    "autocomplete_inband_stale_total", "In-band autocomplete requests too far behind to rebase",
+    lambda: autocomplete_dispatcher.stale
+)
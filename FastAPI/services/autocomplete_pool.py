@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from config import settings
+from models import AutocompleteBatchRequest, AutocompleteBatchResponse, AutocompleteRequest, AutocompleteResponse
+from services.autocomplete_cache import autocomplete_cache
+from services.autocomplete_service import autocomplete_service
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    # Results are cached by the parent, so a worker's own cache would only hold unreported copies
+    autocomplete_cache.max_entries = 0
+
+
+def _suggest(code: str, cursor_position: int, language: str) -> Tuple[List[str], str]:
+    # Runs in a worker, so it takes and returns plain values that pickle cheaply
+    response = autocomplete_service.get_suggestions(
+        AutocompleteRequest(code=code, cursor_position=cursor_position, language=language)
+    )
+    return response.suggestions, response.prefix
+
+
+def _suggest_batch(code: str, cursor_positions: List[int], prefixes: List[str], language: str) -> List[tuple]:
+    response = autocomplete_service.get_batch_suggestions(AutocompleteBatchRequest(
+        code=code, cursor_positions=cursor_positions, prefixes=prefixes, language=language
+    ))
+    return [(result.cursor_position, result.typed, result.suggestions, result.prefix) for result in response.results]
+
+
+class AutocompletePool:
+    """Runs POST /autocomplete analysis off the event loop with a deadline.
+
+    Work goes to a thread or process pool. A request that isn't answered
+    within `timeout` gets an empty response; work that hasn't started yet
+    is cancelled, and work already running finishes in the background but
+    still counts against `max_pending`. Past that many requests in flight,
+    new ones are shed with an empty response instead of queueing.
+
+    Process workers are the default: the analyzers are pure Python and
+    hold the GIL, so only separate processes keep a flood of requests from
+    delaying WebSocket broadcasts. The result cache stays in this process.
+    A request whose cache key can be found without tokenizing earlier lines
+    is looked up before it is dispatched, and its result is stored when it
+    comes back. Other requests and batches are computed by the worker
+    without caching. Thread workers share the cache directly, but they
+    compete with the event loop for the GIL and don't protect broadcast
+    latency. With no workers, requests run inline as before.
+    """
+
+    def __init__(self, mode: str, workers: int, max_pending: int, timeout: float):
+        self.mode = mode
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.executor: Optional[Executor] = None
+        self.pending = 0
+        self.completed = 0
+        self.timed_out = 0
+        self.shed = 0
+        self.restarts = 0
+        # Finished work is released from pool threads
+        self.lock = threading.Lock()
+        # Requests that all saw the same pool break restart it once between them
+        self.restart_lock = asyncio.Lock()
+
+    async def start(self):
+        if self.executor is not None or self.workers <= 0:
+            return
+        if self.mode == "process":
+            # Spawned workers don't inherit the event loop or open sockets from this process
+            self.executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+            )
+        else:
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="autocomplete")
+        # Start the workers now rather than on the first request, which would otherwise time out
+        await asyncio.gather(*(
+            asyncio.wrap_future(self.executor.submit(_suggest, "", 0, "python")) for _ in range(self.workers)
+        ))
+        logger.info(f"Autocomplete pool started with {self.workers} {self.mode} workers")
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def get_suggestions(self, request: AutocompleteRequest) -> AutocompleteResponse:
+        if self.executor is None:
+            return autocomplete_service.get_suggestions(request)
+
+        # Thread workers look the result up themselves
+        key = autocomplete_service.cache_key(request) if self.mode == "process" else None
+        if key is not None:
+            entry = autocomplete_cache.get(key)
+            if entry is not None:
+                return AutocompleteResponse(suggestions=list(entry[0]), prefix=entry[1])
+
+        result = await self._run(_suggest, request.code, request.cursor_position, request.language)
+        if result is None:
+            return AutocompleteResponse(suggestions=[])
+        suggestions, prefix = result
+        if key is not None:
+            autocomplete_cache.put(key, (tuple(suggestions), prefix))
+        return AutocompleteResponse(suggestions=suggestions, prefix=prefix)
+
+    async def get_batch_suggestions(self, request: AutocompleteBatchRequest) -> AutocompleteBatchResponse:
+        if self.executor is None:
+            return autocomplete_service.get_batch_suggestions(request)
+
+        # A batch is one unit of work: it counts once against max_pending and shares one deadline
+        result = await self._run(
+            _suggest_batch, request.code, request.cursor_positions, request.prefixes, request.language
+        )
+        if result is None:
+            return AutocompleteBatchResponse(results=[])
+        return AutocompleteBatchResponse(results=[
+            {"cursor_position": position, "typed": typed, "suggestions": suggestions, "prefix": prefix}
+            for position, typed, suggestions, prefix in result
+        ])
+
+    async def _run(self, function: Callable, *args):
+        """Result of `function(*args)` on the pool, or None if shed or late."""
+        if self.pending >= self.max_pending:
+            self.shed += 1
+            return None
+
+        executor = self.executor
+        try:
+            future = executor.submit(function, *args)
+            with self.lock:
+                self.pending += 1
+            # Only work that has actually finished frees its slot, whatever the caller saw
+            future.add_done_callback(self._release)
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            return None
+        except BrokenExecutor:
+            # A worker died; replace the pool so later requests aren't all refused
+            await self._restart(executor)
+            return None
+        self.completed += 1
+        return result
+
+    def get_stats(self) -> Dict[str, object]:
+        return {
+            "mode": self.mode if self.executor is not None else "inline",
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "timed_out": self.timed_out,
+            "shed": self.shed,
+            "restarts": self.restarts
+        }
+
+    async def _restart(self, broken: Executor):
+        async with self.restart_lock:
+            if self.executor is not broken:
+                # Already replaced by another request that saw it break, or stopped
+                return
+            logger.error("Autocomplete pool broke, restarting it")
+            self.restarts += 1
+            self.stop()
+            await self.start()
+
+    def _release(self, _future):
+        with self.lock:
+            self.pending -= 1
+
+# Global autocomplete pool instance
+autocomplete_pool = AutocompletePool(
+    settings.AUTOCOMPLETE_POOL,
+    settings.AUTOCOMPLETE_WORKERS,
+    settings.AUTOCOMPLETE_MAX_PENDING,
+    settings.AUTOCOMPLETE_TIMEOUT
+)
+
+metrics.gauge("autocomplete_pool_pending", "Autocomplete requests running or queued on the pool",
+              lambda: autocomplete_pool.pending)
+metrics.sampled_counter("autocomplete_pool_timeouts_total", "Autocomplete requests answered empty after the deadline",
+                        lambda: autocomplete_pool.timed_out)
+metrics.sampled_counter("autocomplete_pool_shed_total", "Autocomplete requests shed because the pool was full",
+                        lambda: autocomplete_pool.shed)
+metrics.sampled_counter("autocomplete_pool_restarts_total", "Times the autocomplete pool was replaced after breaking",
+                        lambda: autocomplete_pool.restarts)
@@ -1,173 +1,175 @@
-from typing import List
-from models import AutocompleteRequest, AutocompleteResponse
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+from config import settings
+from models import (
+    AutocompleteBatchRequest, AutocompleteBatchResponse, AutocompleteBatchResult, AutocompleteRequest,
+    AutocompleteResponse
+)
+from analyzers.base import Analyzer
+from analyzers.registry import analyzer_registry
+from services.autocomplete_cache import MAX_CONTEXT_LENGTH, autocomplete_cache
+from services.completion_index import WordIndex, rank_completions
+from services.document_index import DocumentIndex, classify
+from services.metrics import metrics
+
+# Lines walked back from a cursor for its scope when keying a request on the event loop
+MAX_SCOPE_LINES = 200
+
+# Recorded by the callers that await a result, so queueing and deadlines are included
+AUTOCOMPLETE_SECONDS = metrics.histogram(
+    "autocomplete_request_seconds", "Autocomplete latency as seen by the client, by endpoint", ("endpoint",)
+)
 
 class AutocompleteService:
     
     def __init__(self):
-        self.python_keywords = [
-            "def", "class", "if", "elif", "else", "for", "while", "try", "except", 
-            "finally", "with", "import", "from", "return", "yield", "lambda"
-        ]
-        
-        self.common_methods = [
-            "append()", "extend()", "insert()", "remove()", "pop()", "clear()",
-            "index()", "count()", "sort()", "reverse()", "copy()",
-            "split()", "join()", "replace()", "strip()", "lower()", "upper()",
-            "startswith()", "endswith()", "find()", "format()"
-        ]
-        
-        self.common_modules = [
-            "os", "sys", "json", "requests", "datetime", "time", "random",
-            "math", "re", "collections", "itertools", "functools"
-        ]
-        
-        self.builtin_functions = [
-            "print()", "len()", "str()", "int()", "float()", "bool()", "list()",
-            "dict()", "tuple()", "set()", "range()", "enumerate()", "zip()",
-            "map()", "filter()", "sorted()", "reversed()", "sum()", "min()", "max()"
-        ]
+        self.analyzers = analyzer_registry
     
     def get_suggestions(self, request: AutocompleteRequest) -> AutocompleteResponse:
         code = request.code
         cursor_position = request.cursor_position
-        language = request.language.lower()
-        
-        # Get current line up to cursor
-        text_before_cursor = code[:cursor_position]
-        current_line = text_before_cursor.split('\n')[-1]
+        analyzer = self.analyzers.get(request.language)
         
-        if language == "python":
-            suggestions = self._analyze_python_context(current_line, text_before_cursor)
-        elif language == "javascript" or language == "typescript":
-            suggestions = self._analyze_js_context(current_line, text_before_cursor)
-        else:
-            suggestions = self._analyze_generic_context(current_line, text_before_cursor)
+        # Get current line up to cursor without copying the text before it
+        cursor_position = max(0, min(cursor_position, len(code)))
+        line_start = code.rfind('\n', 0, cursor_position) + 1
+        current_line = code[line_start:cursor_position]
         
-        # Return top 3 suggestions
-        return AutocompleteResponse(suggestions=suggestions[:3])
+        return self._respond(
+            analyzer, current_line, self._line_start_state(analyzer, code, line_start),
+            lambda: self._is_in_function_or_class(code, cursor_position)
+        )
     
-    def _analyze_python_context(self, current_line: str, text_before_cursor: str) -> List[str]:
-        suggestions = []
-        line_stripped = current_line.strip()
-        
-        # Function definition completion
-        if "def " in current_line and "(" in current_line and "):" not in current_line:
-            suggestions.append("):")
+    def cache_key(self, request: AutocompleteRequest) -> Optional[Hashable]:
+        """Key `request`'s result is cached under, or None if finding it would mean tokenizing earlier lines.
         
-        # Control structure completion
-        elif any(keyword in current_line for keyword in ["if ", "elif ", "for ", "while ", "try:", "except:", "with "]) and ":" not in current_line:
-            suggestions.append(":")
-        
-        # Class definition completion
-        elif "class " in current_line and ":" not in current_line:
-            suggestions.append(":")
-        
-        # Method chaining (object.method)
-        elif line_stripped.endswith("."):
-            suggestions.extend(self.common_methods)
-        
-        # Import statement completion
-        elif "import " in current_line or "from " in current_line:
-            suggestions.extend(self.common_modules)
-        
-        # Function call patterns
-        elif line_stripped.endswith("("):
-            if "print(" in current_line:
-                suggestions.extend(['"Hello, World!"', 'f"Value: {variable}"', 'variable'])
-            elif "len(" in current_line:
-                suggestions.extend(['list_name', 'string_name', 'dict_name'])
-        
-        # Default suggestions for general context
-        else:
-            # Add builtin functions
-            suggestions.extend(self.builtin_functions)
-            
-            # Add keywords based on context
-            if self._is_in_function_or_class(text_before_cursor):
-                suggestions.extend(["return ", "yield ", "raise "])
-            
-            # Add common patterns
-            suggestions.extend([
-                'if __name__ == "__main__":',
-                "try:",
-                "except Exception as e:",
-                "with open() as f:",
-            ])
-        
-        return list(dict.fromkeys(suggestions))  # Remove duplicates while preserving order
+        Cheap enough to run on the event loop before handing a request to a
+        worker process: it only searches the text before the line and walks
+        back a bounded number of lines for the enclosing def or class.
+        """
+        code = request.code
+        analyzer = self.analyzers.get(request.language)
+        cursor_position = max(0, min(request.cursor_position, len(code)))
+        line_start = code.rfind('\n', 0, cursor_position) + 1
+        context = code[line_start:cursor_position].lstrip()
+        if len(context) > MAX_CONTEXT_LENGTH:
+            return None
+        if any(code.find(marker, 0, line_start) >= 0 for marker in analyzer.multiline_markers):
+            return None
+        scope = self._is_in_function_or_class(code, cursor_position, MAX_SCOPE_LINES)
+        if scope is None:
+            return None
+        return (analyzer.name, context, analyzer.initial_state, scope, None)
     
-    def _analyze_js_context(self, current_line: str, text_before_cursor: str) -> List[str]:
-        """Analyze JavaScript/TypeScript context and return relevant suggestions."""
-        suggestions = []
-        line_stripped = current_line.strip()
+    def get_batch_suggestions(self, request: AutocompleteBatchRequest) -> AutocompleteBatchResponse:
+        """Suggestions for many cursors in one document, optionally after each candidate in `prefixes`.
         
-        # Function definition completion
-        if "function " in current_line and "(" in current_line and "){" not in current_line:
-            suggestions.append(") {")
-        
-        # Arrow function completion
-        elif "=>" not in current_line and "=" in current_line:
-            suggestions.append("=> {")
-        
-        # Control structure completion
-        elif any(keyword in current_line for keyword in ["if ", "for ", "while ", "switch "]) and "{" not in current_line:
-            suggestions.append(" {")
-        
-        # Method chaining
-        elif line_stripped.endswith("."):
-            suggestions.extend(["map()", "filter()", "reduce()", "forEach()", "find()", "includes()"])
-        
-        # Import/require statements
-        elif "import " in current_line or "require(" in current_line:
-            suggestions.extend(["react", "lodash", "axios", "express", "fs"])
-        
-        # Console methods
-        elif "console." in current_line:
-            suggestions.extend(["log()", "error()", "warn()", "info()"])
-        
-        # Default suggestions
-        else:
-            suggestions.extend([
-                "console.log()",
-                "const ",
-                "let ",
-                "function ",
-                "if (",
-                "for (",
-                "return ",
-                "async ",
-                "await ",
-                "try {",
-                "catch (error) {"
-            ])
-        
-        return list(dict.fromkeys(suggestions))
+        Cursors are visited in document order so the tokenizer state is
+        carried forward in one pass rather than rescanned for each cursor.
+        """
+        code = request.code
+        analyzer = self.analyzers.get(request.language)
+        candidates = request.prefixes or [""]
+        scan = any(marker in code for marker in analyzer.multiline_markers)
+        state = analyzer.initial_state
+        scanned = 0
+        
+        answers = {}
+        for cursor_position in sorted(set(max(0, min(position, len(code))) for position in request.cursor_positions)):
+            line_start = code.rfind('\n', 0, cursor_position) + 1
+            if scan:
+                state = self._advance_state(analyzer, code, scanned, line_start, state)
+                scanned = line_start
+            current_line = code[line_start:cursor_position]
+            scope = self._is_in_function_or_class(code, cursor_position)
+            for typed in candidates:
+                answers[cursor_position, typed] = self._respond(analyzer, current_line + typed, state, lambda: scope)
+        
+        results = []
+        for position in request.cursor_positions:
+            for typed in candidates:
+                response = answers[max(0, min(position, len(code))), typed]
+                results.append(AutocompleteBatchResult(
+                    cursor_position=position, typed=typed, suggestions=response.suggestions, prefix=response.prefix
+                ))
+        return AutocompleteBatchResponse(results=results)
     
-    def _analyze_generic_context(self, current_line: str, text_before_cursor: str) -> List[str]:
-        suggestions = []
-        line_stripped = current_line.strip()
-        
-        # Basic programming constructs
-        if line_stripped.endswith("."):
-            suggestions.extend(["length", "size", "count"])
-        elif "if" in current_line and "(" not in current_line:
-            suggestions.append("(")
-        elif "for" in current_line and "(" not in current_line:
-            suggestions.append("(")
-        else:
-            suggestions.extend(["if", "for", "while", "function", "return"])
-        
-        return list(dict.fromkeys(suggestions))
+    def get_suggestions_at(self, index: DocumentIndex, cursor_position: int, language: str,
+                           document: Optional[Tuple[str, int]] = None) -> AutocompleteResponse:
+        """Suggestions for a position in an indexed room document.
+        
+        `document` is the (room_id, revision) the index is at; results are
+        only cached when it is given, since they rank the document's words.
+        """
+        analyzer = self.analyzers.get(language)
+        state = index.line_start_state(analyzer.name, analyzer.end_state, analyzer.initial_state, cursor_position)
+        return self._respond(
+            analyzer, index.line_before(cursor_position), state,
+            lambda: index.is_in_function_or_class(cursor_position), index.words, document
+        )
+    
+    def _respond(self, analyzer: Analyzer, current_line: str, state: Any, in_function_or_class: Callable[[], bool],
+                 words: Optional[WordIndex] = None, document: Optional[Tuple[str, int]] = None) -> AutocompleteResponse:
+        # Indentation never changes the result, so lines differing only in it share an entry
+        context = current_line.lstrip()
+        if len(context) > MAX_CONTEXT_LENGTH or (words is not None and document is None):
+            suggestions, prefix = self._suggest(analyzer, current_line, state, in_function_or_class, words)
+            return AutocompleteResponse(suggestions=suggestions[:3], prefix=prefix)
+        
+        scope = in_function_or_class()
+        key = (analyzer.name, context, state, scope, document)
+        entry = autocomplete_cache.get(key, document)
+        if entry is None:
+            suggestions, prefix = self._suggest(analyzer, current_line, state, lambda: scope, words)
+            # Return top 3 suggestions
+            entry = (tuple(suggestions[:3]), prefix)
+            autocomplete_cache.put(key, entry, document)
+        return AutocompleteResponse(suggestions=list(entry[0]), prefix=entry[1])
+    
+    def _suggest(self, analyzer: Analyzer, current_line: str, state: Any,
+                 in_function_or_class: Callable[[], bool], words: Optional[WordIndex] = None) -> Tuple[List[str], str]:
+        """Context suggestions, or ranked completions of a partly typed word with that word."""
+        tokens, _ = analyzer.tokenize(current_line, state)
+        if analyzer.in_literal(tokens, state):
+            # Nothing useful to suggest inside a string or comment
+            return [], ""
+        
+        prefix = analyzer.word_prefix(tokens, current_line)
+        if prefix:
+            completions = rank_completions(prefix, settings.MAX_SUGGESTIONS, analyzer.vocabulary, words)
+            if completions:
+                return completions, prefix
+        
+        return list(dict.fromkeys(analyzer.suggest(tokens, in_function_or_class))), ""
+    
+    def _line_start_state(self, analyzer: Analyzer, code: str, line_start: int) -> Any:
+        # Without an index, only tokenize the text before the line if it could open a multi-line construct
+        if not any(code.find(marker, 0, line_start) >= 0 for marker in analyzer.multiline_markers):
+            return analyzer.initial_state
+        return self._advance_state(analyzer, code, 0, line_start, analyzer.initial_state)
+    
+    def _advance_state(self, analyzer: Analyzer, code: str, start: int, line_start: int, state: Any) -> Any:
+        """Carry `state` at the line starting at `start` forward to the line starting at `line_start`."""
+        if line_start <= start:
+            return state
+        for line in code[start:line_start - 1].split('\n'):
+            state = analyzer.end_state(line, state)
+        return state
     
-    def _is_in_function_or_class(self, text: str) -> bool:
-        lines = text.split('\n')
-        for line in reversed(lines):
-            stripped = line.strip()
-            if stripped.startswith('def ') or stripped.startswith('class '):
-                return True
-            elif stripped and not line.startswith(' ') and not line.startswith('\t'):
-                break
-        return False
+    def _is_in_function_or_class(self, code: str, position: int, max_lines: Optional[int] = None) -> Optional[bool]:
+        # Walk back one line at a time until a def/class header or an unindented line,
+        # giving up with None after max_lines
+        end = position
+        lines = 0
+        while max_lines is None or lines < max_lines:
+            start = code.rfind('\n', 0, end) + 1
+            kind = classify(code[start:end])
+            if kind is not None:
+                return kind
+            if start == 0:
+                return False
+            end = start - 1
+            lines += 1
+        return None
 
 # Global autocomplete service instance
 autocomplete_service = AutocompleteService()
\ No newline at end of file
@@ -0,0 +1,200 @@
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Completions cached at every trie node
+TOP_K = 8
+
+# Each touch is worth twice as much as one made this many touches earlier
+HALF_LIFE = 200
+
+# Rescale scores before the growing touch weight gets close to float limits
+MAX_EXPONENT = 512
+
+WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]+")
+
+
+class _TrieNode:
+    __slots__ = ("children", "word", "top", "dirty")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.word: Optional[str] = None
+        self.top: List[str] = []
+        self.dirty = False
+
+
+class PrefixTrie:
+    """Prefix trie whose nodes cache their best-scoring completions.
+
+    Every node keeps the top `top_k` words below it, so a lookup is a walk
+    down the prefix plus a slice. Raising a word's score only touches the
+    nodes on its path. Removing a word marks the nodes that listed it, and
+    they rebuild from their children's lists on the next lookup.
+    """
+
+    def __init__(self, top_k: int = TOP_K):
+        self.top_k = top_k
+        self.root = _TrieNode()
+        self.scores: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.scores
+
+    def add(self, word: str, weight: float):
+        """Add a word or raise its score by `weight`."""
+        score = self.scores[word] = self.scores.get(word, 0.0) + weight
+        node = self.root
+        self._promote(node, word, score)
+        for char in word:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _TrieNode()
+            node = child
+            self._promote(node, word, score)
+        node.word = word
+
+    def remove(self, word: str):
+        if self.scores.pop(word, None) is None:
+            return
+        path = [self.root]
+        for char in word:
+            path.append(path[-1].children[char])
+        path[-1].word = None
+
+        for node in path:
+            if word in node.top:
+                node.dirty = True
+        # Prune branches that no longer lead to any word
+        for depth in range(len(word), 0, -1):
+            node = path[depth]
+            if node.word is not None or node.children:
+                break
+            del path[depth - 1].children[word[depth - 1]]
+
+    def complete(self, prefix: str, k: int) -> List[Tuple[str, float]]:
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        if node.dirty:
+            self._rebuild(node)
+        return [(word, self.scores[word]) for word in node.top[:k]]
+
+    def rescale(self, factor: float):
+        # Dividing every score keeps the cached orderings valid
+        for word in self.scores:
+            self.scores[word] /= factor
+
+    def _promote(self, node: _TrieNode, word: str, score: float):
+        if node.dirty:
+            return
+        top = node.top
+        if word in top:
+            top.remove(word)
+        elif len(top) >= self.top_k and self.scores[top[-1]] >= score:
+            return
+        index = 0
+        while index < len(top) and self.scores[top[index]] >= score:
+            index += 1
+        top.insert(index, word)
+        del top[self.top_k:]
+
+    def _rebuild(self, node: _TrieNode):
+        candidates = [node.word] if node.word is not None else []
+        for child in node.children.values():
+            if child.dirty:
+                self._rebuild(child)
+            candidates.extend(child.top)
+        candidates.sort(key=lambda word: -self.scores[word])
+        node.top = candidates[:self.top_k]
+        node.dirty = False
+
+
+class WordIndex:
+    """Words used in a document, ranked by how often and how recently.
+
+    Scores are frecency: every occurrence written adds a weight that doubles
+    every HALF_LIFE edits, so recent use outweighs old use without any
+    score having to decay. Words leave the index when their last
+    occurrence is deleted.
+    """
+
+    def __init__(self, top_k: int = TOP_K):
+        self.trie = PrefixTrie(top_k)
+        self.counts: Dict[str, int] = {}
+        self.clock = 0
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def tick(self):
+        """Advance the clock once per edit."""
+        self.clock += 1
+        if self.clock >= MAX_EXPONENT * HALF_LIFE:
+            self.trie.rescale(2.0 ** (self.clock / HALF_LIFE))
+            self.clock = 0
+
+    def add(self, text: str):
+        weight = 2.0 ** (self.clock / HALF_LIFE)
+        # One trie update per distinct word, however often it occurs
+        for word, count in Counter(WORD.findall(text)).items():
+            self.counts[word] = self.counts.get(word, 0) + count
+            self.trie.add(word, weight * count)
+
+    def discard(self, text: str):
+        for word in WORD.findall(text):
+            count = self.counts.get(word, 0) - 1
+            if count > 0:
+                self.counts[word] = count
+            elif word in self.counts:
+                del self.counts[word]
+                self.trie.remove(word)
+
+    def complete(self, prefix: str, k: int) -> List[Tuple[str, float]]:
+        return self.trie.complete(prefix, k)
+
+
+class Vocabulary:
+    """Fixed completions for a language, such as keywords and builtins.
+
+    Words are ranked by their order in the lists with scores below one,
+    so anything the document itself uses outranks them.
+    """
+
+    def __init__(self, entries: Iterable[str], top_k: int = TOP_K):
+        self.trie = PrefixTrie(top_k)
+        self.display: Dict[str, str] = {}
+        entries = list(dict.fromkeys(entries))
+        for rank, entry in enumerate(entries):
+            match = WORD.match(entry)
+            if match is None or match.group() in self.display:
+                continue
+            # "print()" is looked up as "print" but suggested as written
+            self.display[match.group()] = entry
+            self.trie.add(match.group(), 1.0 - rank / (2 * len(entries)))
+
+    def complete(self, prefix: str, k: int) -> List[Tuple[str, float]]:
+        return self.trie.complete(prefix, k)
+
+
+def rank_completions(prefix: str, k: int, vocabulary: Optional[Vocabulary],
+                     words: Optional[WordIndex] = None) -> List[str]:
+    """Merge document words and fixed vocabulary into the k best completions of `prefix`."""
+    candidates: Dict[str, float] = {}
+    if vocabulary is not None:
+        for word, score in vocabulary.complete(prefix, k + 1):
+            candidates[word] = score
+    if words is not None:
+        for word, score in words.complete(prefix, k + 1):
+            candidates[word] = candidates.get(word, 0.0) + score
+    # The word being typed is in the document too; suggesting it again is no help
+    candidates.pop(prefix, None)
+
+    ranked = sorted(candidates, key=lambda word: (-candidates[word], word))[:k]
+    display = vocabulary.display if vocabulary is not None else {}
+    return [display.get(word, word) for word in ranked]
@@ -0,0 +1,339 @@
+import re
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from services.completion_index import WordIndex
+
+# Lines are kept in blocks of about this many; an edit only rescans its own block
+BLOCK_SIZE = 64
+
+# Names introduced by definitions, assignments and imports in Python and JavaScript
+_DEFINITION = re.compile(
+    r"^\s*(?:(?:async\s+)?def|class|function\*?|const|let|var)\s+([A-Za-z_$][\w$]*)"
+    r"|^\s*([A-Za-z_$][\w$]*)\s*(?::[^=]*)?=(?!=)"
+    r"|^\s*import\s+([A-Za-z_]\w*)"
+)
+_IMPORTED = re.compile(r"^\s*from\s+\S+\s+import\s+(.+)$")
+
+# Placeholder for line states not computed yet; None is a valid state
+_UNKNOWN = object()
+
+
+def _is_header(stripped: str) -> bool:
+    return stripped.startswith("def ") or stripped.startswith("class ")
+
+
+def classify(line: str) -> Optional[bool]:
+    """True for a def/class header, False for any other unindented line, else None."""
+    stripped = line.strip()
+    if _is_header(stripped):
+        return True
+    if stripped and line[0] not in " \t":
+        return False
+    return None
+
+
+def definitions(line: str) -> List[str]:
+    imported = _IMPORTED.match(line)
+    if imported:
+        names = [part.split(" as ")[-1].strip(" ()") for part in imported.group(1).split(",")]
+        return [name for name in names if name.isidentifier()]
+    match = _DEFINITION.match(line)
+    if match is None:
+        return []
+    return [next(name for name in match.groups() if name)]
+
+
+class _Fenwick:
+    """Prefix sums over per-block counts with O(log n) updates and searches."""
+
+    __slots__ = ("tree",)
+
+    def __init__(self, values: List[int]):
+        tree = [0] + values
+        for index in range(1, len(tree)):
+            parent = index + (index & -index)
+            if parent < len(tree):
+                tree[parent] += tree[index]
+        self.tree = tree
+
+    def add(self, index: int, delta: int):
+        index += 1
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index: int) -> int:
+        """Sum of the first `index` values."""
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def search(self, value: int) -> Tuple[int, int]:
+        """Largest index whose prefix sum is <= value, with that prefix sum."""
+        index, remaining = 0, value
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            following = index + step
+            if following < len(self.tree) and self.tree[following] <= remaining:
+                index = following
+                remaining -= self.tree[following]
+            step >>= 1
+        return index, value - remaining
+
+
+class _Block:
+    __slots__ = ("lines", "chars", "marker")
+
+    def __init__(self, lines: List[str]):
+        self.lines = lines
+        self.refresh()
+
+    def refresh(self):
+        # Every line counts its newline; the document total drops the last one
+        self.chars = sum(len(line) for line in self.lines) + len(self.lines)
+        # Classification of the last line that ends a backwards scope scan
+        self.marker = None
+        for line in reversed(self.lines):
+            kind = classify(line)
+            if kind is not None:
+                self.marker = kind
+                break
+
+
+class LineStates:
+    """Tokenizer state at the start of every line, recomputed lazily after edits.
+
+    States are valid for the first `known` lines. An edit only invalidates
+    states after the edited line, and records the line after it as stale.
+    The next lookup resumes from the last valid state and, as soon as a
+    recomputed state matches one computed before the edit, jumps ahead to
+    the next stale line, because every line in between tokenizes the same
+    way it did.
+    """
+
+    __slots__ = ("advance", "states", "known", "computed", "stale")
+
+    def __init__(self, advance: Callable[[str, Any], Any], initial: Any, line_count: int):
+        self.advance = advance
+        self.states: List[Any] = [initial] + [_UNKNOWN] * (line_count - 1)
+        self.known = 1
+        self.computed = 1
+        # Sorted lines whose stored state may not follow from the line before
+        self.stale: List[int] = []
+
+    def splice(self, line: int, removed: int, added: int):
+        """Lines line..line+removed-1 were replaced by `added` new lines."""
+        self.states[line + 1:line + removed] = [_UNKNOWN] * (added - 1)
+        delta = added - removed
+        self.known = min(self.known, line + 1)
+        if self.computed > line + removed:
+            self.computed += delta
+        elif self.computed > line + 1:
+            self.computed = line + 1
+
+        low = bisect_right(self.stale, line)
+        high = bisect_right(self.stale, line + removed)
+        following = self.stale[high:]
+        if delta:
+            following = [number + delta for number in following]
+        self.stale[low:] = [line + 1] + following if line + 1 < self.computed else following
+
+    def get(self, number: int, lines_from: Callable[[int], Iterator[str]]) -> Any:
+        """State at the start of line `number`; `lines_from(n)` yields the document's lines from n on."""
+        while number >= self.known:
+            index = self.known - 1
+            state = self.states[index]
+            for line in lines_from(index):
+                state = self.advance(line, state)
+                index += 1
+                if index < self.computed and self.states[index] == state:
+                    # Converged with the states from before the edit, up to the next stale line
+                    del self.stale[:bisect_right(self.stale, index)]
+                    self.known = self.stale[0] if self.stale else self.computed
+                    break
+                self.states[index] = state
+                self.known = index + 1
+                if index == number:
+                    break
+            self.computed = max(self.computed, self.known)
+            # Stored states from `known` on still chain from the old text
+            del self.stale[:bisect_left(self.stale, self.known)]
+            if self.known < self.computed and (not self.stale or self.stale[0] != self.known):
+                self.stale.insert(0, self.known)
+        return self.states[number]
+
+
+class DocumentIndex:
+    """Line and scope index over a document, kept current edit by edit.
+
+    Lines live in small blocks whose character and line counts are summed in
+    Fenwick trees, so mapping a cursor position to its line is a logarithmic
+    search plus a scan of one block, and an edit only rebuilds the block it
+    touches. Each block also remembers the last line that decides whether
+    the code below it is inside a def or class, so scope checks skip whole
+    blocks. Words used in the document are kept ranked for completion, and
+    analyzers keep their per-line tokenizer states in `line_states`.
+    """
+
+    def __init__(self, text: str = ""):
+        lines = text.split("\n")
+        self.length = len(text)
+        self.identifiers: Counter = Counter()
+        for line in lines:
+            self.identifiers.update(definitions(line))
+        self.words = WordIndex()
+        self.words.add(text)
+        self.blocks = [_Block(lines[index:index + BLOCK_SIZE]) for index in range(0, len(lines), BLOCK_SIZE)]
+        self._chars: Optional[_Fenwick] = None
+        self._lines: Optional[_Fenwick] = None
+        self.line_states: Dict[str, LineStates] = {}
+
+    def __len__(self) -> int:
+        return self.length
+
+    @property
+    def line_count(self) -> int:
+        self._sums()
+        return self._lines.prefix(len(self.blocks))
+
+    def apply(self, ops: List[dict]):
+        """Apply validated insert/delete ops in sequence."""
+        for op in ops:
+            if op["op"] == "insert":
+                self.replace(op["pos"], op["pos"], op["text"])
+            else:
+                self.replace(op["pos"], op["pos"] + op["length"], "")
+
+    def replace(self, start: int, end: int, text: str):
+        if not 0 <= start <= end <= self.length:
+            raise IndexError("Range out of bounds")
+
+        first_block, first_line, first_column = self._locate(start)
+        last_block, last_line, last_column = self._locate(end)
+        first_number = self._lines.prefix(first_block) + first_line
+        head = self.blocks[first_block].lines[first_line][:first_column]
+        tail = self.blocks[last_block].lines[last_line][last_column:]
+        new_lines = (head + text + tail).split("\n")
+        block_count = len(self.blocks)
+        touched = self.blocks[first_block:first_block + 2]
+        before = [(block.chars, len(block.lines)) for block in touched]
+
+        if first_block == last_block:
+            removed = self.blocks[first_block].lines[first_line:last_line + 1]
+            self.blocks[first_block].lines[first_line:last_line + 1] = new_lines
+        else:
+            removed = self.blocks[first_block].lines[first_line:]
+            for block in self.blocks[first_block + 1:last_block]:
+                removed.extend(block.lines)
+            removed.extend(self.blocks[last_block].lines[:last_line + 1])
+            self.blocks[first_block].lines[first_line:] = new_lines
+            del self.blocks[last_block].lines[:last_line + 1]
+            del self.blocks[first_block + 1:last_block]
+
+        for line in removed:
+            for name in definitions(line):
+                self.identifiers[name] -= 1
+                if self.identifiers[name] <= 0:
+                    del self.identifiers[name]
+        for line in new_lines:
+            self.identifiers.update(definitions(line))
+        self.words.tick()
+        for line in removed:
+            self.words.discard(line)
+        for line in new_lines:
+            self.words.add(line)
+
+        self.length += len(text) - (end - start)
+        self._rebalance(first_block)
+        for states in self.line_states.values():
+            states.splice(first_number, len(removed), len(new_lines))
+
+        if len(self.blocks) != block_count or self._chars is None:
+            # Blocks were split, merged or dropped; rebuild the sums on next use
+            self._chars = self._lines = None
+        else:
+            for offset, (block, (chars, lines)) in enumerate(zip(touched, before)):
+                self._chars.add(first_block + offset, block.chars - chars)
+                self._lines.add(first_block + offset, len(block.lines) - lines)
+
+    def line_before(self, position: int) -> str:
+        """Text of the cursor's line up to the cursor."""
+        block, line, column = self._locate(position)
+        return self.blocks[block].lines[line][:column]
+
+    def line_number(self, position: int) -> int:
+        block, line, _ = self._locate(position)
+        return self._lines.prefix(block) + line
+
+    def lines_from(self, number: int) -> Iterator[str]:
+        self._sums()
+        block, first = self._lines.search(number)
+        offset = number - first
+        for index in range(block, len(self.blocks)):
+            yield from self.blocks[index].lines[offset:]
+            offset = 0
+
+    def line_start_state(self, key: str, advance: Callable[[str, Any], Any], initial: Any, position: int) -> Any:
+        """Tokenizer state at the start of the cursor's line, for the tokenizer named `key`."""
+        number = self.line_number(position)
+        states = self.line_states.get(key)
+        if states is None:
+            states = self.line_states[key] = LineStates(advance, initial, self.line_count)
+        return states.get(number, self.lines_from)
+
+    def is_in_function_or_class(self, position: int) -> bool:
+        block, line, column = self._locate(position)
+        kind = classify(self.blocks[block].lines[line][:column])
+        if kind is not None:
+            return kind
+        for previous in reversed(self.blocks[block].lines[:line]):
+            kind = classify(previous)
+            if kind is not None:
+                return kind
+        for index in range(block - 1, -1, -1):
+            if self.blocks[index].marker is not None:
+                return self.blocks[index].marker
+        return False
+
+    def _locate(self, position: int) -> Tuple[int, int, int]:
+        position = max(0, min(position, self.length))
+        block, offset = self._sums().search(position)
+        if block == len(self.blocks):
+            # Only reachable at the very end of the document
+            block -= 1
+            offset -= self.blocks[block].chars
+        lines = self.blocks[block].lines
+        for index, line in enumerate(lines):
+            if position <= offset + len(line):
+                return block, index, position - offset
+            offset += len(line) + 1
+        return block, len(lines) - 1, len(lines[-1])
+
+    def _sums(self) -> _Fenwick:
+        if self._chars is None:
+            self._chars = _Fenwick([block.chars for block in self.blocks])
+            self._lines = _Fenwick([len(block.lines) for block in self.blocks])
+        return self._chars
+
+    def _rebalance(self, index: int):
+        block = self.blocks[index]
+        if len(block.lines) > 2 * BLOCK_SIZE:
+            lines = block.lines
+            self.blocks[index:index + 1] = [
+                _Block(lines[offset:offset + BLOCK_SIZE]) for offset in range(0, len(lines), BLOCK_SIZE)
+            ]
+            return
+
+        following = self.blocks[index + 1] if index + 1 < len(self.blocks) else None
+        if following is not None and len(block.lines) + len(following.lines) <= BLOCK_SIZE:
+            block.lines.extend(following.lines)
+            del self.blocks[index + 1]
+        elif following is not None and not following.lines:
+            del self.blocks[index + 1]
+        elif following is not None:
+            # The tail of a multi-block edit may have changed the following block too
+            following.refresh()
+        block.refresh()
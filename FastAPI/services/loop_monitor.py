@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from config import settings
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Innermost frames kept from a blocked loop's stack
+STACK_LIMIT = 40
+
+LAG_SECONDS = metrics.histogram(
+    "event_loop_lag_seconds", "How late the event loop ran a timer due now, sampled every probe interval"
+)
+
+
+class LoopMonitor:
+    """Event loop lag probe and watchdog for callbacks that block the loop.
+
+    A task sleeps for `interval` at a time and records how late it woke up,
+    which is how long everything else on the loop waited at that moment.
+    A watchdog thread checks when the task last ran: once the loop has been
+    stuck for `threshold`, the callback holding it is still running, so the
+    loop thread's stack is captured there and then and logged. The probe
+    costs one timer per interval and the watchdog one check per half
+    threshold, so it can stay on in production.
+    """
+
+    def __init__(self, interval: float, threshold: float, kept: int):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls: Deque[Dict[str, object]] = deque(maxlen=kept)
+        self.stall_count = 0
+        self.probes = 0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        # Monotonic time the probe last ran, and the stall the watchdog caught since (with the
+        # beat it was measured from), shared between the two threads
+        self._beat = 0.0
+        self._stall: Optional[Tuple[float, Dict[str, object]]] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._run())
+        if self.threshold > 0:
+            self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._thread.start()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._stopped.set()
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    def get_stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "interval_ms": round(self.interval * 1000, 3),
+            "threshold_ms": round(self.threshold * 1000, 3),
+            "probes": self.probes,
+            "last_lag_ms": round(self.last_lag * 1000, 3),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "stalls": self.stall_count
+        }
+
+    def get_stalls(self) -> List[Dict[str, object]]:
+        """Recent stalls, newest first."""
+        return list(reversed(self.stalls))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - due
+            if lag < 0:
+                lag = 0.0
+            previous, self._beat = self._beat, time.monotonic()
+            self.probes += 1
+            self.last_lag = lag
+            if lag > self.max_lag:
+                self.max_lag = lag
+            LAG_SECONDS.observe(lag)
+
+            caught = self._stall
+            if caught is not None:
+                self._stall = None
+                beat, stall = caught
+                if beat == previous:
+                    # The watchdog saw this one while it was happening; now it's known how long it was
+                    stall["blocked_ms"] = round(lag * 1000, 3)
+
+    def _watch(self):
+        # Runs on its own thread, so it can look at the loop thread while a callback blocks it
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.threshold or self._stall is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            summary = traceback.StackSummary.extract(traceback.walk_stack(frame), limit=STACK_LIMIT, lookup_lines=False)
+            stack = [f"{entry.filename}:{entry.lineno} in {entry.name}" for entry in reversed(summary)]
+            stall = {"at": time.time(), "blocked_ms": round(blocked * 1000, 3), "stack": stack}
+            self.stalls.append(stall)
+            self.stall_count += 1
+            self._stall = (beat, stall)
+            logger.warning(f"Event loop blocked for over {blocked * 1000:.0f} ms in:\n  " + "\n  ".join(stack[-10:]))
+
+# Global loop monitor instance
+loop_monitor = LoopMonitor(
+    settings.LOOP_MONITOR_INTERVAL_MS / 1000,
+    settings.LOOP_STALL_THRESHOLD_MS / 1000,
+    settings.LOOP_STALLS_KEPT
+)
+
+# Counted on the watchdog thread, so exported when scraped rather than incremented there
+metrics.sampled_counter(
+    "event_loop_stalls_total", "Times a callback blocked the event loop for longer than the stall threshold",
+    lambda: loop_monitor.stall_count
+)
@@ -0,0 +1,214 @@
+import itertools
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from config import settings
+from services.room_service import room_service
+
+# Ops are the same dicts used on the wire, applied in sequence:
+#   {"op": "insert", "pos": int, "text": str}
+#   {"op": "delete", "pos": int, "length": int}
+
+
+def _insert(position: int, text: str) -> dict:
+    return {"op": "insert", "pos": position, "text": text}
+
+
+def _delete(position: int, length: int) -> List[dict]:
+    return [{"op": "delete", "pos": position, "length": length}] if length > 0 else []
+
+
+def _insert_vs_delete(ins: dict, dele: dict) -> Tuple[List[dict], List[dict]]:
+    position, start, length = ins["pos"], dele["pos"], dele["length"]
+    inserted = len(ins["text"])
+
+    if position <= start:
+        return [ins], _delete(start + inserted, length)
+    if position >= start + length:
+        return [_insert(position - length, ins["text"])], [dele]
+
+    # Insert landed inside the deleted range: keep the new text, delete around it
+    before = position - start
+    return [_insert(start, ins["text"])], _delete(start, before) + _delete(start + inserted, length - before)
+
+
+def _delete_vs_delete(a: dict, b: dict) -> List[dict]:
+    a_start, a_end = a["pos"], a["pos"] + a["length"]
+    b_start, b_end = b["pos"], b["pos"] + b["length"]
+
+    if a_end <= b_start:
+        return [a]
+    if a_start >= b_end:
+        return _delete(a_start - b["length"], a["length"])
+
+    overlap = min(a_end, b_end) - max(a_start, b_start)
+    return _delete(min(a_start, b_start), a["length"] - overlap)
+
+
+def _transform_component(a: dict, b: dict, a_first: bool) -> Tuple[List[dict], List[dict]]:
+    if a["op"] == "insert" and b["op"] == "insert":
+        if a["pos"] < b["pos"] or (a["pos"] == b["pos"] and a_first):
+            return [a], [_insert(b["pos"] + len(a["text"]), b["text"])]
+        return [_insert(a["pos"] + len(b["text"]), a["text"])], [b]
+
+    if a["op"] == "insert":
+        return _insert_vs_delete(a, b)
+
+    if b["op"] == "insert":
+        b_out, a_out = _insert_vs_delete(b, a)
+        return a_out, b_out
+
+    return _delete_vs_delete(a, b), _delete_vs_delete(b, a)
+
+
+def _transform_single(a: dict, b_ops: List[dict], a_first: bool) -> Tuple[List[dict], List[dict]]:
+    a_parts = [a]
+    b_out: List[dict] = []
+    for b in b_ops:
+        if len(a_parts) == 1:
+            a_parts, b_parts = _transform_component(a_parts[0], b, a_first)
+        else:
+            a_parts, b_parts = transform_ops(a_parts, [b], a_first)
+        b_out.extend(b_parts)
+    return a_parts, b_out
+
+
+def transform_ops(a_ops: List[dict], b_ops: List[dict], a_first: bool) -> Tuple[List[dict], List[dict]]:
+    """Transform two op sequences made against the same document.
+
+    Returns (a', b') such that applying b then a' gives the same text as
+    applying a then b'. `a_first` breaks ties between inserts at the same
+    position. Cost is O(len(a) * len(b)), independent of document size.
+    """
+    a_out: List[dict] = []
+    for a in a_ops:
+        a_parts, b_ops = _transform_single(a, b_ops, a_first)
+        a_out.extend(a_parts)
+    return a_out, b_ops
+
+
+def transform_position(position: int, ops: List[dict]) -> int:
+    """Move a cursor position over ops applied after it was taken."""
+    for op in ops:
+        if op["op"] == "insert":
+            # Text typed exactly at the cursor stays after it
+            if op["pos"] < position:
+                position += len(op["text"])
+        elif op["pos"] < position:
+            position -= min(op["length"], position - op["pos"])
+    return position
+
+
+def is_well_formed(ops: List[dict]) -> bool:
+    if not isinstance(ops, list):
+        return False
+    for op in ops:
+        if not isinstance(op, dict) or not isinstance(op.get("pos"), int) or op["pos"] < 0:
+            return False
+        if op.get("op") == "insert":
+            if not isinstance(op.get("text"), str):
+                return False
+        elif op.get("op") == "delete":
+            if not isinstance(op.get("length"), int) or op["length"] < 0:
+                return False
+        else:
+            return False
+    return True
+
+
+class MergeService:
+    """Server-side operational transform for concurrent room edits.
+
+    The server is the single source of ordering: every accepted op gets the
+    next room revision. Ops made against an older revision are transformed
+    over the ops applied since then, so concurrent edits merge instead of
+    overwriting each other.
+    """
+
+    def __init__(self, history_limit: int = settings.OT_HISTORY_LIMIT):
+        self.history_limit = history_limit
+        self.histories: Dict[str, Deque[List[dict]]] = {}
+
+    def submit(self, room_id: str, revision: int, ops: List[dict]) -> Optional[Tuple[int, List[dict]]]:
+        """Merge ops made against `revision` into the room document.
+
+        Returns the assigned revision and the transformed ops to broadcast,
+        or None when the client has to resync (unknown room, malformed ops,
+        or a base revision older than the kept history).
+        """
+        if not room_service.room_exists(room_id) or not is_well_formed(ops):
+            return None
+
+        current = room_service.get_room_revision(room_id)
+        if not isinstance(revision, int) or revision > current:
+            return None
+
+        history = self._history(room_id)
+        missing = current - revision
+        if missing > len(history):
+            return None
+        if missing:
+            concurrent = [op for entry in itertools.islice(history, len(history) - missing, None) for op in entry]
+            ops, _ = transform_ops(ops, concurrent, a_first=False)
+
+        new_revision = room_service.apply_room_delta(room_id, current, ops)
+        if new_revision is None:
+            return None
+
+        history.append(ops)
+        return new_revision, ops
+
+    def rebase_position(self, room_id: str, revision: int, position: int) -> Optional[int]:
+        """Map a position in `revision` of the document onto the current revision.
+
+        Returns None when the revision is ahead of the room or older than the
+        kept history.
+        """
+        missing = room_service.get_room_revision(room_id) - revision
+        history = self._history(room_id)
+        if missing < 0 or missing > len(history):
+            return None
+        for entry in itertools.islice(history, len(history) - missing, None):
+            position = transform_position(position, entry)
+        return position
+
+    def changes_since(self, room_id: str, epoch: str, revision: int) -> Optional[List[dict]]:
+        """The ops that bring `revision` of the document up to the current revision.
+
+        Returns None when the client has to take a full sync instead: the
+        room has been replaced or reloaded since (a different epoch), or the
+        revision is ahead of the room or older than the kept history.
+        """
+        if not isinstance(revision, int) or epoch is None or room_service.get_room_epoch(room_id) != epoch:
+            return None
+        missing = room_service.get_room_revision(room_id) - revision
+        history = self._history(room_id)
+        if missing < 0 or missing > len(history):
+            return None
+        return [op for entry in itertools.islice(history, len(history) - missing, None) for op in entry]
+
+    def skip(self, room_id: str) -> int:
+        """Consume a revision with no change, for sequenced ops that were rejected."""
+        revision = room_service.apply_room_delta(room_id, room_service.get_room_revision(room_id), [])
+        self._history(room_id).append([])
+        return revision
+
+    def get_history(self, room_id: str) -> List[List[dict]]:
+        """The kept ops, oldest first, one list per revision up to the current one."""
+        return list(self.histories.get(room_id, ()))
+
+    def set_history(self, room_id: str, history: List[List[dict]]):
+        # Taking over a room from another worker keeps its clients able to resume
+        self.histories[room_id] = deque(history, maxlen=self.history_limit)
+
+    def reset(self, room_id: str):
+        # A full document replace invalidates every older base revision
+        self.histories.pop(room_id, None)
+
+    def _history(self, room_id: str) -> Deque[List[dict]]:
+        history = self.histories.get(room_id)
+        if history is None:
+            history = self.histories[room_id] = deque(maxlen=self.history_limit)
+        return history
+
+# Global merge service instance
+merge_service = MergeService()
@@ -0,0 +1,181 @@
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+# Exposition format served on /metrics; the response adds the charset
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Upper bounds in seconds, from 50µs message handling up to slow autocomplete
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+)
+
+Labels = Tuple[str, ...]
+Sample = Union[float, Dict[Labels, float]]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    """Monotonic count, one series per combination of label values.
+
+    Recording is a dict update with no locking; everything is updated from
+    the event loop thread.
+    """
+
+    __slots__ = ("name", "help", "labelnames", "values")
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self.values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        if not self.values and not self.labelnames:
+            return [f"{self.name} 0"]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self.values.items()
+        ]
+
+
+class Histogram:
+    """Distribution of observed values over fixed buckets.
+
+    Each series is a flat list of per-bucket counts followed by the running
+    sum, so an observation is one bisect and two list updates. Counts are
+    made cumulative only when rendered.
+    """
+
+    __slots__ = ("name", "help", "labelnames", "buckets", "series")
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Labels -> counts per bucket, then the +Inf bucket, then the sum
+        self.series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def get_count(self, *labels: str) -> int:
+        series = self.series.get(labels)
+        return sum(series[:-1]) if series is not None else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, series in self.series.items():
+            names = self.labelnames + ("le",)
+            total = 0
+            for bound, count in zip(bounds, series):
+                total += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (bound,))} {total}")
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{suffix} {total}")
+        return lines
+
+
+class Sampled:
+    """Gauge or counter read from existing state when metrics are scraped.
+
+    The callback returns a number, or a dict of label values to numbers for
+    labelled metrics. Nothing is recorded on the hot path.
+    """
+
+    __slots__ = ("name", "help", "kind", "labelnames", "callback")
+
+    def __init__(self, name: str, help: str, kind: str, callback: Callable[[], Sample], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def samples(self) -> List[str]:
+        value = self.callback()
+        if not isinstance(value, dict):
+            return [f"{self.name} {_format_value(value)}"]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(sample)}"
+            for labels, sample in value.items()
+        ]
+
+
+Metric = Union[Counter, Histogram, Sampled]
+
+
+class MetricsRegistry:
+    """Named metrics rendered together in the Prometheus text format.
+
+    Modules register what they record at import time and keep the returned
+    metric in a module constant, so the hot path never looks a metric up
+    by name.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, callback: Callable[[], Sample], labelnames: Sequence[str] = ()) -> Sampled:
+        return self._register(Sampled(name, help, "gauge", callback, labelnames))
+
+    def sampled_counter(self, name: str, help: str, callback: Callable[[], Sample],
+                        labelnames: Sequence[str] = ()) -> Sampled:
+        """A counter some service already keeps, exposed without recording it twice."""
+        return self._register(Sampled(name, help, "counter", callback, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+# Global metrics registry instance
+metrics = MetricsRegistry()
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from types import CodeType, FrameType
+from typing import Dict, List, Optional, Tuple
+from config import settings
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Source root, stripped from frame labels along with everything up to site-packages
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+# Sampling period bounds in seconds; below a millisecond the sampler itself starts to show
+MIN_SAMPLE_INTERVAL = 0.001
+MAX_SAMPLE_INTERVAL = 0.1
+
+PROFILE_SECONDS = metrics.counter("profile_seconds_total", "Time spent running on-demand sampling profiles")
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(APP_DIR):
+        return filename[len(APP_DIR):]
+    marker = filename.rfind("site-packages" + os.sep)
+    if marker >= 0:
+        return filename[marker + len("site-packages") + 1:]
+    return os.path.basename(filename)
+
+
+class SamplingProfiler:
+    """Time-boxed statistical profiler for the live process.
+
+    Every `interval` of wall-clock time, the stack the event loop is
+    running is recorded and each distinct stack counted. Nothing is
+    instrumented, so there is no cost between profiles. By default a
+    sampler thread reads the loop thread's frames. It only gets the GIL
+    when the loop gives it up, mostly while waiting in `select`, so a busy
+    loop is under-sampled. With `signals`, an interval timer interrupts
+    the loop's (main) thread with SIGALRM and the handler walks the
+    interrupted frames, which samples evenly. That takes over the process's
+    SIGALRM handler and ITIMER_REAL while a profile runs, so it has to be
+    enabled explicitly. `all_threads` profiles and loops off the main
+    thread always use the sampler thread.
+
+    Stacks are returned in the collapsed format flamegraph tools read:
+    frames from the root down separated by `;`, a space, and the number of
+    samples. The loop waiting for I/O shows up as its selector's `select`
+    frame, so idle time is visible too.
+    """
+
+    def __init__(self, max_seconds: float, signals: bool = False):
+        self.max_seconds = max_seconds
+        self.signals = signals
+        self.running = False
+        self.profiles = 0
+        self.samples = 0
+        self._labels: Dict[CodeType, str] = {}
+
+    async def profile(self, seconds: float, interval: float, all_threads: bool = False) -> Tuple[str, int]:
+        """Sample for `seconds` and return the collapsed stacks and the number of samples taken."""
+        if self.running:
+            raise ProfilerBusy("A profile is already running")
+        seconds = min(max(seconds, interval), self.max_seconds)
+        interval = min(max(interval, MIN_SAMPLE_INTERVAL), MAX_SAMPLE_INTERVAL)
+        use_signals = (self.signals and not all_threads and hasattr(signal, "setitimer")
+                       and threading.current_thread() is threading.main_thread())
+
+        self.running = True
+        started = time.perf_counter()
+        try:
+            if use_signals:
+                counts, samples = await self._sample_loop(seconds, interval)
+            else:
+                only = None if all_threads else threading.get_ident()
+                counts, samples = await asyncio.to_thread(self._sample_threads, seconds, interval, only)
+        finally:
+            self.running = False
+            PROFILE_SECONDS.inc(amount=time.perf_counter() - started)
+        self.profiles += 1
+        self.samples += samples
+        logger.info(f"Profiled for {seconds:g}s: {samples} samples, {len(counts)} distinct stacks")
+        lines = [f"{stack} {count}" for stack, count in sorted(counts.items(), key=lambda item: -item[1])]
+        return "\n".join(lines) + "\n" if lines else "", samples
+
+    def get_stats(self) -> Dict[str, object]:
+        return {
+            "running": self.running,
+            "sampler": "signal" if self.signals else "thread",
+            "profiles": self.profiles,
+            "samples": self.samples,
+            "max_seconds": self.max_seconds
+        }
+
+    async def _sample_loop(self, seconds: float, interval: float) -> Tuple[Dict[str, int], int]:
+        counts: Dict[str, int] = {}
+        samples = 0
+
+        def on_alarm(signum, frame):
+            nonlocal samples
+            key = ";".join(self._stack(frame))
+            counts[key] = counts.get(key, 0) + 1
+            samples += 1
+
+        previous = signal.signal(signal.SIGALRM, on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, interval, interval)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+        return counts, samples
+
+    def _sample_threads(self, seconds: float, interval: float, only: Optional[int]) -> Tuple[Dict[str, int], int]:
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        counts: Dict[str, int] = {}
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (only is not None and thread_id != only):
+                    continue
+                stack = self._stack(frame)
+                if only is None:
+                    stack.insert(0, names.get(thread_id) or str(thread_id))
+                key = ";".join(stack)
+                counts[key] = counts.get(key, 0) + 1
+            samples += 1
+            time.sleep(interval)
+        return counts, samples
+
+    def _stack(self, frame: Optional[FrameType]) -> List[str]:
+        """Labels of a frame and its callers, outermost first."""
+        stack: List[str] = []
+        while frame is not None:
+            stack.append(self._label(frame.f_code))
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def _label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            # One frame per function rather than per line, so a flame graph merges its calls
+            label = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
+
+# Global profiler instance
+profiler = SamplingProfiler(settings.PROFILE_MAX_SECONDS, settings.PROFILE_SIGNALS)
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+from config import settings
+from backends.room_backend import room_backend
+from services.autocomplete_cache import autocomplete_cache
+from services.merge_service import merge_service
+from services.metrics import metrics
+from services.room_service import room_service
+from services.room_store import room_store
+from websocket.connection_manager import connection_manager
+from websocket.sync_cache import sync_cache
+
+logger = logging.getLogger(__name__)
+
+
+class RoomLifecycleManager:
+    """Keeps the set of in-memory rooms bounded.
+
+    A background sweep evicts rooms that have had no connections for longer
+    than the idle TTL, then evicts the least recently active empty rooms
+    until the total document size fits the memory budget. Rooms with live
+    connections are never evicted.
+    """
+
+    def __init__(self, interval: float, idle_ttl: float, memory_budget: int, max_room_size: int, max_spectators: int):
+        self.interval = interval
+        self.idle_ttl = idle_ttl
+        self.memory_budget = memory_budget
+        self.max_room_size = max_room_size
+        self.max_spectators = max_spectators
+        self.evicted_idle = 0
+        self.evicted_memory = 0
+        self.rejected_full = 0
+        self.rejected_spectators = 0
+        self.handed_off = 0
+        self.sweeps = 0
+        self.last_sweep_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def admit(self, room_id: str) -> bool:
+        """Whether one more connection fits in the room."""
+        if connection_manager.get_room_connection_count(room_id) >= self.max_room_size:
+            self.rejected_full += 1
+            return False
+        return True
+
+    def admit_spectator(self, room_id: str) -> bool:
+        """Whether one more spectator fits in the room's audience."""
+        if connection_manager.get_spectator_count(room_id) >= self.max_spectators:
+            self.rejected_spectators += 1
+            return False
+        return True
+
+    def sweep(self) -> int:
+        started = time.perf_counter()
+        now = time.monotonic()
+        evicted = 0
+
+        # Oldest activity first, so the memory pass below evicts in LRU order
+        candidates: List[str] = sorted(
+            (room_id for room_id in room_service.rooms if not connection_manager.has_connections(room_id)),
+            key=lambda room_id: room_service.get_last_active(room_id)
+        )
+
+        remaining = []
+        for room_id in candidates:
+            if now - room_service.get_last_active(room_id) > self.idle_ttl:
+                self._evict(room_id)
+                self.evicted_idle += 1
+                evicted += 1
+            else:
+                remaining.append(room_id)
+
+        total = self.get_memory_usage()
+        for room_id in remaining:
+            if total <= self.memory_budget:
+                break
+            total -= room_service.get_room_size(room_id)
+            self._evict(room_id)
+            self.evicted_memory += 1
+            evicted += 1
+
+        self.sweeps += 1
+        self.last_sweep_ms = (time.perf_counter() - started) * 1000
+        if evicted:
+            logger.info(f"Evicted {evicted} rooms, {len(room_service.rooms)} remaining")
+        return evicted
+
+    def get_memory_usage(self) -> int:
+        return sum(room_service.get_room_size(room_id) for room_id in room_service.rooms)
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            "rooms": len(room_service.rooms),
+            "document_bytes": self.get_memory_usage(),
+            "memory_budget": self.memory_budget,
+            "evicted_idle": self.evicted_idle,
+            "evicted_memory": self.evicted_memory,
+            "rejected_full": self.rejected_full,
+            "rejected_spectators": self.rejected_spectators,
+            "handed_off": self.handed_off,
+            "sweeps": self.sweeps,
+            "last_sweep_ms": round(self.last_sweep_ms, 3)
+        }
+
+    def hand_off(self, room_id: str):
+        """Drop a room that another worker has taken over."""
+        self._evict(room_id)
+        self.handed_off += 1
+
+    def _evict(self, room_id: str):
+        room_service.delete_room(room_id)
+        merge_service.reset(room_id)
+        room_backend.forget_room(room_id)
+        autocomplete_cache.forget_room(room_id)
+        sync_cache.forget_room(room_id)
+        room_store.forget(room_id)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Error sweeping rooms: {e}")
+
+# Global room lifecycle instance
+room_lifecycle = RoomLifecycleManager(
+    settings.ROOM_CLEANUP_INTERVAL,
+    settings.ROOM_IDLE_TTL,
+    settings.ROOM_MEMORY_BUDGET_MB * 1024 * 1024,
+    settings.MAX_ROOM_SIZE,
+    settings.MAX_SPECTATORS
+)
+
+metrics.gauge("rooms", "Rooms held in memory", lambda: len(room_service.rooms))
+metrics.gauge("rooms_connected", "Rooms with at least one open connection", lambda: len(connection_manager.rooms))
+metrics.gauge("room_document_bytes", "Total size of the documents held in memory", room_lifecycle.get_memory_usage)
+metrics.sampled_counter(
+    "rooms_evicted_total", "Rooms evicted from memory, by reason",
+    lambda: {("idle",): room_lifecycle.evicted_idle, ("memory",): room_lifecycle.evicted_memory},
+    ("reason",)
+)
@@ -0,0 +1,124 @@
+import logging
+import time
+from typing import Dict, Optional
+from config import settings
+from models import RoomSnapshot
+from services.autocomplete_cache import autocomplete_cache
+from services.merge_service import merge_service
+from services.metrics import metrics
+from services.room_lifecycle import room_lifecycle
+from services.room_service import RoomState, room_service
+from services.room_store import room_store
+from websocket.connection_manager import connection_manager
+from websocket.sync_cache import sync_cache
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = metrics.counter("room_migrations_total", "Rooms handed to or taken over from another worker", ("direction",))
+DRAIN_SECONDS = metrics.histogram(
+    "room_drain_seconds", "Time to close a moving room's connections and export its state"
+)
+
+
+class RoomMigration:
+    """Hands a room's document and connections from this worker to another.
+
+    Draining stops handling the room's inbound messages, flushes the acks
+    and broadcasts still waiting for a tick, and then sends every
+    connection a `room_moved` message with the revision and epoch the room
+    ended at, closing each socket once that has been sent. A client that
+    receives it has seen every edit the room applied, its own included,
+    and knows that anything it hasn't had acked wasn't applied: it resumes
+    from that revision on the new owner and sends those edits again. The
+    new owner restores the document with its epoch and op history, which is
+    what lets clients resume instead of taking a full sync.
+    """
+
+    def __init__(self, drain_timeout: float):
+        self.drain_timeout = drain_timeout
+        self.handed_off = 0
+        self.taken_over = 0
+        self.connections_moved = 0
+        self.connections_cut = 0
+        self.last_drain_ms = 0.0
+
+    async def drain(self, room_id: str) -> Optional[RoomSnapshot]:
+        """Close the room here and return its state, or None if this worker doesn't have it."""
+        if connection_manager.is_draining(room_id) or await room_service.load_room(room_id) is None:
+            return None
+
+        started = time.perf_counter()
+        connection_manager.draining.add(room_id)
+        try:
+            await connection_manager.scheduler.flush(room_id)
+            await connection_manager.spectators.flush(room_id)
+            revision = room_service.get_room_revision(room_id)
+            epoch = room_service.get_room_epoch(room_id)
+            moved, cut = await connection_manager.close_room_connections(
+                room_id, {"type": "room_moved", "revision": revision, "epoch": epoch}, self.drain_timeout
+            )
+            snapshot = RoomSnapshot(
+                room_id=room_id,
+                code=room_service.get_room_code(room_id),
+                revision=revision,
+                epoch=epoch,
+                history=merge_service.get_history(room_id)
+            )
+            # Make sure the shared store is current before the new owner can read it
+            await room_store.flush()
+            room_lifecycle.hand_off(room_id)
+        except Exception:
+            connection_manager.draining.discard(room_id)
+            raise
+
+        # The room stays marked as draining here, so stragglers can't bring a stale copy back
+        self.handed_off += 1
+        self.connections_moved += moved
+        self.connections_cut += cut
+        self.last_drain_ms = (time.perf_counter() - started) * 1000
+        MIGRATIONS.inc("out")
+        DRAIN_SECONDS.observe(time.perf_counter() - started)
+        if cut:
+            logger.warning(f"Cut off {cut} connections still sending when room {room_id} moved")
+        logger.info(f"Handed off room {room_id} at revision {revision} with {moved} connections "
+                    f"in {self.last_drain_ms:.1f} ms")
+        return snapshot
+
+    def restore(self, snapshot: RoomSnapshot):
+        """Take over a room drained by another worker."""
+        room = RoomState(snapshot.code, snapshot.revision)
+        room.epoch = snapshot.epoch
+        room_service.add_room(snapshot.room_id, room)
+        merge_service.set_history(snapshot.room_id, snapshot.history)
+        sync_cache.forget_room(snapshot.room_id)
+        autocomplete_cache.forget_room(snapshot.room_id)
+        room_store.snapshot(snapshot.room_id, snapshot.revision, snapshot.code)
+        connection_manager.draining.discard(snapshot.room_id)
+        self.taken_over += 1
+        MIGRATIONS.inc("in")
+        logger.info(f"Took over room {snapshot.room_id} at revision {snapshot.revision}")
+
+    def get_load(self) -> Dict[str, Dict[str, int]]:
+        """Connections and revision of every room with someone connected, for the supervisor's rebalancing."""
+        rooms = set(connection_manager.rooms) | set(connection_manager.spectators.audiences)
+        return {
+            room_id: {
+                "connections": connection_manager.get_room_connection_count(room_id),
+                "spectators": connection_manager.get_spectator_count(room_id),
+                "revision": room_service.get_room_revision(room_id)
+            }
+            for room_id in rooms
+            if not connection_manager.is_draining(room_id)
+        }
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            "handed_off": self.handed_off,
+            "taken_over": self.taken_over,
+            "connections_moved": self.connections_moved,
+            "connections_cut": self.connections_cut,
+            "last_drain_ms": round(self.last_drain_ms, 3)
+        }
+
+# Global room migration instance
+room_migration = RoomMigration(settings.MIGRATION_DRAIN_TIMEOUT)
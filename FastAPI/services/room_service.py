@@ -1,45 +1,245 @@
+import asyncio
+import time
 import uuid
-from typing import Dict, Optional
-from models import Room
+from typing import Dict, List, Optional
+from services.document_index import DocumentIndex
+from services.room_store import room_store
+from services.text_buffer import Rope
+
+def new_epoch() -> str:
+    return uuid.uuid4().hex[:8]
+
+class RoomState:
+    """In-memory state of one room; API responses are built from it, not with it."""
+    
+    __slots__ = ("code", "users", "revision", "epoch", "buffer", "index", "last_active")
+    
+    def __init__(self, code: str = "", revision: int = 0):
+        self.code = code
+        # Insertion-ordered set of user ids
+        self.users: Dict[str, None] = {}
+        self.revision = revision
+        # Identifies the edit history revisions are counted in; a client can only
+        # resume from a revision of the same epoch
+        self.epoch = new_epoch()
+        # Edits go to the rope; `code` is refreshed from it only when a full copy is needed
+        self.buffer: Optional[Rope] = None
+        self.index: Optional[DocumentIndex] = None
+        self.last_active = time.monotonic()
 
 class RoomService:
     def __init__(self):
-        self.rooms: Dict[str, Room] = {}
+        self.rooms: Dict[str, RoomState] = {}
+        # Rooms being read back from the store, so concurrent lookups share one read
+        self.loading: Dict[str, asyncio.Future] = {}
     
     def create_room(self) -> str:
         room_id = str(uuid.uuid4())[:8]
-        self.rooms[room_id] = Room()
+        self.add_room(room_id)
+        room_store.snapshot(room_id, 0, "")
         return room_id
     
-    def get_room(self, room_id: str) -> Optional[Room]:
-        return self.rooms.get(room_id)
+    def add_room(self, room_id: str, room: Optional[RoomState] = None) -> RoomState:
+        room = room or RoomState()
+        self.rooms[room_id] = room
+        return room
+    
+    def delete_room(self, room_id: str) -> bool:
+        return self.rooms.pop(room_id, None) is not None
+    
+    def touch_room(self, room_id: str):
+        room = self.rooms.get(room_id)
+        if room is not None:
+            room.last_active = time.monotonic()
+    
+    def get_last_active(self, room_id: str) -> float:
+        room = self.rooms.get(room_id)
+        return room.last_active if room else 0.0
+    
+    def get_room_size(self, room_id: str) -> int:
+        """Document size in characters, without materializing the buffer."""
+        room = self.rooms.get(room_id)
+        if room is None:
+            return 0
+        return len(room.buffer) if room.buffer is not None else len(room.code)
+    
+    def get_room(self, room_id: str) -> Optional[RoomState]:
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self._rehydrate(room_id)
+        return room
     
     def room_exists(self, room_id: str) -> bool:
-        return room_id in self.rooms
+        return self.get_room(room_id) is not None
     
-    def update_room_code(self, room_id: str, code: str) -> bool:
+    async def load_room(self, room_id: str) -> Optional[RoomState]:
+        """`get_room` for async callers; a stored room is read back without blocking the event loop."""
+        room = self.rooms.get(room_id)
+        if room is not None or not room_store.has(room_id):
+            return room
+        loading = self.loading.get(room_id)
+        if loading is None:
+            loading = self.loading[room_id] = asyncio.ensure_future(self._rehydrate_async(room_id))
+        # A cancelled caller leaves the read to finish for the others
+        return await asyncio.shield(loading)
+    
+    def _rehydrate(self, room_id: str) -> Optional[RoomState]:
+        # Rooms evicted from memory or left over from a previous run are loaded on first access
+        stored = room_store.load(room_id)
+        if stored is None:
+            return None
+        code, revision, since_snapshot = stored
+        room_store.resume(room_id, since_snapshot)
+        return self.add_room(room_id, RoomState(code, revision))
+    
+    async def _rehydrate_async(self, room_id: str) -> Optional[RoomState]:
+        try:
+            stored = await room_store.load_async(room_id)
+        finally:
+            self.loading.pop(room_id, None)
+        # A synchronous lookup may have loaded or created it while the read ran
+        room = self.rooms.get(room_id)
+        if room is not None or stored is None:
+            return room
+        code, revision, since_snapshot = stored
+        room_store.resume(room_id, since_snapshot)
+        return self.add_room(room_id, RoomState(code, revision))
+    
+    def get_room_code(self, room_id: str) -> str:
+        room = self.rooms.get(room_id)
+        if room is None:
+            return ""
+        if room.buffer is not None:
+            # Materialize the buffer lazily, only when a full copy is needed
+            room.code = str(room.buffer)
+        return room.code
+    
+    def get_room_index(self, room_id: str) -> Optional[DocumentIndex]:
+        """Line/scope index of the room document, built on first use and then kept in step with edits."""
+        room = self.get_room(room_id)
+        if room is None:
+            return None
+        if room.index is None:
+            room.index = DocumentIndex(self.get_room_code(room_id))
+        return room.index
+    
+    def get_room_epoch(self, room_id: str) -> Optional[str]:
+        room = self.rooms.get(room_id)
+        return room.epoch if room is not None else None
+    
+    def get_room_revision(self, room_id: str) -> int:
         if room_id in self.rooms:
-            self.rooms[room_id].code = code
+            return self.rooms[room_id].revision
+        return 0
+    
+    def update_room_code(self, room_id: str, code: str) -> bool:
+        room = self.rooms.get(room_id)
+        if room is not None:
+            room.code = code
+            room.revision += 1
+            # A full replace isn't kept as an op, so older revisions can't be caught up from
+            room.epoch = new_epoch()
+            room.buffer = None
+            room.index = None
+            room.last_active = time.monotonic()
+            room_store.snapshot(room_id, room.revision, code)
             return True
         return False
     
+    def apply_room_delta(self, room_id: str, revision: int, ops: List[dict]) -> Optional[int]:
+        """Apply insert/delete ops made against `revision` of the room document.
+        
+        Returns the new revision, or None if the room is unknown, the client
+        is behind the current revision or the ops don't fit the document.
+        """
+        room = self.rooms.get(room_id)
+        if room is None or revision != room.revision:
+            return None
+        
+        buffer = room.buffer
+        if buffer is None:
+            buffer = room.buffer = Rope(room.code)
+        
+        if not _validate_ops(ops, len(buffer)):
+            return None
+        
+        for op in ops:
+            if op["op"] == "insert":
+                buffer.insert(op["pos"], op["text"])
+            else:
+                buffer.delete(op["pos"], op["length"])
+        
+        if room.index is not None:
+            room.index.apply(ops)
+        
+        room.revision += 1
+        room.last_active = time.monotonic()
+        if room_store.append(room_id, room.revision, ops):
+            # Compact the op log; materializing the document is amortized over many ops
+            room_store.snapshot(room_id, room.revision, self.get_room_code(room_id))
+        return room.revision
+    
     def add_user_to_room(self, room_id: str, user_id: str) -> bool:
-        if room_id in self.rooms:
-            if user_id not in self.rooms[room_id].users:
-                self.rooms[room_id].users.append(user_id)
+        room = self.rooms.get(room_id)
+        if room is not None:
+            room.users[user_id] = None
+            room.last_active = time.monotonic()
             return True
         return False
     
     def remove_user_from_room(self, room_id: str, user_id: str) -> bool:
-        if room_id in self.rooms and user_id in self.rooms[room_id].users:
-            self.rooms[room_id].users.remove(user_id)
+        room = self.rooms.get(room_id)
+        if room is not None and user_id in room.users:
+            del room.users[user_id]
+            room.last_active = time.monotonic()
             return True
         return False
     
-    def get_room_users(self, room_id: str) -> list:
-        if room_id in self.rooms:
-            return self.rooms[room_id].users
+    def set_room_users(self, room_id: str, users: List[str]) -> bool:
+        # Presence owned by a shared backend replaces the local list wholesale
+        room = self.rooms.get(room_id)
+        if room is not None:
+            room.users = dict.fromkeys(users)
+            return True
+        return False
+    
+    def get_room_users(self, room_id: str) -> List[str]:
+        room = self.rooms.get(room_id)
+        if room is not None:
+            return list(room.users)
         return []
+    
+    def build_sync_message(self, room_id: str) -> dict:
+        return {
+            "type": "sync",
+            "code": self.get_room_code(room_id),
+            "users": self.get_room_users(room_id),
+            "revision": self.get_room_revision(room_id),
+            "epoch": self.get_room_epoch(room_id)
+        }
+
+def _validate_ops(ops: List[dict], length: int) -> bool:
+    # Ops apply in sequence, so each one is checked against the length left by the previous ones
+    if not isinstance(ops, list):
+        return False
+    for op in ops:
+        if not isinstance(op, dict):
+            return False
+        position = op.get("pos")
+        if not isinstance(position, int) or position < 0:
+            return False
+        if op.get("op") == "insert":
+            if not isinstance(op.get("text"), str) or position > length:
+                return False
+            length += len(op["text"])
+        elif op.get("op") == "delete":
+            count = op.get("length")
+            if not isinstance(count, int) or count < 0 or position + count > length:
+                return False
+            length -= count
+        else:
+            return False
+    return True
 
 # Global room service instance
 room_service = RoomService()
\ No newline at end of file
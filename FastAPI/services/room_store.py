@@ -0,0 +1,256 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from config import settings
+from services.text_buffer import Rope
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    room_id TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL,
+    code TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ops (
+    room_id TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    ops TEXT NOT NULL,
+    PRIMARY KEY (room_id, revision)
+);
+"""
+
+# Pending writes are (kind, room_id, revision, payload): payload is the full
+# code for a snapshot and the op list applied at that revision for an op
+Write = Tuple[str, str, int, object]
+
+# A room's snapshot row and the op rows after it
+Stored = Tuple[Optional[Tuple[int, str]], List[Tuple[int, str]]]
+
+# A rebuilt room: its code, revision and the ops applied since its last snapshot
+Loaded = Tuple[str, int, int]
+
+
+class RoomStore:
+    """Write-behind SQLite persistence for room documents.
+
+    Every applied delta is appended to a per-room op log and every full
+    replace is written as a snapshot; after `snapshot_every` ops the room is
+    compacted into a fresh snapshot. Writes are buffered and committed in
+    one transaction per flush on a worker thread, so the event loop never
+    waits on disk. Rooms are only read back when first accessed.
+
+    The ids of stored rooms are kept in memory, read at start and topped up
+    from rooms other processes snapshot after every flush, so looking up a
+    room that was never stored doesn't touch the database.
+    """
+
+    def __init__(self, path: str, flush_interval: float, snapshot_every: int):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.enabled = False
+        self.pending: List[Write] = []
+        self.inflight: List[Write] = []
+        self.since_snapshot: Dict[str, int] = {}
+        self.writes = 0
+        self.batches = 0
+        self.rehydrated = 0
+        self.last_batch_ms = 0.0
+        self.known: Set[str] = set()
+        # Highest snapshot rowid seen; rows are upserted in place, so new rooms only ever add higher ones
+        self._known_rowid = 0
+        self._reader: Optional[sqlite3.Connection] = None
+        # The reader is used from the event loop and from worker threads
+        self._read_lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if not self.path:
+            return
+        self._writer = await asyncio.to_thread(self._open, True)
+        self._reader = self._open(False)
+        await asyncio.to_thread(self._load_known)
+        self.enabled = True
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Persisting rooms to {self.path}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.enabled:
+            await self.flush()
+            self.enabled = False
+            self._reader.close()
+            self._writer.close()
+
+    def append(self, room_id: str, revision: int, ops: List[dict]) -> bool:
+        """Queue ops applied at `revision`; returns True once a snapshot is due."""
+        if not self.enabled:
+            return False
+        self.pending.append(("op", room_id, revision, ops))
+        self.known.add(room_id)
+        count = self.since_snapshot[room_id] = self.since_snapshot.get(room_id, 0) + 1
+        return count >= self.snapshot_every
+
+    def snapshot(self, room_id: str, revision: int, code: str):
+        if not self.enabled:
+            return
+        self.pending.append(("snapshot", room_id, revision, code))
+        self.known.add(room_id)
+        self.since_snapshot[room_id] = 0
+
+    def resume(self, room_id: str, ops_since_snapshot: int):
+        """Count a rehydrated room's ops toward its next snapshot from what the log holds."""
+        if self.enabled:
+            self.since_snapshot[room_id] = ops_since_snapshot
+
+    def forget(self, room_id: str):
+        """Drop the op count of a room no longer held in memory."""
+        self.since_snapshot.pop(room_id, None)
+
+    def has(self, room_id: str) -> bool:
+        return self.enabled and room_id in self.known
+
+    def load(self, room_id: str) -> Optional[Loaded]:
+        """Rebuild a room from its snapshot, later ops and unflushed writes."""
+        if not self.has(room_id):
+            return None
+        unflushed = self._unflushed(room_id)
+        return self._rebuild(room_id, self._read(room_id), unflushed)
+
+    async def load_async(self, room_id: str) -> Optional[Loaded]:
+        """`load`, with the database read on a worker thread."""
+        if not self.has(room_id):
+            return None
+        # Taken first: anything flushed while the read runs is then either in the read or still in here
+        unflushed = self._unflushed(room_id)
+        return self._rebuild(room_id, await asyncio.to_thread(self._read, room_id), unflushed)
+
+    def _unflushed(self, room_id: str) -> List[Write]:
+        return [write for write in self.inflight + self.pending if write[1] == room_id]
+
+    def _read(self, room_id: str) -> Stored:
+        with self._read_lock:
+            row = self._reader.execute("SELECT revision, code FROM snapshots WHERE room_id = ?", (room_id,)).fetchone()
+            rows = self._reader.execute(
+                "SELECT revision, ops FROM ops WHERE room_id = ? AND revision > ? ORDER BY revision",
+                (room_id, row[0] if row else 0)
+            ).fetchall()
+        return row, rows
+
+    def _rebuild(self, room_id: str, stored: Stored, unflushed: List[Write]) -> Optional[Loaded]:
+        row, rows = stored
+        writes = [("op", room_id, revision, json.loads(ops)) for revision, ops in rows] + unflushed
+        if row is None and not writes:
+            return None
+
+        revision, buffer = (row[0], Rope(row[1])) if row else (0, Rope())
+        since_snapshot = 0
+        for kind, _, entry_revision, payload in writes:
+            if kind == "snapshot" and entry_revision >= revision:
+                revision, buffer = entry_revision, Rope(payload)
+                since_snapshot = 0
+            elif kind == "op" and entry_revision == revision + 1:
+                for op in payload:
+                    if op["op"] == "insert":
+                        buffer.insert(op["pos"], op["text"])
+                    else:
+                        buffer.delete(op["pos"], op["length"])
+                revision = entry_revision
+                since_snapshot += 1
+
+        self.rehydrated += 1
+        return str(buffer), revision, since_snapshot
+
+    async def flush(self):
+        if not self.pending:
+            return
+        self.inflight, self.pending = self.pending, []
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._write, self.inflight)
+        except Exception as e:
+            logger.error(f"Error persisting {len(self.inflight)} room writes: {e}")
+            # Keep them for the next flush rather than losing edits
+            self.pending = self.inflight + self.pending
+        else:
+            self.writes += len(self.inflight)
+            self.batches += 1
+            self.last_batch_ms = (time.perf_counter() - started) * 1000
+        finally:
+            self.inflight = []
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            "enabled": self.enabled,
+            "pending": len(self.pending),
+            "writes": self.writes,
+            "batches": self.batches,
+            "rehydrated": self.rehydrated,
+            "known_rooms": len(self.known),
+            "last_batch_ms": round(self.last_batch_ms, 3)
+        }
+
+    def _open(self, create: bool) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        if create:
+            # WAL lets the event loop read while a batch is being committed
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+        return connection
+
+    def _load_known(self):
+        with self._read_lock:
+            self.known.update(room_id for room_id, in self._reader.execute("SELECT DISTINCT room_id FROM ops"))
+        self._refresh_known()
+
+    def _refresh_known(self):
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT rowid, room_id FROM snapshots WHERE rowid > ? ORDER BY rowid", (self._known_rowid,)
+            ).fetchall()
+        if rows:
+            self._known_rowid = rows[-1][0]
+            self.known.update(room_id for _, room_id in rows)
+
+    def _write(self, batch: List[Write]):
+        with self._writer:
+            for kind, room_id, revision, payload in batch:
+                if kind == "op":
+                    # Replace keeps replays from several workers idempotent
+                    self._writer.execute(
+                        "INSERT OR REPLACE INTO ops (room_id, revision, ops) VALUES (?, ?, ?)",
+                        (room_id, revision, json.dumps(payload))
+                    )
+                else:
+                    self._writer.execute(
+                        "INSERT INTO snapshots (room_id, revision, code) VALUES (?, ?, ?) "
+                        "ON CONFLICT (room_id) DO UPDATE SET revision = excluded.revision, code = excluded.code "
+                        "WHERE excluded.revision >= snapshots.revision",
+                        (room_id, revision, payload)
+                    )
+                    self._writer.execute("DELETE FROM ops WHERE room_id = ? AND revision <= ?", (room_id, revision))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            try:
+                await asyncio.to_thread(self._refresh_known)
+            except Exception as e:
+                logger.error(f"Error reading stored room ids: {e}")
+
+# Global room store instance
+room_store = RoomStore(settings.ROOM_STORE_PATH, settings.ROOM_STORE_FLUSH_INTERVAL, settings.ROOM_SNAPSHOT_EVERY)
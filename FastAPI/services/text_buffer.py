@@ -0,0 +1,184 @@
+from typing import List, Optional, Tuple, Union
+
+# Leaves are merged up to this size so per-keystroke inserts don't fragment the tree
+LEAF_SIZE = 1024
+
+
+class _Leaf:
+    __slots__ = ("text", "length", "depth")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.length = len(text)
+        self.depth = 0
+
+
+class _Node:
+    __slots__ = ("left", "right", "length", "depth")
+
+    def __init__(self, left: "_Tree", right: "_Tree"):
+        self.left = left
+        self.right = right
+        self.length = left.length + right.length
+        self.depth = max(left.depth, right.depth) + 1
+
+
+_Tree = Union[_Leaf, _Node]
+
+
+def _concat(left: Optional[_Tree], right: Optional[_Tree]) -> Optional[_Tree]:
+    if left is None or left.length == 0:
+        return right
+    if right is None or right.length == 0:
+        return left
+    return _join(left, right)
+
+
+def _join(left: _Tree, right: _Tree) -> _Tree:
+    """Concatenate two AVL-balanced trees into one, in O(difference in depth)."""
+    # Hang the shallower tree at the matching depth on the facing spine of the deeper one
+    if left.depth > right.depth + 1:
+        return _balance(left.left, _join(left.right, right))
+    if right.depth > left.depth + 1:
+        return _balance(_join(left, right.left), right.right)
+
+    # Merge small neighbouring leaves instead of growing the tree
+    if isinstance(right, _Leaf):
+        if isinstance(left, _Leaf) and left.length + right.length <= LEAF_SIZE:
+            return _Leaf(left.text + right.text)
+        if isinstance(left, _Node) and isinstance(left.right, _Leaf) \
+                and left.right.length + right.length <= LEAF_SIZE:
+            return _Node(left.left, _Leaf(left.right.text + right.text))
+    if isinstance(left, _Leaf) and isinstance(right, _Node) and isinstance(right.left, _Leaf) \
+            and left.length + right.left.length <= LEAF_SIZE:
+        return _Node(_Leaf(left.text + right.left.text), right.right)
+
+    return _Node(left, right)
+
+
+def _balance(left: _Tree, right: _Tree) -> _Tree:
+    """Node over two balanced trees whose depths differ by at most two, rotated back into balance."""
+    if left.depth > right.depth + 1:
+        if left.right.depth > left.left.depth:
+            inner = left.right
+            return _Node(_Node(left.left, inner.left), _Node(inner.right, right))
+        return _Node(left.left, _Node(left.right, right))
+    if right.depth > left.depth + 1:
+        if right.left.depth > right.right.depth:
+            inner = right.left
+            return _Node(_Node(left, inner.left), _Node(inner.right, right.right))
+        return _Node(_Node(left, right.left), right.right)
+    return _Node(left, right)
+
+
+def _split(node: Optional[_Tree], index: int) -> Tuple[Optional[_Tree], Optional[_Tree]]:
+    if node is None:
+        return None, None
+    if index <= 0:
+        return None, node
+    if index >= node.length:
+        return node, None
+
+    if isinstance(node, _Leaf):
+        return _Leaf(node.text[:index]), _Leaf(node.text[index:])
+
+    left_length = node.left.length
+    if index == left_length:
+        return node.left, node.right
+    if index < left_length:
+        left, right = _split(node.left, index)
+        return left, _concat(right, node.right)
+
+    left, right = _split(node.right, index - left_length)
+    return _concat(node.left, left), right
+
+
+def _collect(node: Optional[_Tree], out: List[str]):
+    # Iterative in-order walk so very unbalanced trees can't hit the recursion limit
+    stack = [node] if node is not None else []
+    while stack:
+        current = stack.pop()
+        if isinstance(current, _Leaf):
+            out.append(current.text)
+        else:
+            stack.append(current.right)
+            stack.append(current.left)
+
+
+def _build(text: str) -> Optional[_Tree]:
+    if not text:
+        return None
+    leaves = [_Leaf(text[i:i + LEAF_SIZE]) for i in range(0, len(text), LEAF_SIZE)]
+    return _build_leaves(leaves, 0, len(leaves))
+
+
+def _build_leaves(leaves: List[_Leaf], start: int, end: int) -> _Tree:
+    # Halves differ by at most one leaf, so sibling depths differ by at most one
+    if end - start == 1:
+        return leaves[start]
+    middle = (start + end) // 2
+    return _Node(_build_leaves(leaves, start, middle), _build_leaves(leaves, middle, end))
+
+
+class Rope:
+    """Balanced rope of text chunks.
+
+    The tree is kept AVL-balanced: sibling depths never differ by more than
+    one. An edit splits the tree at the edit and joins the pieces back,
+    each join rotating only along the spine where the pieces meet, so
+    inserts and deletes cost O(log n) regardless of document size. The
+    flattened string is cached until the next edit.
+    """
+
+    __slots__ = ("_root", "_text")
+
+    def __init__(self, text: str = ""):
+        self._root = _build(text)
+        self._text: Optional[str] = text
+
+    def __len__(self) -> int:
+        return self._root.length if self._root is not None else 0
+
+    def __str__(self) -> str:
+        if self._text is None:
+            chunks: List[str] = []
+            _collect(self._root, chunks)
+            self._text = "".join(chunks)
+        return self._text
+
+    def insert(self, position: int, text: str):
+        if not 0 <= position <= len(self):
+            raise IndexError(f"Insert position {position} out of range")
+        if not text:
+            return
+
+        left, right = _split(self._root, position)
+        self._set_root(_concat(_concat(left, _Leaf(text) if len(text) <= LEAF_SIZE else _build(text)), right))
+
+    def delete(self, position: int, length: int):
+        if length < 0 or position < 0 or position + length > len(self):
+            raise IndexError(f"Delete range {position}:{position + length} out of range")
+        if not length:
+            return
+
+        left, rest = _split(self._root, position)
+        _, right = _split(rest, length)
+        self._set_root(_concat(left, right))
+
+    def slice(self, start: int, end: int) -> str:
+        start = max(0, start)
+        end = min(len(self), end)
+        if start >= end:
+            return ""
+        if self._text is not None:
+            return self._text[start:end]
+
+        _, rest = _split(self._root, start)
+        middle, _ = _split(rest, end - start)
+        chunks: List[str] = []
+        _collect(middle, chunks)
+        return "".join(chunks)
+
+    def _set_root(self, root: Optional[_Tree]):
+        self._root = root
+        self._text = None
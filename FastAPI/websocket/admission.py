@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from services.metrics import metrics
+from websocket.session import Session
+
+logger = logging.getLogger(__name__)
+
+# Close code for frames over the size cap ("message too big")
+FRAME_TOO_LARGE_CLOSE_CODE = 1009
+
+# (rate per second, burst) for one connection and for a whole room, per inbound message type.
+# Types not listed share the "unknown" limit; heartbeat replies are never limited.
+MESSAGE_LIMITS: Dict[str, Tuple[Tuple[float, float], Optional[Tuple[float, float]]]] = {
+    "code_delta": ((60, 120), (300, 600)),
+    "code_change": ((30, 60), (60, 120)),
+    "cursor_position": ((30, 30), (150, 150)),
+    "user_typing": ((10, 10), (50, 50)),
+    "autocomplete_request": ((20, 40), (100, 200)),
+    "unknown": ((5, 10), None),
+}
+UNLIMITED_TYPES = frozenset({"pong"})
+
+# Types where only the latest message matters: excess ones are held back and the
+# newest is handled once the bucket refills. Excess edits and requests are rejected.
+COALESCED_INBOUND_TYPES = frozenset({"code_change", "cursor_position", "user_typing"})
+
+# Messages that change the document. Once one is admitted, a full replace held back
+# from before it is stale and would overwrite the newer edit, so it is dropped.
+EDIT_TYPES = frozenset({"code_delta", "code_change"})
+
+# What happened to a message
+ADMITTED = "admitted"
+COALESCED = "coalesced"
+REJECTED = "rejected"
+DROPPED = "dropped"
+
+THROTTLED = metrics.counter(
+    "ws_messages_throttled_total", "Inbound messages over their rate limit, by type and what was done with them",
+    ("type", "action")
+)
+FRAMES_TOO_LARGE = metrics.counter("ws_frames_too_large_total", "Inbound frames over the size cap, closed undecoded")
+READ_PAUSE_SECONDS = metrics.counter(
+    "ws_read_pause_seconds_total", "Time connections were paused for going over their inbound byte rate"
+)
+
+Deliver = Callable[[dict], Awaitable[None]]
+
+
+class FrameTooLarge(Exception):
+    pass
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`."""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def take(self, now: float, cost: float = 1.0) -> float:
+        """Take `cost` tokens. Returns 0, or the seconds until they are available if they aren't."""
+        tokens = self.tokens + (now - self.stamp) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        self.stamp = now
+        if tokens >= cost:
+            self.tokens = tokens - cost
+            return 0.0
+        self.tokens = tokens
+        return (cost - tokens) / self.rate
+
+    def borrow(self, now: float, cost: float) -> float:
+        """Take `cost` tokens even into debt. Returns the seconds until the debt is paid off."""
+        tokens = self.tokens + (now - self.stamp) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        self.tokens = tokens = tokens - cost
+        self.stamp = now
+        return -tokens / self.rate if tokens < 0 else 0.0
+
+
+class AdmissionControl:
+    """Inbound limits that keep one client from starving the event loop.
+
+    Frames over `max_frame_bytes` are refused before they are decoded. Each
+    connection also has an inbound byte rate: a frame that goes over it is
+    still handled, but only once the debt is paid, and the connection isn't
+    read in the meantime, so a flood slows down its own sender instead of
+    everyone else. After decoding, every message type has a token bucket
+    per connection and one per room. Excess full-document, cursor and
+    typing messages are coalesced, keeping only the latest per connection
+    until a token is free, though a held-back full document is dropped
+    once a later edit from the connection is admitted. Excess deltas and
+    autocomplete requests are rejected with a "throttled" reply that says
+    when to retry, and excess unknown messages are dropped.
+    """
+
+    def __init__(self, enabled: bool, max_frame_bytes: int, bytes_per_second: int):
+        self.enabled = enabled
+        self.max_frame_bytes = max_frame_bytes
+        self.bytes_per_second = bytes_per_second
+        self.room_buckets: Dict[str, Dict[str, TokenBucket]] = {}
+        self.throttled: Dict[Tuple[str, str], int] = {}
+        self.frames_too_large = 0
+        self.read_pauses = 0
+        self.read_pause_seconds = 0.0
+
+    def check_frame(self, session: Session, size: int, now: float) -> float:
+        """Size and byte-rate limits, applied before decoding. Returns how long to pause reading."""
+        if size > self.max_frame_bytes:
+            self.frames_too_large += 1
+            FRAMES_TOO_LARGE.inc()
+            raise FrameTooLarge(f"Frame of {size} bytes is over the {self.max_frame_bytes} byte limit")
+        if not self.enabled or self.bytes_per_second <= 0:
+            return 0.0
+
+        bucket = session.byte_bucket
+        if bucket is None:
+            # Large enough for a frame of the maximum size
+            burst = max(self.bytes_per_second, self.max_frame_bytes)
+            bucket = session.byte_bucket = TokenBucket(self.bytes_per_second, burst, now)
+        pause = bucket.borrow(now, size)
+        if pause:
+            self.read_pauses += 1
+            self.read_pause_seconds += pause
+            READ_PAUSE_SECONDS.inc(amount=pause)
+        return pause
+
+    def admit(self, session: Session, message: dict, now: float, deliver: Deliver) -> Tuple[str, float]:
+        """Whether to handle a decoded message now.
+
+        Returns the action and, when it wasn't admitted, the seconds until
+        it would be. Coalesced messages are handed to `deliver` later.
+        """
+        if not self.enabled:
+            return ADMITTED, 0.0
+        message_type = message.get("type") if isinstance(message, dict) else None
+        if not isinstance(message_type, str):
+            message_type = "unknown"
+        elif message_type not in MESSAGE_LIMITS:
+            if message_type in UNLIMITED_TYPES:
+                return ADMITTED, 0.0
+            message_type = "unknown"
+
+        wait = self._take(session, message_type, now)
+        if not wait:
+            # A newer message supersedes one still held back
+            if session.deferred is not None:
+                session.deferred.pop(message_type, None)
+                if message_type in EDIT_TYPES:
+                    session.deferred.pop("code_change", None)
+            return ADMITTED, 0.0
+
+        if message_type in COALESCED_INBOUND_TYPES:
+            action = COALESCED
+        else:
+            action = DROPPED if message_type == "unknown" else REJECTED
+        key = (message_type, action)
+        self.throttled[key] = self.throttled.get(key, 0) + 1
+        THROTTLED.inc(message_type, action)
+        if action == COALESCED:
+            if session.deferred is None:
+                session.deferred = {}
+            session.deferred[message_type] = message
+            if session.release_task is None:
+                session.release_task = asyncio.create_task(self._release_later(session, wait, deliver))
+        return action, wait
+
+    def forget(self, session: Session):
+        if session.release_task is not None:
+            session.release_task.cancel()
+            session.release_task = None
+        session.deferred = None
+
+    def forget_room(self, room_id: str):
+        self.room_buckets.pop(room_id, None)
+
+    def get_stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "throttled": {f"{message_type}/{action}": count for (message_type, action), count in self.throttled.items()},
+            "frames_too_large": self.frames_too_large,
+            "read_pauses": self.read_pauses,
+            "read_pause_seconds": round(self.read_pause_seconds, 3)
+        }
+
+    def _take(self, session: Session, message_type: str, now: float) -> float:
+        connection_limit, room_limit = MESSAGE_LIMITS[message_type]
+        buckets = session.buckets
+        if buckets is None:
+            buckets = session.buckets = {}
+        bucket = buckets.get(message_type)
+        if bucket is None:
+            bucket = buckets[message_type] = TokenBucket(*connection_limit, now)
+        wait = bucket.take(now)
+        if wait or room_limit is None:
+            return wait
+
+        room_buckets = self.room_buckets.get(session.room_id)
+        if room_buckets is None:
+            room_buckets = self.room_buckets[session.room_id] = {}
+        room_bucket = room_buckets.get(message_type)
+        if room_bucket is None:
+            room_bucket = room_buckets[message_type] = TokenBucket(*room_limit, now)
+        wait = room_bucket.take(now)
+        if wait:
+            # The connection's token wasn't used after all
+            bucket.tokens += 1
+        return wait
+
+    async def _release_later(self, session: Session, wait: float, deliver: Deliver):
+        try:
+            while session.deferred:
+                await asyncio.sleep(wait)
+                now = time.monotonic()
+                wait = 0.0
+                for message_type in list(session.deferred):
+                    retry = self._take(session, message_type, now)
+                    if retry:
+                        wait = retry if not wait else min(wait, retry)
+                        continue
+                    # Read at release time; a newer message may have replaced it in the meantime
+                    message = session.deferred.pop(message_type, None)
+                    if message is None:
+                        continue
+                    try:
+                        await deliver(message)
+                    except Exception as e:
+                        logger.error(f"Error handling coalesced {message_type} message: {e}")
+        finally:
+            if session.release_task is asyncio.current_task():
+                session.release_task = None
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Presence messages where only the latest state per user matters
+COALESCED_TYPES = ("cursor_position", "user_typing")
+
+
+class PendingMessage:
+    __slots__ = ("sequence", "message", "exclude_user", "target_user")
+
+    def __init__(self, sequence: int, message: dict, exclude_user: Optional[str], target_user: Optional[str]):
+        self.sequence = sequence
+        self.message = message
+        self.exclude_user = exclude_user
+        self.target_user = target_user
+
+    def is_visible_to(self, user_id: str, joined_at: int) -> bool:
+        # Peers that joined after the message was queued already have it in their sync
+        if self.sequence < joined_at:
+            return False
+        if self.target_user is not None:
+            return self.target_user == user_id
+        return self.exclude_user != user_id
+
+
+class _RoomQueue:
+    __slots__ = ("pending", "latest", "merge_floor", "flush_task")
+
+    def __init__(self):
+        self.pending: List[Optional[PendingMessage]] = []
+        self.latest: Dict[Tuple[str, str], int] = {}
+        self.merge_floor = 0
+        self.flush_task: Optional[asyncio.Task] = None
+
+
+FlushCallback = Callable[[str, List[PendingMessage]], Awaitable[int]]
+
+
+class BroadcastScheduler:
+    """Per-room outbound coalescing.
+
+    Messages queued within one tick are flushed together: cursor and typing
+    updates keep only the latest state per user, consecutive deltas from
+    the same user are merged into one, and the flush callback sends one
+    batched frame per peer.
+    """
+
+    def __init__(self, tick: float, flush: FlushCallback):
+        self.tick = tick
+        self._flush = flush
+        self._rooms: Dict[str, _RoomQueue] = {}
+        self.sequence = 0
+        self.frames_in = 0
+        self.frames_out = 0
+        self.coalesced = 0
+
+    def enqueue(self, room_id: str, message: dict, exclude_user: str = None, target_user: str = None):
+        self.frames_in += 1
+        self.sequence += 1
+        queue = self._rooms.get(room_id)
+        if queue is None:
+            queue = self._rooms[room_id] = _RoomQueue()
+
+        if not self._coalesce(queue, message, exclude_user, target_user):
+            queue.pending.append(PendingMessage(self.sequence, message, exclude_user, target_user))
+
+        if queue.flush_task is None:
+            queue.flush_task = asyncio.create_task(self._flush_later(room_id, queue))
+
+    def mark_join(self, room_id: str):
+        # Never merge into a message the new peer won't receive
+        queue = self._rooms.get(room_id)
+        if queue is not None:
+            queue.merge_floor = len(queue.pending)
+
+    async def flush(self, room_id: str):
+        queue = self._rooms.pop(room_id, None)
+        if queue is None:
+            return
+        if queue.flush_task is not None and queue.flush_task is not asyncio.current_task():
+            queue.flush_task.cancel()
+
+        pending = [entry for entry in queue.pending if entry is not None]
+        if pending:
+            self.frames_out += await self._flush(room_id, pending)
+
+    def get_stats(self) -> dict:
+        return {
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "coalesced": self.coalesced,
+            "pending_rooms": len(self._rooms)
+        }
+
+    async def _flush_later(self, room_id: str, queue: _RoomQueue):
+        await asyncio.sleep(self.tick)
+        try:
+            if self._rooms.get(room_id) is queue:
+                await self.flush(room_id)
+        except Exception as e:
+            logger.error(f"Error flushing broadcasts for room {room_id}: {e}")
+
+    def _coalesce(self, queue: _RoomQueue, message: dict, exclude_user: Optional[str], target_user: Optional[str]) -> bool:
+        message_type = message.get("type")
+        sender = message.get("user_id")
+
+        if message_type in COALESCED_TYPES and target_user is None:
+            key = (message_type, sender)
+            previous = queue.latest.get(key)
+            if previous is not None:
+                # Drop the stale state; the new one is appended after any edits it refers to
+                queue.pending[previous] = None
+                self.coalesced += 1
+            queue.latest[key] = len(queue.pending)
+            return False
+
+        if message_type != "code_delta" or target_user is not None:
+            return False
+
+        # Merge into the last delta if everything queued after it is private to its sender
+        for index in range(len(queue.pending) - 1, queue.merge_floor - 1, -1):
+            entry = queue.pending[index]
+            if entry is None:
+                continue
+            if entry.message.get("type") == "code_delta" and entry.target_user is None:
+                if entry.message.get("user_id") != sender or entry.exclude_user != exclude_user:
+                    return False
+                entry.message = {
+                    **entry.message,
+                    "ops": entry.message["ops"] + message["ops"],
+                    "revision": message["revision"]
+                }
+                self.coalesced += 1
+                return True
+            if entry.message.get("type") in COALESCED_TYPES and entry.target_user is None:
+                continue
+            if entry.target_user != sender:
+                return False
+        return False
@@ -0,0 +1,202 @@
+import json
+import time
+import zlib
+from abc import ABC, abstractmethod
+from typing import List, Optional, Union
+from config import settings
+from services.metrics import metrics
+
+# Fast JSON implementations are optional; fall back to the stdlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+Payload = Union[str, bytes]
+
+# Subprotocol a client offers to get MessagePack binary frames
+MSGPACK_SUBPROTOCOL = "meetmock.msgpack"
+
+# Query parameter value a JSON client passes as ?compress= to get large frames deflated
+DEFLATE_COMPRESSION = "deflate"
+
+
+class Codec(ABC):
+    name: str = ""
+    subprotocol: Optional[str] = None
+    binary: bool = False
+
+    @abstractmethod
+    def encode(self, message: dict) -> Payload:
+        """One outbound frame for `message`."""
+
+    @abstractmethod
+    def decode(self, data: Payload) -> dict:
+        """The message in one inbound frame."""
+
+
+class JsonCodec(Codec):
+    """Text JSON frames, using orjson or msgspec when installed."""
+
+    binary = False
+
+    def __init__(self):
+        if orjson is not None:
+            self.name = "json/orjson"
+            self._dumps = lambda message: orjson.dumps(message).decode()
+            self._loads = orjson.loads
+        elif msgspec is not None:
+            self.name = "json/msgspec"
+            encoder = msgspec.json.Encoder()
+            self._dumps = lambda message: encoder.encode(message).decode()
+            self._loads = msgspec.json.decode
+        else:
+            self.name = "json/stdlib"
+            self._dumps = json.dumps
+            self._loads = json.loads
+
+    def encode(self, message: dict) -> str:
+        return self._dumps(message)
+
+    def decode(self, data: Payload) -> dict:
+        return self._loads(data)
+
+
+class MsgpackCodec(Codec):
+    """Binary MessagePack frames for clients that negotiate MSGPACK_SUBPROTOCOL."""
+
+    name = "msgpack"
+    subprotocol = MSGPACK_SUBPROTOCOL
+    binary = True
+
+    def encode(self, message: dict) -> bytes:
+        return msgpack.packb(message)
+
+    def decode(self, data: Payload) -> dict:
+        if isinstance(data, str):
+            # Tolerate clients that still send the odd text frame
+            return json_codec.decode(data)
+        return msgpack.unpackb(data)
+
+
+class DeflateCodec(Codec):
+    """JSON frames, with the large ones sent as zlib-compressed binary frames.
+
+    Compression happens when a frame is encoded, so a broadcast is
+    compressed once and the result shared by every peer using this codec,
+    where permessage-deflate compresses it for each connection. Only
+    clients that haven't negotiated permessage-deflate get this codec, so
+    no frame is compressed twice. Frames under `min_bytes` stay text;
+    clients tell the two apart by the frame type. Inbound frames are never
+    decompressed.
+    """
+
+    binary = False
+
+    def __init__(self, inner: JsonCodec, min_bytes: int, level: int):
+        self.inner = inner
+        self.name = f"{inner.name}+deflate"
+        self.min_bytes = min_bytes
+        self.level = level
+        self.frames = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.seconds = 0.0
+        # Connections that asked for ?compress=deflate but got permessage-deflate instead
+        self.left_to_extension = 0
+
+    def encode(self, message: dict) -> Payload:
+        text = self.inner.encode(message)
+        if len(text) < self.min_bytes:
+            return text
+        return self.compress(text)
+
+    def compress(self, text: str) -> bytes:
+        started = time.perf_counter()
+        data = text.encode()
+        frame = zlib.compress(data, self.level)
+        self.record(len(data), len(frame), time.perf_counter() - started)
+        return frame
+
+    def record(self, raw_bytes: int, compressed_bytes: int, seconds: float):
+        self.frames += 1
+        self.raw_bytes += raw_bytes
+        self.compressed_bytes += compressed_bytes
+        self.seconds += seconds
+
+    def decode(self, data: Payload) -> dict:
+        return self.inner.decode(data)
+
+    def get_stats(self):
+        return {
+            "frames": self.frames,
+            "raw_bytes": self.raw_bytes,
+            "compressed_bytes": self.compressed_bytes,
+            "bytes_saved": self.raw_bytes - self.compressed_bytes,
+            "cpu_ms": round(self.seconds * 1000, 3),
+            "left_to_extension": self.left_to_extension
+        }
+
+
+json_codec = JsonCodec()
+msgpack_codec = MsgpackCodec() if msgpack is not None else None
+deflate_codec = DeflateCodec(json_codec, settings.WS_COMPRESS_MIN_BYTES, settings.WS_COMPRESS_LEVEL)
+
+
+def per_message_deflate_negotiated(scope: dict) -> bool:
+    """Whether the handshake in `scope` offers permessage-deflate and the server accepts it."""
+    if not settings.WS_PER_MESSAGE_DEFLATE:
+        return False
+    return any(
+        name == b"sec-websocket-extensions" and b"permessage-deflate" in value.lower()
+        for name, value in scope.get("headers", [])
+    )
+
+
+def negotiate_codec(subprotocols: List[str], compression: Optional[str] = None,
+                    per_message_deflate: bool = False) -> Codec:
+    """Pick the codec for a connection from the subprotocols the client offered.
+
+    MessagePack frames are already compact and binary, so compression only
+    applies to JSON clients, and only to those without permessage-deflate,
+    which would compress the frames again.
+    """
+    if msgpack_codec is not None and MSGPACK_SUBPROTOCOL in subprotocols:
+        return msgpack_codec
+    if compression == DEFLATE_COMPRESSION and deflate_codec.min_bytes > 0:
+        if per_message_deflate:
+            deflate_codec.left_to_extension += 1
+            return json_codec
+        return deflate_codec
+    return json_codec
+
+
+metrics.sampled_counter(
+    "ws_compressed_frames_total", "Outbound frames sent deflated", lambda: deflate_codec.frames
+)
+metrics.sampled_counter(
+    "ws_compression_input_bytes_total", "Bytes of outbound frames before compression",
+    lambda: deflate_codec.raw_bytes
+)
+metrics.sampled_counter(
+    "ws_compression_output_bytes_total", "Bytes of outbound frames after compression",
+    lambda: deflate_codec.compressed_bytes
+)
+metrics.sampled_counter(
+    "ws_compression_seconds_total", "CPU time spent compressing outbound frames", lambda: deflate_codec.seconds
+)
+metrics.sampled_counter(
+    "ws_compression_left_to_extension_total",
+    "Connections that asked for deflated frames and were left to permessage-deflate",
+    lambda: deflate_codec.left_to_extension
+)
@@ -1,28 +1,86 @@
-import json
+import asyncio
 import logging
-from typing import Dict, List
-from fastapi import WebSocket
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import WebSocket, WebSocketDisconnect
+from config import settings
+from services.metrics import metrics
 from services.room_service import room_service
+from websocket.admission import ADMITTED, REJECTED, AdmissionControl, Deliver
+from websocket.broadcast_scheduler import COALESCED_TYPES, BroadcastScheduler, PendingMessage
+from websocket.codec import Payload, negotiate_codec, per_message_deflate_negotiated
+from websocket.heartbeat import HEARTBEAT_TICK, HeartbeatWheel
+from websocket.outbound_queue import OutboundQueue
+from websocket.session import Session
+from websocket.spectators import SpectatorStream
+from websocket.sync_cache import sync_cache
 
 logger = logging.getLogger(__name__)
 
+# Close code for a connection superseded by the same user joining the room again
+REPLACED_CLOSE_CODE = 4000
+
+# Close code for connections of a room that has moved to another worker; clients reconnect right away
+MOVED_CLOSE_CODE = 4001
+
+# Sent to connections that have been idle for a heartbeat interval; clients answer with a pong
+PING_MESSAGE = {"type": "ping"}
+
+FANOUT_SECONDS = metrics.histogram(
+    "broadcast_fanout_seconds", "Time to encode and queue one broadcast for every peer in a room", ("path",)
+)
+FRAMES_QUEUED = metrics.counter("broadcast_frames_total", "Frames queued to peers by room broadcasts")
+
 class ConnectionManager:
     
     def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-        self.user_connections: Dict[str, WebSocket] = {}
+        # Room -> user -> session, in join order
+        self.rooms: Dict[str, Dict[str, Session]] = {}
+        self.sessions: Dict[WebSocket, Session] = {}
+        self.scheduler = BroadcastScheduler(settings.BROADCAST_TICK_MS / 1000, self._deliver)
+        self.heartbeat = HeartbeatWheel(
+            settings.WS_HEARTBEAT_INTERVAL, settings.WS_TIMEOUT, HEARTBEAT_TICK, self._ping, self._expire
+        )
+        self.admission = AdmissionControl(
+            settings.WS_ADMISSION_CONTROL, settings.WS_MAX_FRAME_BYTES, settings.WS_MAX_BYTES_PER_SECOND
+        )
+        # Read-only viewers, kept out of `rooms` and fed from their own rate-limited stream
+        self.spectators = SpectatorStream(settings.SPECTATOR_INTERVAL_MS / 1000)
+        # Rooms being handed to, or already taken over by, another worker: nothing sent to them is handled here
+        self.draining: Set[str] = set()
     
-    async def connect(self, websocket: WebSocket, room_id: str, user_id: str) -> bool:
+    async def connect(self, websocket: WebSocket, room_id: str, user_id: str, compression: Optional[str] = None) -> bool:
         try:
-            await websocket.accept()
+            # Binary framing is opt-in through the WebSocket subprotocol, compressed JSON through ?compress=
+            # unless permessage-deflate already compresses it
+            codec = negotiate_codec(
+                websocket.scope.get("subprotocols", []), compression, per_message_deflate_negotiated(websocket.scope)
+            )
+            await websocket.accept(subprotocol=codec.subprotocol)
+            session = Session(websocket, room_id, user_id, codec)
+            session.task = asyncio.current_task()
             
-            # Initialize room connections if not exists
-            if room_id not in self.active_connections:
-                self.active_connections[room_id] = []
+            # Each connection gets its own bounded queue and writer task
+            session.queue = OutboundQueue(
+                websocket,
+                settings.WS_SEND_QUEUE_SIZE,
+                settings.WS_SLOW_CONSUMER_POLICY,
+                build_sync=lambda: sync_cache.encode(room_id, codec),
+                on_failed=lambda: self._drop_connection(session)
+            )
             
-            # Add connection to room
-            self.active_connections[room_id].append(websocket)
-            self.user_connections[user_id] = websocket
+            # Add connection to room; a user reconnecting before the old socket closed replaces it
+            members = self.rooms.setdefault(room_id, {})
+            previous = members.get(user_id)
+            members[user_id] = session
+            self.sessions[websocket] = session
+            self.heartbeat.add(session)
+            if previous is not None:
+                await self._replace(previous)
+            
+            # Messages already queued for the room are covered by this user's sync
+            session.joined_at = self.scheduler.sequence + 1
+            self.scheduler.mark_join(room_id)
             
             # Add user to room service
             room_service.add_user_to_room(room_id, user_id)
@@ -34,68 +92,323 @@ class ConnectionManager:
             logger.error(f"Error connecting user {user_id} to room {room_id}: {e}")
             return False
     
-    def disconnect(self, websocket: WebSocket, room_id: str, user_id: str):
+    async def connect_spectator(self, websocket: WebSocket, room_id: str, user_id: str,
+                                compression: Optional[str] = None) -> bool:
+        """Join a room read-only; spectators aren't part of its presence and can't edit."""
         try:
-            # Remove from room connections
-            if room_id in self.active_connections:
-                if websocket in self.active_connections[room_id]:
-                    self.active_connections[room_id].remove(websocket)
-                
-                # Clean up empty room connections
-                if not self.active_connections[room_id]:
-                    del self.active_connections[room_id]
+            codec = negotiate_codec(
+                websocket.scope.get("subprotocols", []), compression, per_message_deflate_negotiated(websocket.scope)
+            )
+            await websocket.accept(subprotocol=codec.subprotocol)
+            session = Session(websocket, room_id, user_id, codec)
+            session.task = asyncio.current_task()
+            session.queue = OutboundQueue(
+                websocket,
+                settings.WS_SEND_QUEUE_SIZE,
+                settings.WS_SLOW_CONSUMER_POLICY,
+                build_sync=lambda: sync_cache.encode(room_id, codec),
+                on_failed=lambda: self.spectators.remove(session)
+            )
+            self.sessions[websocket] = session
+            self.heartbeat.add(session)
+            self.spectators.add(session)
+            logger.info(f"Spectator {user_id} connected to room {room_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Error connecting spectator {user_id} to room {room_id}: {e}")
+            return False
+    
+    def disconnect_spectator(self, websocket: WebSocket):
+        session = self.sessions.pop(websocket, None)
+        if session is None:
+            return
+        self.heartbeat.remove(session)
+        self.admission.forget(session)
+        if session.queue is not None:
+            session.queue.close()
+        self.spectators.remove(session)
+        logger.info(f"Spectator {session.user_id} disconnected from room {session.room_id}")
+    
+    def disconnect(self, websocket: WebSocket, room_id: str, user_id: str) -> bool:
+        """Remove a connection. Returns False if a newer connection of the same user had replaced it."""
+        try:
+            session = self.sessions.pop(websocket, None)
+            if session is not None:
+                self.heartbeat.remove(session)
+                self.admission.forget(session)
+                if session.queue is not None:
+                    session.queue.close()
+            
+            # Remove from room connections, unless the user has since connected again
+            members = self.rooms.get(room_id, {})
+            current = members.get(user_id)
+            if current is not None and current is not session:
+                return False
+            if current is not None:
+                del members[user_id]
             
-            # Remove user connection mapping
-            if user_id in self.user_connections:
-                del self.user_connections[user_id]
+            # Clean up empty room connections
+            if not members:
+                self.rooms.pop(room_id, None)
+                self.admission.forget_room(room_id)
             
             # Remove user from room service
             room_service.remove_user_from_room(room_id, user_id)
             
             logger.info(f"User {user_id} disconnected from room {room_id}")
+            return True
             
         except Exception as e:
             logger.error(f"Error disconnecting user {user_id} from room {room_id}: {e}")
+            return False
     
     async def broadcast_to_room(self, room_id: str, message: dict, exclude_user: str = None):
-        if room_id not in self.active_connections:
+        # Spectators see everything, including the sender's own edits, on their own schedule
+        self.spectators.publish(room_id, message)
+        members = self.rooms.get(room_id)
+        if not members:
+            return
+        
+        if self.scheduler.tick > 0:
+            self.scheduler.enqueue(room_id, message, exclude_user=exclude_user)
             return
         
-        message_str = json.dumps(message)
-        disconnected_connections = []
+        # Encode once per codec and reuse the payload for every recipient
+        started = time.perf_counter()
+        payloads: Dict[str, Payload] = {}
+        droppable = message.get("type") in COALESCED_TYPES
+        sent = 0
         
-        for connection in self.active_connections[room_id]:
+        for user_id, session in members.items():
             # Skip excluded user
-            if exclude_user and self.user_connections.get(exclude_user) == connection:
+            if user_id == exclude_user:
                 continue
             
-            try:
-                await connection.send_text(message_str)
-            except Exception as e:
-                logger.warning(f"Failed to send message to connection: {e}")
-                disconnected_connections.append(connection)
+            codec = session.codec
+            payload = payloads.get(codec.name)
+            if payload is None:
+                payload = payloads[codec.name] = codec.encode(message)
+            if self._enqueue(session, payload, droppable):
+                sent += 1
         
-        # Clean up disconnected connections
-        for connection in disconnected_connections:
-            if connection in self.active_connections[room_id]:
-                self.active_connections[room_id].remove(connection)
+        FRAMES_QUEUED.inc(amount=sent)
+        FANOUT_SECONDS.observe(time.perf_counter() - started, "immediate")
+    
+    async def send_in_room(self, room_id: str, user_id: str, message: dict) -> bool:
+        """Send a message to one user, ordered after the room's queued broadcasts."""
+        if self.scheduler.tick > 0 and room_id in self.rooms:
+            self.scheduler.enqueue(room_id, message, target_user=user_id)
+            return True
+        return await self.send_now(room_id, user_id, message)
     
-    async def send_to_user(self, user_id: str, message: dict) -> bool:
-        if user_id not in self.user_connections:
+    async def send_now(self, room_id: str, user_id: str, message: dict) -> bool:
+        """Send a reply to one user in a room without waiting for the next broadcast tick."""
+        session = self.rooms.get(room_id, {}).get(user_id)
+        if session is None:
             return False
+        return self._enqueue(session, session.codec.encode(message))
+    
+    async def send_direct(self, websocket: WebSocket, message: dict) -> bool:
+        """Queue a message for one connection right away, ahead of the room's next flush."""
+        session = self.sessions.get(websocket)
+        if session is None:
+            return False
+        return self._enqueue(session, session.codec.encode(message))
+    
+    async def send_sync(self, websocket: WebSocket) -> bool:
+        """Queue the room's full document for one connection, encoded once per revision."""
+        session = self.sessions.get(websocket)
+        if session is None:
+            return False
+        return self._enqueue(session, sync_cache.encode(session.room_id, session.codec))
+    
+    async def receive_message(self, websocket: WebSocket) -> dict:
+        """Receive and decode one inbound frame with the connection's codec."""
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
         
-        try:
-            await self.user_connections[user_id].send_text(json.dumps(message))
+        data = message.get("text")
+        if data is None:
+            data = message.get("bytes")
+            size = len(data)
+        else:
+            # Limits are in bytes on the wire, and a text frame is UTF-8
+            size = len(data) if data.isascii() else len(data.encode())
+        session = self.sessions[websocket]
+        session.last_seen = time.monotonic()
+        
+        # Size and byte-rate limits apply before the frame is decoded
+        pause = self.admission.check_frame(session, size, session.last_seen)
+        if pause:
+            await asyncio.sleep(pause)
+            session.last_seen = time.monotonic()
+        message = session.codec.decode(data)
+        if isinstance(message, dict) and message.get("type") == "pong":
+            session.answers_pings = True
+        return message
+    
+    def admit(self, websocket: WebSocket, message: dict, deliver: Deliver) -> bool:
+        """Apply the per-type rate limits to a received message. Returns whether to handle it now."""
+        session = self.sessions.get(websocket)
+        if session is None:
             return True
-        except Exception as e:
-            logger.error(f"Failed to send message to user {user_id}: {e}")
+        action, wait = self.admission.admit(session, message, session.last_seen, deliver)
+        if action == REJECTED:
+            # Clients retry rejected edits and requests themselves, so tell them when
+            reply = {"type": "throttled", "message_type": message["type"], "retry_after": round(wait, 3)}
+            if "request_id" in message:
+                reply["request_id"] = message["request_id"]
+            self._enqueue(session, session.codec.encode(reply), droppable=True)
+        return action == ADMITTED
+    
+    async def _deliver(self, room_id: str, pending: List[PendingMessage]) -> int:
+        """Flush coalesced messages, one frame per peer. Returns the number of frames queued."""
+        members = self.rooms.get(room_id)
+        if not members:
+            return 0
+        
+        # Peers that see the same messages and share a codec share one encoded frame
+        started = time.perf_counter()
+        frames: Dict[Tuple[Tuple[int, ...], str], Payload] = {}
+        sent = 0
+        
+        for user_id, session in list(members.items()):
+            visible = tuple(
+                index for index, entry in enumerate(pending) if entry.is_visible_to(user_id, session.joined_at)
+            )
+            if not visible:
+                continue
+            
+            codec = session.codec
+            frame = frames.get((visible, codec.name))
+            if frame is None:
+                if len(visible) == 1:
+                    frame = codec.encode(pending[visible[0]].message)
+                else:
+                    frame = codec.encode({
+                        "type": "batch",
+                        "messages": [pending[index].message for index in visible]
+                    })
+                frames[(visible, codec.name)] = frame
+            
+            droppable = all(pending[index].message.get("type") in COALESCED_TYPES for index in visible)
+            if self._enqueue(session, frame, droppable):
+                sent += 1
+        
+        FRAMES_QUEUED.inc(amount=sent)
+        FANOUT_SECONDS.observe(time.perf_counter() - started, "flush")
+        return sent
+    
+    async def close_room_connections(self, room_id: str, message: dict, timeout: float) -> Tuple[int, int]:
+        """Send everyone in a room, spectators included, a last message and close their connections.
+        
+        Each socket is closed only after everything queued for it before the
+        message has been sent, so a client that gets it has seen every ack
+        and broadcast up to that point. Returns the connections closed this
+        way and those that were still sending after `timeout` and were cut off.
+        """
+        sessions = [session for session in self.sessions.values() if session.room_id == room_id]
+        finishing = []
+        for session in sessions:
+            # Held-back messages would be handled after the room has gone
+            self.admission.forget(session)
+            self.heartbeat.remove(session)
+            if session.queue is not None and session.queue.finish(
+                session.codec.encode(message), MOVED_CLOSE_CODE, "Room moved"
+            ):
+                finishing.append(session)
+        
+        closed = 0
+        deadline = time.monotonic() + timeout
+        for session in finishing:
+            if await session.queue.wait_finished(max(0.0, deadline - time.monotonic())):
+                closed += 1
+            else:
+                session.queue.close()
+                try:
+                    await session.websocket.close(code=MOVED_CLOSE_CODE, reason="Room moved")
+                except Exception:
+                    pass
+        return closed, len(sessions) - closed
+    
+    def is_draining(self, room_id: str) -> bool:
+        return room_id in self.draining
+    
+    def _enqueue(self, session: Session, frame: Payload, droppable: bool = False) -> bool:
+        if session.queue is None:
             return False
+        return session.queue.put(frame, droppable)
+    
+    async def _replace(self, session: Session):
+        # The old socket's receive loop still runs its own disconnect, which then leaves presence alone
+        self.heartbeat.remove(session)
+        self.admission.forget(session)
+        session.queue.close()
+        try:
+            await session.websocket.close(code=REPLACED_CLOSE_CODE, reason="Replaced by a newer connection")
+        except Exception:
+            pass
+    
+    def _drop_connection(self, session: Session):
+        # Called by a writer whose send failed; the receive loop does the full disconnect
+        members = self.rooms.get(session.room_id)
+        if members is not None and members.get(session.user_id) is session:
+            del members[session.user_id]
+            if not members:
+                del self.rooms[session.room_id]
+    
+    def _ping(self, session: Session):
+        self._enqueue(session, session.codec.encode(PING_MESSAGE), droppable=True)
+    
+    def _expire(self, session: Session):
+        # Wake the blocked receive loop so it runs the normal disconnect and user_left path
+        logger.info(f"Connection of user {session.user_id} in room {session.room_id} timed out")
+        session.expired = True
+        if session.task is not None:
+            session.task.cancel()
+    
+    def has_expired(self, websocket: WebSocket) -> bool:
+        session = self.sessions.get(websocket)
+        return session is not None and session.expired
     
     def get_room_connection_count(self, room_id: str) -> int:
-        return len(self.active_connections.get(room_id, []))
+        return len(self.rooms.get(room_id, ()))
+    
+    def get_spectator_count(self, room_id: str) -> int:
+        return self.spectators.count(room_id)
     
-    def is_user_connected(self, user_id: str) -> bool:
-        return user_id in self.user_connections
+    def has_connections(self, room_id: str) -> bool:
+        """Whether anyone, editor or spectator, is connected to the room."""
+        return room_id in self.rooms or self.spectators.count(room_id) > 0
+    
+    def get_queue_depths(self, room_id: str) -> Dict[str, int]:
+        return {
+            user_id: session.queue.depth
+            for user_id, session in self.rooms.get(room_id, {}).items()
+            if session.queue is not None
+        }
+    
+    def is_user_connected(self, room_id: str, user_id: str) -> bool:
+        return user_id in self.rooms.get(room_id, ())
 
 # Global connection manager instance
-connection_manager = ConnectionManager()
\ No newline at end of file
+connection_manager = ConnectionManager()
+
+metrics.gauge("ws_connections", "Open WebSocket connections", lambda: len(connection_manager.sessions))
+metrics.sampled_counter("ws_heartbeat_pings_total", "Pings sent to idle connections",
+                        lambda: connection_manager.heartbeat.pings)
+metrics.sampled_counter("ws_heartbeat_expired_total", "Connections reaped after the heartbeat timeout",
+                        lambda: connection_manager.heartbeat.expired)
+metrics.sampled_counter("broadcast_messages_total", "Messages handed to the broadcast scheduler",
+                        lambda: connection_manager.scheduler.frames_in)
+metrics.sampled_counter("broadcast_coalesced_total", "Cursor and typing updates superseded before they were sent",
+                        lambda: connection_manager.scheduler.coalesced)
+metrics.gauge("ws_spectators", "Open read-only spectator connections",
+              lambda: connection_manager.spectators.get_stats()["spectators"])
+metrics.sampled_counter("spectator_messages_total", "Room messages handed to the spectator stream",
+                        lambda: connection_manager.spectators.messages_in)
+metrics.sampled_counter("spectator_coalesced_total", "Messages merged or superseded before reaching spectators",
+                        lambda: connection_manager.spectators.coalesced)
+metrics.sampled_counter("spectator_frames_total", "Frames queued to spectators, syncs included",
+                        lambda: connection_manager.spectators.frames_queued)
\ No newline at end of file
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Callable, Dict, List, Optional
+from websocket.session import Session
+
+logger = logging.getLogger(__name__)
+
+# Seconds between wheel ticks; pings and timeouts are accurate to about this much
+HEARTBEAT_TICK = 1.0
+
+
+class HeartbeatWheel:
+    """Pings idle connections and reaps dead ones from one timer wheel.
+
+    Each connection sits in the slot of the tick at which it next needs
+    checking, so a tick only looks at the connections due then, however
+    many are open. Receiving a frame just stamps `last_seen` on the session;
+    the wheel doesn't move anything until the connection comes due, and
+    then reschedules it from that stamp. A connection idle for `interval`
+    gets a ping, and one idle for `timeout` is expired if it has answered
+    a ping before. Older clients don't know the JSON ping, so they are only
+    pinged; the server's protocol-level pings, which every WebSocket client
+    answers, close them if they are dead.
+    """
+
+    def __init__(self, interval: float, timeout: float, tick: float,
+                 ping: Callable[[Session], None], expire: Callable[[Session], None]):
+        self.interval = interval
+        self.timeout = timeout
+        self.tick = tick
+        self._ping = ping
+        self._expire = expire
+        # One slot per tick of the longest delay, plus the current one
+        self.slots: List[Dict[Session, None]] = [{} for _ in range(math.ceil(max(interval, timeout) / tick) + 1)]
+        self.cursor = 0
+        self.started_at = time.monotonic()
+        self.ticks = 0
+        self.pings = 0
+        self.expired = 0
+        self.last_tick_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0 and self.timeout > 0
+
+    def start(self):
+        if self._task is None and self.enabled:
+            self.started_at = time.monotonic()
+            self.ticks = 0
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def add(self, session: Session):
+        if not self.enabled:
+            return
+        self._schedule(session, session.last_seen + self.interval)
+
+    def remove(self, session: Session):
+        if session.slot >= 0:
+            del self.slots[session.slot][session]
+            session.slot = -1
+
+    def advance(self, now: float):
+        """Run every tick that has come due by `now`."""
+        started = time.perf_counter()
+        slots, size, tick = self.slots, len(self.slots), self.tick
+        interval, timeout = self.interval, self.timeout
+        due_ticks = int((now - self.started_at) / tick)
+        while self.ticks < due_ticks:
+            self.ticks += 1
+            self.cursor = (self.cursor + 1) % size
+            due = slots[self.cursor]
+            if not due:
+                continue
+            slots[self.cursor] = {}
+            current = self.started_at + self.ticks * tick
+            # Inlined check and reschedule; this loop is the whole per-tick cost
+            for session in due:
+                idle = now - session.last_seen
+                if idle >= timeout and session.answers_pings:
+                    session.slot = -1
+                    self.expired += 1
+                    self._expire(session)
+                    continue
+                if idle >= interval:
+                    self.pings += 1
+                    self._ping(session)
+                    next_due = min(session.last_seen + timeout, now + interval) if session.answers_pings else now + interval
+                else:
+                    next_due = session.last_seen + interval
+                # One tick more than the rounded-down delay, so a connection is never checked early
+                ticks = min(size - 1, max(1, int((next_due - current) / tick) + 1))
+                session.slot = slot = (self.cursor + ticks) % size
+                slots[slot][session] = None
+        self.last_tick_ms = (time.perf_counter() - started) * 1000
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            "connections": sum(len(slot) for slot in self.slots),
+            "interval": self.interval,
+            "timeout": self.timeout,
+            "pings": self.pings,
+            "expired": self.expired,
+            "last_tick_ms": round(self.last_tick_ms, 3)
+        }
+
+    def _schedule(self, session: Session, due: float):
+        # Counted from the current tick and rounded up, so a connection is never checked early
+        current = self.started_at + self.ticks * self.tick
+        ticks = min(len(self.slots) - 1, max(1, math.ceil((due - current) / self.tick)))
+        session.slot = (self.cursor + ticks) % len(self.slots)
+        self.slots[session.slot][session] = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                self.advance(time.monotonic())
+            except Exception as e:
+                logger.error(f"Error running heartbeat tick: {e}")
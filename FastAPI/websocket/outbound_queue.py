@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Deque, Optional, Tuple
+from fastapi import WebSocket
+from services.metrics import metrics
+from websocket.codec import Payload
+
+logger = logging.getLogger(__name__)
+
+# What to do when a connection's queue is full
+POLICY_DROP_STALE = "drop_stale"    # evict queued cursor/typing frames, resync if that's not enough
+POLICY_RESYNC = "resync"            # replace the backlog with one full sync frame
+POLICY_DISCONNECT = "disconnect"    # close the slow consumer
+POLICIES = (POLICY_DROP_STALE, POLICY_RESYNC, POLICY_DISCONNECT)
+
+# Close code for consumers that can't keep up ("try again later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+SEND_FAILURES = metrics.counter("ws_send_failures_total", "Connections dropped because a send to them failed")
+FRAMES_DROPPED = metrics.counter("ws_frames_dropped_total", "Queued frames discarded for slow consumers")
+RESYNCS = metrics.counter("ws_resyncs_total", "Slow consumer backlogs replaced by a full sync")
+SLOW_CONSUMERS_CLOSED = metrics.counter("ws_slow_consumers_closed_total", "Slow consumers disconnected")
+
+
+class OutboundQueue:
+    """Bounded send queue for one connection, drained by its own writer task.
+
+    Broadcasting only enqueues, so a slow or stalled peer fills its own queue
+    instead of delaying everyone else in the room.
+    """
+
+    def __init__(self, websocket: WebSocket, max_size: int, policy: str,
+                 build_sync: Callable[[], Payload], on_failed: Callable[[], None]):
+        self.websocket = websocket
+        self.max_size = max_size
+        self.policy = policy
+        self._build_sync = build_sync
+        self._on_failed = on_failed
+        self._frames: Deque[Tuple[Payload, bool]] = deque()
+        self._ready = asyncio.Event()
+        self._closing = False
+        # (code, reason) to close the socket with once the queue has been sent
+        self._finish: Optional[Tuple[int, str]] = None
+        self.dropped = 0
+        self.resyncs = 0
+        self._writer = asyncio.create_task(self._drain())
+
+    @property
+    def depth(self) -> int:
+        return len(self._frames)
+
+    def put(self, frame: Payload, droppable: bool = False) -> bool:
+        """Queue a frame. `droppable` marks presence-only frames that may be discarded."""
+        if self._closing:
+            return False
+
+        if len(self._frames) >= self.max_size and not self._make_room(droppable):
+            return False
+
+        self._frames.append((frame, droppable))
+        self._ready.set()
+        return True
+
+    def finish(self, frame: Payload, code: int, reason: str) -> bool:
+        """Queue a last frame and close the socket once it and everything before it are sent."""
+        if self._closing:
+            return False
+        # Past the size limit if need be; nothing is queued after it
+        self._frames.append((frame, False))
+        self._closing = True
+        self._finish = (code, reason)
+        self._ready.set()
+        return True
+
+    async def wait_finished(self, timeout: float) -> bool:
+        """Wait for the writer to stop. Returns False if it was still sending after `timeout`."""
+        done, _ = await asyncio.wait({self._writer}, timeout=timeout)
+        return bool(done)
+
+    def close(self):
+        self._closing = True
+        self._frames.clear()
+        self._writer.cancel()
+
+    def _make_room(self, droppable: bool) -> bool:
+        if self.policy == POLICY_DISCONNECT:
+            logger.warning(f"Disconnecting slow consumer with {len(self._frames)} queued frames")
+            SLOW_CONSUMERS_CLOSED.inc()
+            self.close()
+            # The writer may be stuck in a send, so close from a separate task
+            self._writer = asyncio.create_task(self._close_socket())
+            return False
+
+        if self.policy == POLICY_DROP_STALE:
+            kept = deque(entry for entry in self._frames if not entry[1])
+            self.dropped += len(self._frames) - len(kept)
+            FRAMES_DROPPED.inc(amount=len(self._frames) - len(kept))
+            self._frames = kept
+            if len(self._frames) < self.max_size:
+                return True
+            if droppable:
+                self.dropped += 1
+                FRAMES_DROPPED.inc()
+                return False
+
+        # The backlog and the new frame are all covered by the current document state
+        self.dropped += len(self._frames) + 1
+        self.resyncs += 1
+        FRAMES_DROPPED.inc(amount=len(self._frames) + 1)
+        RESYNCS.inc()
+        self._frames.clear()
+        self._frames.append((self._build_sync(), False))
+        self._ready.set()
+        return False
+
+    async def _drain(self):
+        try:
+            while True:
+                await self._ready.wait()
+                if not self._frames:
+                    if self._finish is not None:
+                        code, reason = self._finish
+                        await self.websocket.close(code=code, reason=reason)
+                        return
+                    self._ready.clear()
+                    continue
+                frame, _ = self._frames.popleft()
+                if isinstance(frame, bytes):
+                    await self.websocket.send_bytes(frame)
+                else:
+                    await self.websocket.send_text(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Failed to send message to connection: {e}")
+            SEND_FAILURES.inc()
+            self._closing = True
+            self._frames.clear()
+            self._on_failed()
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE, reason="Slow consumer")
+        except Exception as e:
+            logger.debug(f"Error closing slow consumer: {e}")
@@ -0,0 +1,41 @@
+import asyncio
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+from fastapi import WebSocket
+from websocket.codec import Codec
+from websocket.outbound_queue import OutboundQueue
+
+if TYPE_CHECKING:
+    from websocket.admission import TokenBucket
+
+
+class Session:
+    """One user's connection to one room."""
+
+    __slots__ = (
+        "websocket", "room_id", "user_id", "codec", "queue", "joined_at", "last_seen", "slot", "task", "expired",
+        "answers_pings", "buckets", "byte_bucket", "deferred", "release_task"
+    )
+
+    def __init__(self, websocket: WebSocket, room_id: str, user_id: str, codec: Codec):
+        self.websocket = websocket
+        self.room_id = room_id
+        self.user_id = user_id
+        self.codec = codec
+        self.queue: Optional[OutboundQueue] = None
+        # Broadcast sequence the user's sync already covers
+        self.joined_at = 0
+        # Heartbeat state: when a frame last arrived, and the timer wheel slot it waits in
+        self.last_seen = time.monotonic()
+        self.slot = -1
+        # The task running the connection's receive loop, cancelled if the connection expires
+        self.task: Optional[asyncio.Task] = None
+        self.expired = False
+        # Set by the first pong; clients that never sent one are left to protocol-level pings
+        self.answers_pings = False
+        # Admission control: rate limit buckets, created on first use, and
+        # coalesced messages waiting for a token, by type
+        self.buckets: Optional[Dict[str, "TokenBucket"]] = None
+        self.byte_bucket: Optional["TokenBucket"] = None
+        self.deferred: Optional[Dict[str, dict]] = None
+        self.release_task: Optional[asyncio.Task] = None
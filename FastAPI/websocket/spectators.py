@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+from fastapi import WebSocket
+from services.metrics import metrics
+from websocket.broadcast_scheduler import COALESCED_TYPES
+from websocket.codec import Payload
+from websocket.session import Session
+from websocket.sync_cache import sync_cache
+
+logger = logging.getLogger(__name__)
+
+# Value of the ?role= query parameter that joins a room read-only
+SPECTATOR_ROLE = "spectator"
+
+# Viewers queued to before a flush yields to the event loop
+SPECTATOR_CHUNK = 256
+
+FLUSH_SECONDS = metrics.histogram(
+    "spectator_flush_seconds", "Time to encode and queue one spectator frame for every viewer of a room"
+)
+
+
+class _Audience:
+    __slots__ = ("viewers", "joining", "pending", "latest", "flush_task")
+
+    def __init__(self):
+        self.viewers: Dict[WebSocket, Session] = {}
+        # Joined while messages were pending; they get a sync at the next flush instead
+        self.joining: Dict[WebSocket, Session] = {}
+        self.pending: List[Optional[dict]] = []
+        # (type, user) -> index in `pending` of the latest cursor or typing update
+        self.latest: Dict[Tuple[str, str], int] = {}
+        self.flush_task: Optional[asyncio.Task] = None
+
+
+class SpectatorStream:
+    """Read-only viewers of a room, fed one shared frame per interval.
+
+    Room broadcasts are appended to the audience's pending list as they
+    happen, which costs the same however many viewers are watching. At most
+    once per `interval` the pending messages are encoded once per codec and
+    that same frame is queued for every viewer. Cursor and typing updates
+    keep only the latest per user, and consecutive deltas from one user are
+    merged. Viewers joining while messages are pending get the room's sync
+    at the next flush, so everyone who joins at a revision shares its
+    cached encoding.
+    """
+
+    def __init__(self, interval: float, chunk: int = SPECTATOR_CHUNK):
+        self.interval = interval
+        self.chunk = chunk
+        self.audiences: Dict[str, _Audience] = {}
+        self.messages_in = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.frames_encoded = 0
+        self.frames_queued = 0
+
+    def add(self, session: Session):
+        audience = self.audiences.get(session.room_id)
+        if audience is None:
+            audience = self.audiences[session.room_id] = _Audience()
+        if audience.pending:
+            # The sync has to come after the pending frame, which this viewer mustn't get
+            audience.joining[session.websocket] = session
+            return
+        if self._queue(session, sync_cache.encode(session.room_id, session.codec)):
+            audience.viewers[session.websocket] = session
+
+    def remove(self, session: Session):
+        audience = self.audiences.get(session.room_id)
+        if audience is None:
+            return
+        audience.viewers.pop(session.websocket, None)
+        audience.joining.pop(session.websocket, None)
+        if not audience.viewers and not audience.joining:
+            if audience.flush_task is not None and audience.flush_task is not asyncio.current_task():
+                audience.flush_task.cancel()
+            del self.audiences[session.room_id]
+
+    def count(self, room_id: str) -> int:
+        audience = self.audiences.get(room_id)
+        return len(audience.viewers) + len(audience.joining) if audience is not None else 0
+
+    def publish(self, room_id: str, message: dict):
+        audience = self.audiences.get(room_id)
+        if audience is None:
+            return
+        self.messages_in += 1
+        if not self._coalesce(audience, message):
+            audience.pending.append(message)
+        if audience.flush_task is None:
+            audience.flush_task = asyncio.create_task(self._flush_later(room_id, audience))
+
+    async def flush(self, room_id: str):
+        audience = self.audiences.get(room_id)
+        if audience is None:
+            return
+        started = time.perf_counter()
+        pending = [message for message in audience.pending if message is not None]
+        viewers = list(audience.viewers.values())
+        audience.pending, audience.latest = [], {}
+
+        # Joiners' syncs cover everything pending, so they start receiving with the next frame
+        joining, audience.joining = audience.joining, {}
+        for websocket, session in joining.items():
+            if self._queue(session, sync_cache.encode(room_id, session.codec)):
+                audience.viewers[websocket] = session
+
+        if pending:
+            message = pending[0] if len(pending) == 1 else {"type": "batch", "messages": pending}
+            droppable = all(entry.get("type") in COALESCED_TYPES for entry in pending)
+            frames: Dict[str, Payload] = {}
+            for index, session in enumerate(viewers):
+                codec = session.codec
+                frame = frames.get(codec.name)
+                if frame is None:
+                    frame = frames[codec.name] = codec.encode(message)
+                self._queue(session, frame, droppable)
+                if index % self.chunk == self.chunk - 1:
+                    # Let other rooms and inbound edits run between chunks of a large audience
+                    await asyncio.sleep(0)
+            self.frames_encoded += len(frames)
+        self.flushes += 1
+        FLUSH_SECONDS.observe(time.perf_counter() - started)
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            "rooms": len(self.audiences),
+            "spectators": sum(len(audience.viewers) + len(audience.joining) for audience in self.audiences.values()),
+            "interval_ms": round(self.interval * 1000, 3),
+            "messages_in": self.messages_in,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "frames_encoded": self.frames_encoded,
+            "frames_queued": self.frames_queued
+        }
+
+    def _queue(self, session: Session, frame: Payload, droppable: bool = False) -> bool:
+        if session.queue is None or not session.queue.put(frame, droppable):
+            return False
+        self.frames_queued += 1
+        return True
+
+    async def _flush_later(self, room_id: str, audience: _Audience):
+        await asyncio.sleep(self.interval)
+        try:
+            if self.audiences.get(room_id) is audience:
+                await self.flush(room_id)
+        except Exception as e:
+            logger.error(f"Error flushing spectator frame for room {room_id}: {e}")
+        finally:
+            audience.flush_task = None
+        # Messages published while the flush was yielding go out one interval later
+        if audience.pending and self.audiences.get(room_id) is audience:
+            audience.flush_task = asyncio.create_task(self._flush_later(room_id, audience))
+
+    def _coalesce(self, audience: _Audience, message: dict) -> bool:
+        message_type = message.get("type")
+        sender = message.get("user_id")
+
+        if message_type in COALESCED_TYPES:
+            key = (message_type, sender)
+            previous = audience.latest.get(key)
+            if previous is not None:
+                audience.pending[previous] = None
+                self.coalesced += 1
+            audience.latest[key] = len(audience.pending)
+            return False
+
+        if message_type != "code_delta":
+            return False
+
+        # Merge into the sender's last delta if only presence updates came after it
+        for index in range(len(audience.pending) - 1, -1, -1):
+            entry = audience.pending[index]
+            if entry is None or entry.get("type") in COALESCED_TYPES:
+                continue
+            if entry.get("type") != "code_delta" or entry.get("user_id") != sender:
+                return False
+            audience.pending[index] = {**entry, "ops": entry["ops"] + message["ops"], "revision": message["revision"]}
+            self.coalesced += 1
+            return True
+        return False
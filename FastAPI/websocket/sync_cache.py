@@ -0,0 +1,104 @@
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import settings
+from services.metrics import metrics
+from services.room_service import room_service
+from websocket.codec import Codec, DeflateCodec, Payload, deflate_codec, json_codec
+
+
+class SyncEntry:
+    """The encoded sync message of one room at one revision, minus the users list."""
+
+    __slots__ = ("revision", "epoch", "prefix", "compressed", "compressor")
+
+    def __init__(self, revision: int, epoch: str, prefix: str):
+        self.revision = revision
+        self.epoch = epoch
+        # The JSON object up to the users list, left open
+        self.prefix = prefix
+        # Deflate stream of the prefix, flushed to a byte boundary, and the compressor
+        # state after it; built on the first compressed sync
+        self.compressed: Optional[bytes] = None
+        self.compressor = None
+
+
+class SyncCache:
+    """Encoded sync payloads, built once per room revision.
+
+    Everyone who joins or resyncs a room before its next edit gets the same
+    document, so encoding it, and compressing it for deflate clients, is
+    done once and shared. Only the users list differs between connections:
+    it is appended to the cached JSON prefix, or fed to a copy of the
+    compressor state left after the prefix, which costs a state copy rather
+    than another pass over the document. MessagePack clients are encoded
+    per call.
+    """
+
+    def __init__(self, max_rooms: int):
+        self.max_rooms = max_rooms
+        self.entries: "OrderedDict[str, SyncEntry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.build_seconds = 0.0
+
+    def encode(self, room_id: str, codec: Codec) -> Payload:
+        """The sync message for `room_id` as a frame for `codec`."""
+        if self.max_rooms <= 0 or codec is not json_codec and not isinstance(codec, DeflateCodec):
+            return codec.encode(room_service.build_sync_message(room_id))
+
+        entry = self._entry(room_id)
+        suffix = f',"users":{json_codec.encode(room_service.get_room_users(room_id))}}}'
+        if not isinstance(codec, DeflateCodec) or len(entry.prefix) + len(suffix) < codec.min_bytes:
+            return entry.prefix + suffix
+
+        started = time.perf_counter()
+        if entry.compressor is None:
+            entry.compressor = zlib.compressobj(codec.level)
+            entry.compressed = entry.compressor.compress(entry.prefix.encode()) + entry.compressor.flush(zlib.Z_SYNC_FLUSH)
+        compressor = entry.compressor.copy()
+        frame = entry.compressed + compressor.compress(suffix.encode()) + compressor.flush()
+        codec.record(len(entry.prefix) + len(suffix), len(frame), time.perf_counter() - started)
+        return frame
+
+    def forget_room(self, room_id: str):
+        self.entries.pop(room_id, None)
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "build_ms": round(self.build_seconds * 1000, 3)
+        }
+
+    def _entry(self, room_id: str) -> SyncEntry:
+        revision = room_service.get_room_revision(room_id)
+        epoch = room_service.get_room_epoch(room_id)
+        entry = self.entries.get(room_id)
+        if entry is not None and entry.revision == revision and entry.epoch == epoch:
+            self.hits += 1
+            self.entries.move_to_end(room_id)
+            return entry
+
+        self.misses += 1
+        started = time.perf_counter()
+        # Same keys as RoomService.build_sync_message, with the users list last
+        prefix = (
+            f'{{"type":"sync","revision":{revision},"epoch":{json_codec.encode(epoch)},'
+            f'"code":{json_codec.encode(room_service.get_room_code(room_id))}'
+        )
+        entry = self.entries[room_id] = SyncEntry(revision, epoch, prefix)
+        self.entries.move_to_end(room_id)
+        while len(self.entries) > self.max_rooms:
+            self.entries.popitem(last=False)
+        self.build_seconds += time.perf_counter() - started
+        return entry
+
+# Global sync cache instance
+sync_cache = SyncCache(settings.SYNC_CACHE_ROOMS)
+
+metrics.gauge("sync_cache_entries", "Rooms with an encoded sync message cached", lambda: len(sync_cache.entries))
+metrics.sampled_counter("sync_cache_hits_total", "Syncs served from an already encoded document", lambda: sync_cache.hits)
+metrics.sampled_counter("sync_cache_misses_total", "Syncs that had to encode the document", lambda: sync_cache.misses)
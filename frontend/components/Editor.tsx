@@ -71,12 +71,13 @@ const [code, setCode] = useState<string>('');
   });
 
   const insertSuggestion = useCallback(
-    (suggestion: string) => {
+    (suggestion: string, prefix: string) => {
       const textarea = textareaRef.current;
       if (!textarea) return;
 
       const pos = textarea.selectionStart;
-      const updated = code.slice(0, pos) + suggestion + code.slice(pos);
+      const start = code.slice(0, pos).endsWith(prefix) ? pos - prefix.length : pos;
+      const updated = code.slice(0, start) + suggestion + code.slice(pos);
 
       setCode(updated);
 
@@ -85,8 +86,8 @@ const [code, setCode] = useState<string>('');
       requestAnimationFrame(() => {
         textarea.focus();
         textarea.setSelectionRange(
-          pos + suggestion.length,
-          pos + suggestion.length
+          start + suggestion.length,
+          start + suggestion.length
         );
       });
     },
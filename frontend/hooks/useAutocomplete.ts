@@ -3,7 +3,7 @@ import { AutocompleteState, AutocompleteRequest } from '../types';
 import { API_ENDPOINTS } from '../config/api';
 
 interface UseAutocompleteProps {
-  onSuggestionSelect: (suggestion: string) => void;
+  onSuggestionSelect: (suggestion: string, prefix: string) => void;
   language?: string;
 }
 
@@ -19,7 +19,8 @@ export const useAutocomplete = ({ onSuggestionSelect, language = "python" }: Use
     show: false,
     suggestions: [],
     position: { x: 0, y: 0 },
-    selectedIndex: 0
+    selectedIndex: 0,
+    prefix: ''
   });
 
   const timeoutRef = useRef<NodeJS.Timeout | null>(null);
@@ -87,7 +88,9 @@ export const useAutocomplete = ({ onSuggestionSelect, language = "python" }: Use
               x: Math.max(0, rect.left + (currentColumn * charWidth) - scrollLeft),
               y: Math.max(0, rect.top + (currentLine * lineHeight) + lineHeight - scrollTop)
             },
-            selectedIndex: 0
+            selectedIndex: 0,
+            // Typed text the suggestion replaces when it completes a word
+            prefix: data.prefix || ''
           });
         }
       } catch (error) {
@@ -119,7 +122,7 @@ export const useAutocomplete = ({ onSuggestionSelect, language = "python" }: Use
       case 'Tab':
       case 'Enter':
         e.preventDefault();
-        onSuggestionSelect(autocomplete.suggestions[autocomplete.selectedIndex]);
+        onSuggestionSelect(autocomplete.suggestions[autocomplete.selectedIndex], autocomplete.prefix);
         hideAutocomplete();
         return true;
       
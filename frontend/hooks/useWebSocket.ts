@@ -41,7 +41,17 @@ export const useWebSocket = ({ roomId, userId, onMessage }: UseWebSocketProps):
       ws.onmessage = (event: MessageEvent) => {
         try {
           const message: WebSocketMessage = JSON.parse(event.data);
-          onMessage(message);
+          // Answer heartbeats so the server doesn't reap an idle but open tab
+          if (message.type === 'ping') {
+            ws.send(JSON.stringify({ type: 'pong' }));
+            return;
+          }
+          // The server coalesces messages queued within one tick into a batch frame
+          if (message.type === 'batch') {
+            message.messages?.forEach(onMessage);
+          } else {
+            onMessage(message);
+          }
         } catch (error) {
           console.error('Error parsing WebSocket message:', error);
         }
@@ -51,9 +61,10 @@ export const useWebSocket = ({ roomId, userId, onMessage }: UseWebSocketProps):
         setIsConnected(false);
         console.log('WebSocket disconnected:', event.code, event.reason);
         
-        // Attempt to reconnect if not a manual close
-        if (event.code !== 1000 && reconnectAttempts.current < maxReconnectAttempts) {
-          const delay = Math.min(1000 * Math.pow(2, reconnectAttempts.current), 10000);
+        // Attempt to reconnect if not a manual close, or replaced by this user's newer connection
+        if (event.code !== 1000 && event.code !== 4000 && reconnectAttempts.current < maxReconnectAttempts) {
+          // A room moved to another server worker is ready again right away
+          const delay = event.code === 4001 ? 0 : Math.min(1000 * Math.pow(2, reconnectAttempts.current), 10000);
           reconnectTimeoutRef.current = setTimeout(() => {
             reconnectAttempts.current++;
             console.log(`Reconnecting... Attempt ${reconnectAttempts.current}`);
@@ -3,16 +3,30 @@ export interface AutocompleteState {
   suggestions: string[];
   position: { x: number; y: number };
   selectedIndex: number;
+  prefix: string;
 }
 
 export interface WebSocketMessage {
-  type: 'sync' | 'code_change' | 'cursor_position' | 'user_joined' | 'user_left';
+  type:
+    | 'sync' | 'code_change' | 'code_delta' | 'code_delta_ack' | 'cursor_position' | 'user_typing'
+    | 'user_joined' | 'user_left' | 'batch' | 'autocomplete_request' | 'autocomplete_response'
+    | 'ping' | 'pong' | 'room_moved';
   code?: string;
   users?: string[];
   user_id?: string;
   position?: number;
+  revision?: number;
+  ops?: TextOp[];
+  messages?: WebSocketMessage[];
+  request_id?: number | string;
+  language?: string;
+  suggestions?: string[];
 }
 
+export type TextOp =
+  | { op: 'insert'; pos: number; text: string }
+  | { op: 'delete'; pos: number; length: number };
+
 export interface Room {
   code: string;
   users: string[];
@@ -26,4 +40,5 @@ export interface AutocompleteRequest {
 
 export interface AutocompleteResponse {
   suggestions: string[];
+  prefix?: string;
 }
\ No newline at end of file